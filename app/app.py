@@ -1,24 +1,38 @@
 import os
+import sys
 import warnings
 
 import dash
 import dash_bootstrap_components as dbc
+import diskcache
 from components.footer import create_footer
 from components.navbar import create_navbar
-from dash import Dash, html
+from config import JOB_CACHE_DIR, SRC_DIR
+from dash import Dash, DiskcacheManager, html
+from uploads import register_upload_route
+
+# 議事録のページから src/modules を読み込めるようにする
+sys.path.insert(0, SRC_DIR)
 
 warnings.filterwarnings("ignore")
 
+# 文字起こしと議事録の作成はバックグラウンドのプロセスで実行し、リクエストを処理するワーカーを止めない
+background_callback_manager = DiskcacheManager(diskcache.Cache(JOB_CACHE_DIR))
+
 # Initialize the app
 app = Dash(
     __name__,
     assets_folder=os.path.join(os.path.dirname(__file__), "assets"),
     external_stylesheets=[dbc.themes.BOOTSTRAP],
     use_pages=True,  # Enable pages
+    background_callback_manager=background_callback_manager,
 )
 
 app.title = "Template"
 
+# 議事録のページの録音は、コールバックを通さずにディスクへ書き込む
+register_upload_route(app.server)
+
 # Create the app layout
 app.layout = html.Div(
     [
@@ -0,0 +1,41 @@
+// 録音を base64 にせずそのまま送り、保存先のIDだけを議事録の作成(バックグラウンドのコールバック)に渡す
+window.dash_clientside = Object.assign({}, window.dash_clientside, {
+    minutes: {
+        upload: function (nClicks) {
+            const clientside = window.dash_clientside;
+            const input = document.getElementById("minutes-file");
+            const file = input && input.files[0];
+            if (!nClicks || !file) {
+                return clientside.no_update;
+            }
+            const maxBytes = Number(input.dataset.maxBytes);
+            if (maxBytes && file.size > maxBytes) {
+                return `録音ファイルは${Math.floor(maxBytes / 1024 / 1024)}MBまでです。`;
+            }
+            const request = new XMLHttpRequest();
+            request.open("POST", `${input.dataset.uploadUrl}?filename=${encodeURIComponent(file.name)}`);
+            request.upload.onprogress = function (event) {
+                if (event.lengthComputable) {
+                    clientside.set_props("minutes-upload-status", {
+                        children: `アップロードしています… ${Math.floor(event.loaded / event.total * 100)}%`,
+                    });
+                }
+            };
+            request.onload = function () {
+                if (request.status === 200) {
+                    clientside.set_props("minutes-upload-status", {children: ""});
+                    clientside.set_props("minutes-upload", {data: JSON.parse(request.responseText)});
+                } else {
+                    clientside.set_props("minutes-upload-status", {
+                        children: `アップロードできませんでした(${request.status})`,
+                    });
+                }
+            };
+            request.onerror = function () {
+                clientside.set_props("minutes-upload-status", {children: "アップロードできませんでした"});
+            };
+            request.send(file);
+            return "アップロードしています…";
+        },
+    },
+});
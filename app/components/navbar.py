@@ -12,6 +12,8 @@ def create_navbar():
     navbar = dbc.NavbarSimple(
         children=[
             dbc.NavItem(dbc.NavLink("Home", href="/")),
+            dbc.NavItem(dbc.NavLink("Minutes", href="/minutes")),
+            dbc.NavItem(dbc.NavLink("Transcript", href="/transcript")),
             dbc.NavItem(dbc.NavLink("Template", href="/template")),
         ],
         brand="Template",
@@ -0,0 +1,13 @@
+import os
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# 議事録を作成するモジュール(src/modules)の場所
+SRC_DIR = os.path.join(ROOT_DIR, "src")
+# 議事録の作成に使う設定ファイル
+MINUTES_CONFIG_PATH = os.environ.get("MINUTES_CONFIG_PATH", os.path.join(SRC_DIR, "config.yaml"))
+# アップロードされた録音の保存先
+UPLOAD_DIR = os.environ.get("MINUTES_UPLOAD_DIR", os.path.join(ROOT_DIR, "outputs", "uploads"))
+# バックグラウンドのコールバック(ジョブ)の状態と結果を保存するdiskcacheの場所
+JOB_CACHE_DIR = os.environ.get("MINUTES_JOB_CACHE_DIR", os.path.join(ROOT_DIR, "outputs", "cache", "dash_jobs"))
+# アップロードできる録音の大きさの上限(MB)
+MAX_UPLOAD_MB = int(os.environ.get("MINUTES_MAX_UPLOAD_MB", "1024"))
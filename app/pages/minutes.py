@@ -0,0 +1,219 @@
+import functools
+import os
+
+import dash
+import dash_bootstrap_components as dbc
+from config import MINUTES_CONFIG_PATH
+from dash import ClientsideFunction, Input, Output, State, callback, clientside_callback, dcc, html, no_update
+from uploads import MAX_UPLOAD_BYTES, UPLOAD_ROUTE, resolve_upload
+
+dash.register_page(__name__, path="/minutes", name="Minutes")
+
+# 進捗バーを表示する処理段階と見出し
+STAGES = {"transcription": "文字起こし", "summary": "要約"}
+
+
+def progress_bar(stage):
+    """Create a progress bar for a pipeline stage.
+
+    Returns
+    -------
+        html.Div: Label and progress bar
+
+    """
+    return html.Div(
+        [
+            html.Small(STAGES[stage], className="text-muted"),
+            dbc.Progress(id=f"minutes-{stage}-progress", value=0, max=1, striped=True, className="mb-2"),
+        ]
+    )
+
+
+layout = html.Div(
+    [
+        html.H1("議事録の作成"),
+        html.P("ゼミナールの録音をアップロードすると、文字起こしと議事録の作成をバックグラウンドで行います。"),
+        # 録音は assets/minutes_upload.js が UPLOAD_ROUTE に送り、minutes-upload にIDを入れる
+        dbc.InputGroup(
+            [
+                html.Input(
+                    id="minutes-file",
+                    type="file",
+                    accept="audio/*,video/mp4,video/webm",
+                    className="form-control",
+                    **{"data-max-bytes": MAX_UPLOAD_BYTES, "data-upload-url": UPLOAD_ROUTE},
+                ),
+                dbc.Button("アップロード", id="minutes-upload-button", color="primary"),
+            ],
+            className="mb-2",
+        ),
+        html.Div(id="minutes-upload-status", className="text-muted mb-3"),
+        dcc.Store(id="minutes-upload"),
+        progress_bar("transcription"),
+        progress_bar("summary"),
+        dbc.Button("中止", id="minutes-cancel", color="secondary", disabled=True, className="me-2"),
+        dbc.Button("議事録をダウンロード", id="minutes-download-button", color="primary", disabled=True),
+        dcc.Download(id="minutes-download"),
+        # 議事録のパスはブラウザに渡さず、アップロードのIDからサーバーで組み立てる
+        dcc.Store(id="minutes-upload-id"),
+        html.Hr(),
+        html.Div(id="minutes-result"),
+    ],
+    className="content-container",
+)
+
+
+@functools.cache
+def output_path():
+    """Return OUTPUT_PATH of the minutes config.
+
+    Returns
+    -------
+        str: Directory the pipeline writes its outputs to
+
+    """
+    from modules.runtime import Runtime
+
+    return Runtime(config_path=MINUTES_CONFIG_PATH).config["OUTPUT_PATH"]
+
+
+def upload_output_dir(upload_id):
+    """Return the directory holding the transcript and minutes of an upload.
+
+    The id comes from the browser, so it is checked with resolve_upload and the
+    resulting directory must be directly under OUTPUT_PATH/uploads.
+
+    Returns
+    -------
+        str: Output directory of the upload
+
+    """
+    _, digest = resolve_upload(upload_id)
+    root = os.path.realpath(os.path.join(output_path(), "uploads"))
+    directory = os.path.realpath(os.path.join(root, digest))
+    if os.path.dirname(directory) != root:
+        raise ValueError(f"Invalid upload id: {upload_id}")
+    return directory
+
+
+def progress_values(progress):
+    """Convert the latest ProgressEvent of each stage to progress bar properties.
+
+    Returns
+    -------
+        list: value, max and label of each progress bar
+
+    """
+    values = []
+    for stage in STAGES:
+        event = progress.get(stage)
+        if event is None:
+            values += [0, 1, ""]
+            continue
+        # 全体の件数が分かるまでは、完了した件数だけを表示する
+        total = event.total if event.total is not None else event.done + 1
+        eta = f" (残り約{event.eta_seconds:.0f}秒)" if event.eta_seconds is not None else ""
+        values += [event.done, max(total, 1), f"{event.done}/{event.total or '?'}{eta}"]
+    return values
+
+
+clientside_callback(
+    ClientsideFunction(namespace="minutes", function_name="upload"),
+    Output("minutes-upload-status", "children"),
+    Input("minutes-upload-button", "n_clicks"),
+    prevent_initial_call=True,
+)
+
+
+@callback(
+    Output("minutes-result", "children"),
+    Output("minutes-upload-id", "data"),
+    Input("minutes-upload", "data"),
+    background=True,
+    running=[
+        (Output("minutes-upload-button", "disabled"), True, False),
+        (Output("minutes-cancel", "disabled"), False, True),
+        (Output("minutes-download-button", "disabled"), True, False),
+    ],
+    cancel=[Input("minutes-cancel", "n_clicks")],
+    progress=[
+        output
+        for stage in STAGES
+        for output in (
+            Output(f"minutes-{stage}-progress", "value"),
+            Output(f"minutes-{stage}-progress", "max"),
+            Output(f"minutes-{stage}-progress", "label"),
+        )
+    ],
+    prevent_initial_call=True,
+)
+def create_minutes(set_progress, upload):
+    """Transcribe an uploaded recording and create its minutes in a background job.
+
+    Each job runs in its own process, so several users can submit recordings at
+    the same time. Progress is sent per transcribed chunk and summarized section.
+    The recording is already on disk; the job only receives its upload id.
+
+    Returns
+    -------
+        tuple: Minutes to show and the upload id to download them by
+
+    """
+    if upload is None:
+        return no_update, no_update
+    from modules.pipeline import MinutesPipeline
+    from modules.runtime import Runtime
+
+    upload_id = upload["upload_id"]
+    try:
+        voice_path, _ = resolve_upload(upload_id)
+        output_dir = upload_output_dir(upload_id)
+    except (ValueError, FileNotFoundError) as e:
+        return dbc.Alert(f"アップロードした録音が見つかりません: {e}", color="danger"), None
+    filename = upload["filename"]
+    runtime = Runtime(config_path=MINUTES_CONFIG_PATH)
+    os.makedirs(output_dir, exist_ok=True)
+
+    progress = {}
+
+    def on_progress(event):
+        progress[event.stage] = event
+        set_progress(progress_values(progress))
+
+    set_progress(progress_values(progress))
+    try:
+        pipeline = MinutesPipeline(runtime.speech_to_text, runtime.summary)
+        _, minutes = runtime.run(
+            pipeline.run(voice_path, os.path.join(output_dir, "transcript.txt"), on_progress=on_progress)
+        )
+    except Exception as e:
+        return dbc.Alert(f"議事録を作成できませんでした: {e}", color="danger"), None
+    minutes_path = os.path.join(output_dir, "minutes.md")
+    with open(minutes_path, "w", encoding="utf-8") as f:
+        f.write(minutes)
+    return [html.H4(filename), dcc.Markdown(minutes)], upload_id
+
+
+@callback(
+    Output("minutes-download", "data"),
+    Input("minutes-download-button", "n_clicks"),
+    State("minutes-upload-id", "data"),
+    prevent_initial_call=True,
+)
+def download_minutes(n_clicks, upload_id):
+    """Send the saved minutes of an upload as a Markdown file.
+
+    Returns
+    -------
+        dict: File to download
+
+    """
+    if not upload_id:
+        return no_update
+    try:
+        minutes_path = os.path.join(upload_output_dir(upload_id), "minutes.md")
+    except (ValueError, FileNotFoundError):
+        return no_update
+    if not os.path.isfile(minutes_path):
+        return no_update
+    return dcc.send_file(minutes_path)
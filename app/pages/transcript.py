@@ -0,0 +1,257 @@
+import datetime
+import functools
+import math
+import re
+
+import dash
+import dash_bootstrap_components as dbc
+from config import MINUTES_CONFIG_PATH
+from dash import ALL, Input, Output, callback, ctx, dcc, html, no_update
+
+dash.register_page(__name__, path="/transcript", name="Transcript")
+
+# 1ページに表示するセグメントの数
+PAGE_SIZE = 50
+# 時刻の入力(h:mm:ss / m:ss / 秒)
+TIMESTAMP_PATTERN = re.compile(r"^(?:(?:(\d+):)?(\d{1,2}):)?(\d+(?:\.\d+)?)$")
+
+
+@functools.cache
+def get_runtime():
+    """Return the runtime shared by the viewer callbacks.
+
+    Returns
+    -------
+        Runtime: Runtime for the minutes config file
+
+    """
+    from modules.runtime import Runtime
+
+    return Runtime(config_path=MINUTES_CONFIG_PATH)
+
+
+def get_archive():
+    """Return the meeting archive the viewer reads from.
+
+    Segments are read from the archive by meeting id, so past meetings stay
+    viewable after the transcription config changes or the recording moves.
+
+    Returns
+    -------
+        MeetingArchive: Archive of past meetings
+
+    """
+    return get_runtime().speech_to_text.archive
+
+
+@functools.lru_cache(maxsize=64)
+def search_segments(meeting_id, count, query):
+    """Search the segments of a meeting, caching the result while the meeting is unchanged.
+
+    Returns
+    -------
+        list[int]: Positions of the matching segments
+
+    """
+    return get_archive().search_segments(meeting_id, query)
+
+
+def parse_timestamp(value):
+    """Parse a timestamp such as "1:02:03", "62:03" or "3723" into milliseconds.
+
+    Returns
+    -------
+        int | None: Milliseconds, or None if the value is not a timestamp
+
+    """
+    match = TIMESTAMP_PATTERN.match((value or "").strip())
+    if match is None:
+        return None
+    hours, minutes, seconds = match.groups()
+    return round((int(hours or 0) * 3600 + int(minutes or 0) * 60 + float(seconds)) * 1000)
+
+
+def highlight(text, terms):
+    """Wrap the search terms in a segment text with html.Mark.
+
+    Returns
+    -------
+        list: Text and html.Mark components
+
+    """
+    if not terms:
+        return [text]
+    pattern = re.compile("(" + "|".join(re.escape(term) for term in terms) + ")")
+    return [html.Mark(part) if i % 2 else part for i, part in enumerate(pattern.split(text)) if part]
+
+
+def segment_row(index, start_ms, end_ms, text, terms, focused):
+    """Create one row of the transcript.
+
+    Returns
+    -------
+        html.Div: Timestamp button and segment text
+
+    """
+    from modules.archive import format_ms
+
+    return html.Div(
+        [
+            dbc.Button(
+                format_ms(start_ms),
+                id={"type": "transcript-time", "index": index},
+                color="link",
+                size="sm",
+                className="p-0 me-3 font-monospace",
+                title=f"{format_ms(start_ms)}-{format_ms(end_ms)}(押すとこの位置の前後を表示)",
+            ),
+            html.Span(highlight(text, terms)),
+        ],
+        className="d-flex align-items-baseline py-1" + (" bg-warning-subtle" if focused else ""),
+    )
+
+
+def meeting_options():
+    """List the archived meetings for the dropdown.
+
+    Returns
+    -------
+        list[dict]: Dropdown options
+
+    """
+    options = []
+    for meeting in get_archive().meetings():
+        date = datetime.datetime.fromtimestamp(meeting["recorded_at"]).strftime("%Y-%m-%d")
+        options.append({"label": f"{meeting['title']} ({date})", "value": meeting["id"]})
+    return options
+
+
+def layout():
+    """Create the transcript viewer layout.
+
+    Only the list of meetings is sent on page load; segments are loaded one page at a time.
+
+    Returns
+    -------
+        html.Div: Page layout
+
+    """
+    return html.Div(
+        [
+            html.H1("文字起こし"),
+            dcc.Dropdown(id="transcript-meeting", options=meeting_options(), placeholder="会議を選択"),
+            dbc.Row(
+                [
+                    dbc.Col(
+                        dbc.Input(id="transcript-search", placeholder="検索(空白で区切るとすべての語を含む箇所)",
+                                  type="search", debounce=True),
+                        md=8,
+                    ),
+                    dbc.Col(
+                        dbc.Input(id="transcript-jump", placeholder="時刻へ移動(例 1:02:03)", debounce=True),
+                        md=4,
+                    ),
+                ],
+                className="my-3",
+            ),
+            html.Div(id="transcript-status", className="text-muted mb-2"),
+            dcc.Store(id="transcript-focus"),
+            html.Div(id="transcript-rows"),
+            dbc.Pagination(id="transcript-page", max_value=1, active_page=1, fully_expanded=False,
+                           first_last=True, previous_next=True, className="mt-3"),
+        ],
+        className="content-container",
+    )
+
+
+@callback(
+    Output("transcript-focus", "data"),
+    Input({"type": "transcript-time", "index": ALL}, "n_clicks"),
+    prevent_initial_call=True,
+)
+def focus_segment(time_clicks):
+    """Remember the segment whose time was clicked.
+
+    This is a separate callback so that rendering new rows, which adds new
+    time buttons, does not load the page again.
+
+    Returns
+    -------
+        dict: Index of the clicked segment
+
+    """
+    if not isinstance(ctx.triggered_id, dict) or not ctx.triggered[0]["value"]:
+        return no_update
+    return {"index": ctx.triggered_id["index"], "clicks": ctx.triggered[0]["value"]}
+
+
+@callback(
+    Output("transcript-rows", "children"),
+    Output("transcript-status", "children"),
+    Output("transcript-page", "max_value"),
+    Output("transcript-page", "active_page"),
+    Output("transcript-search", "value"),
+    Input("transcript-meeting", "value"),
+    Input("transcript-search", "value"),
+    Input("transcript-jump", "value"),
+    Input("transcript-page", "active_page"),
+    Input("transcript-focus", "data"),
+    prevent_initial_call=True,
+)
+def show_segments(meeting_id, query, jump, active_page, focus_data):
+    """Load the visible page of segments.
+
+    Searching filters the segments on the server and pages through the matches.
+    Jumping to a timestamp, or clicking the time of a match, shows the page of
+    the whole transcript that contains it.
+
+    Returns
+    -------
+        tuple: Rows, status, page count, active page and search value
+
+    """
+    if not meeting_id:
+        return [], "", 1, 1, no_update
+    archive = get_archive()
+    count = archive.segment_count(meeting_id)
+    if count == 0:
+        return [], "この会議の時刻付きの文字起こしはありません。", 1, 1, no_update
+
+    trigger = ctx.triggered_id
+    focus = None
+    if trigger == "transcript-jump":
+        focus_ms = parse_timestamp(jump)
+        if focus_ms is None:
+            return no_update, "時刻は h:mm:ss の形式で入力してください。", no_update, no_update, no_update
+        focus = min(archive.segment_at(meeting_id, focus_ms), count - 1)
+    elif trigger == "transcript-focus" and focus_data:
+        focus = min(focus_data["index"], count - 1)
+
+    if focus is not None:
+        # 時刻を含むページを、検索を解除して表示する
+        query = ""
+        active_page = focus // PAGE_SIZE + 1
+    elif trigger in ("transcript-meeting", "transcript-search") or not active_page:
+        active_page = 1
+
+    terms = (query or "").split()
+    if terms:
+        matches = search_segments(meeting_id, count, query)
+        pages = max(1, math.ceil(len(matches) / PAGE_SIZE))
+        active_page = min(active_page, pages)
+        page = matches[(active_page - 1) * PAGE_SIZE:active_page * PAGE_SIZE]
+        # 一致したセグメントは飛び飛びなので、番号を指定してまとめて取り出す
+        rows = archive.segments_at(meeting_id, page)
+        status = f"「{query}」を含むセグメント: {len(matches)}件(時刻を押すと前後を表示)"
+    else:
+        pages = max(1, math.ceil(count / PAGE_SIZE))
+        active_page = min(active_page, pages)
+        lo = (active_page - 1) * PAGE_SIZE
+        rows = [(lo + i, *row) for i, row in enumerate(archive.segments(meeting_id, lo, min(lo + PAGE_SIZE, count)))]
+        status = f"全{count}セグメント"
+
+    children = [
+        segment_row(index, start_ms, end_ms, text, terms, index == focus)
+        for index, start_ms, end_ms, text in rows
+    ]
+    return children, status, pages, active_page, query if focus is not None else no_update
@@ -0,0 +1,92 @@
+import hashlib
+import os
+import tempfile
+
+from config import MAX_UPLOAD_MB, UPLOAD_DIR
+from flask import abort, jsonify, request
+
+# 録音を受け取るURL
+UPLOAD_ROUTE = "/api/uploads"
+MAX_UPLOAD_BYTES = MAX_UPLOAD_MB * 1024 * 1024
+# リクエストの本文から一度に読む大きさ
+READ_BLOCK_BYTES = 1024 * 1024
+
+
+def save_upload(stream, filename):
+    """Stream an uploaded recording to a directory named by its content hash.
+
+    The body is written to a temporary file while it is hashed, so the whole
+    recording is never held in memory. Uploading the same recording again reuses
+    the saved file, so the previous transcript and minutes are returned without
+    calling the API.
+
+    Returns
+    -------
+        str: Upload id ("<content hash>/<file name>") to pass to resolve_upload
+
+    """
+    name = os.path.basename(filename or "")
+    if not name or name.startswith("."):
+        abort(400, "ファイル名がありません。")
+    os.makedirs(UPLOAD_DIR, exist_ok=True)
+    digest = hashlib.sha256()
+    size = 0
+    # 書き込み中のファイルを他のジョブが読まないよう、一時ファイルに書いてから置き換える
+    fd, tmp_path = tempfile.mkstemp(dir=UPLOAD_DIR, prefix=".")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            while block := stream.read(READ_BLOCK_BYTES):
+                size += len(block)
+                if size > MAX_UPLOAD_BYTES:
+                    abort(413, f"録音ファイルは{MAX_UPLOAD_MB}MBまでです。")
+                digest.update(block)
+                f.write(block)
+        if size == 0:
+            abort(400, "録音ファイルが空です。")
+        upload_id = f"{digest.hexdigest()[:16]}/{name}"
+        path = os.path.join(UPLOAD_DIR, upload_id)
+        if os.path.exists(path):
+            os.remove(tmp_path)
+        else:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    return upload_id
+
+
+def resolve_upload(upload_id):
+    """Return the path of a saved upload, refusing ids outside UPLOAD_DIR.
+
+    Returns
+    -------
+        tuple[str, str]: Path of the saved recording and its content hash
+
+    """
+    digest, _, name = upload_id.partition("/")
+    if not digest.isalnum() or name != os.path.basename(name) or name.startswith("."):
+        raise ValueError(f"Invalid upload id: {upload_id}")
+    path = os.path.join(UPLOAD_DIR, digest, name)
+    if not os.path.isfile(path):
+        raise FileNotFoundError(path)
+    return path, digest
+
+
+def register_upload_route(server):
+    """Register the route that receives recordings as a raw request body.
+
+    dcc.Upload reads the whole file into the browser and sends it as base64 through
+    the callback, and background callbacks pickle their arguments into the job
+    cache. The minutes page instead posts the file here and passes only the
+    upload id to the background callback.
+
+    """
+    # Content-Length が上限を超えるリクエストは本文を読む前に断る
+    server.config["MAX_CONTENT_LENGTH"] = MAX_UPLOAD_BYTES
+
+    @server.route(UPLOAD_ROUTE, methods=["POST"])
+    def upload_recording():
+        upload_id = save_upload(request.stream, request.args.get("filename"))
+        return jsonify(upload_id=upload_id, filename=os.path.basename(upload_id))
@@ -0,0 +1,118 @@
+import argparse
+import asyncio
+import logging
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from modules import telemetry
+from modules.audio import AUDIO_EXTENSIONS
+from modules.runtime import get_runtime
+from modules.speech_to_text import SpeechToText, recording_output_dir, write_text
+from modules.summary import SummaryMinutes
+
+logging.basicConfig(
+    filename="log/app.log",
+    level=logging.INFO,
+    format="%(asctime)s [%(levelname)s] %(message)s"
+)
+telemetry.configure("log/spans.jsonl")
+
+
+def load_recordings(source):
+    """
+    処理する録音のパスを返す。
+
+    source がディレクトリなら、その中の音声ファイルを名前順に返す。
+    ファイルならマニフェストとして読み込む。マニフェストは1行に1つのパスを書いたテキスト
+    (#から始まる行は無視)か、パスのリストを書いたYAML。相対パスはマニフェストの場所を基準にする。
+    """
+    if os.path.isdir(source):
+        return [
+            os.path.join(source, name)
+            for name in sorted(os.listdir(source))
+            if os.path.splitext(name)[1].lstrip(".").lower() in AUDIO_EXTENSIONS
+        ]
+
+    with open(source, "r", encoding="utf-8") as f:
+        if source.endswith((".yaml", ".yml")):
+            import yaml
+
+            paths = yaml.safe_load(f) or []
+        else:
+            paths = [line.strip() for line in f if line.strip() and not line.lstrip().startswith("#")]
+    base = os.path.dirname(os.path.abspath(source))
+    return [os.path.join(base, os.path.expanduser(path)) for path in paths]
+
+
+async def process_recording(voice_path, speech_to_text, summary, semaphore, split_executor):
+    """1つの録音の文字起こしと議事録を、録音ごとのディレクトリに書き出す。"""
+    output_dir = recording_output_dir(speech_to_text.output_path, voice_path)
+    os.makedirs(output_dir, exist_ok=True)
+
+    transcription = await speech_to_text.atranscribe_audio_to_text(
+        voice_path,
+        os.path.join(output_dir, "transcript.txt"),
+        semaphore=semaphore,
+        split_executor=split_executor,
+    )
+    # 要約のリクエストも1件ずつ、APIの同時実行数の枠を使う
+    minutes = await summary.asummarize_text(transcription, label=os.path.basename(voice_path), semaphore=semaphore)
+    await asyncio.to_thread(write_text, os.path.join(output_dir, "minutes.md"), minutes)
+    await asyncio.to_thread(speech_to_text.archive.set_minutes, voice_path, minutes)
+    return output_dir
+
+
+async def run_batch(voice_paths, config, workers):
+    """
+    複数の録音をまとめて処理する。
+
+    デコード・エンコードはプロセスプールに分散し、APIリクエストの同時実行数は全録音で共有する。
+    """
+    speech_to_text = SpeechToText(config)
+    summary = SummaryMinutes(config)
+    semaphore = asyncio.Semaphore(speech_to_text.max_concurrency)
+
+    with ProcessPoolExecutor(max_workers=workers) as split_executor:
+        tasks = [
+            process_recording(voice_path, speech_to_text, summary, semaphore, split_executor)
+            for voice_path in voice_paths
+        ]
+        results = await asyncio.gather(*tasks, return_exceptions=True)
+
+    failed = 0
+    for voice_path, result in zip(voice_paths, results):
+        if isinstance(result, BaseException):
+            failed += 1
+            logging.error(f"{voice_path} の処理に失敗しました", exc_info=result)
+            print(f"失敗: {voice_path}: {result}")
+        else:
+            logging.info(f"{voice_path} の処理が完了しました: {result}")
+            print(f"完了: {voice_path} -> {result}")
+    return failed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="録音をまとめて文字起こしし、議事録を作成します。")
+    parser.add_argument("source", help="録音が入ったディレクトリ、またはマニフェストファイル")
+    parser.add_argument("--workers", type=int, default=None, help="デコード・エンコードに使うプロセス数")
+    args = parser.parse_args()
+
+    config = get_runtime().config
+    voice_paths = load_recordings(args.source)
+    workers = args.workers or config.get("BATCH_WORKERS") or os.cpu_count()
+
+    print(f"{len(voice_paths)}件の録音を処理します。")
+    start = time.perf_counter()
+    failed = get_runtime().run(run_batch(voice_paths, config, workers))
+    end = time.perf_counter()
+    print(f'処理にかかった時間: {((end-start)/60):.2f}分 (失敗 {failed}件)')
+    telemetry.record("batch", end - start, recordings=len(voice_paths), failed=failed)
+    if config.get("METRICS_PATH"):
+        telemetry.write_prometheus(config["METRICS_PATH"])
+    if failed:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
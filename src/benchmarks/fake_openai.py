@@ -0,0 +1,241 @@
+"""
+ベンチマーク用のOpenAI APIの代役サーバー。
+
+文字起こし(/v1/audio/transcriptions)と Responses API(/v1/responses)だけを真似る。
+レイテンシ、受け付けるリクエストサイズの上限、レート制限(429)の発生確率を設定でき、
+受け取ったリクエスト数とバイト数を記録する。ネットワークにもAPIの課金にも依存せずに性能を測るために使う。
+
+単体で起動する場合(srcディレクトリで):
+    python -m benchmarks.fake_openai --port 8765 --latency 0.5
+"""
+import argparse
+import json
+import random
+import re
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# 1MBあたりに返す文字起こしの文字数(mp3 32kbpsの1MBはおよそ4分)
+CHARS_PER_MB = 1200
+SAMPLE_TEXT = "えーと、今日は前回の続きで、実験の結果について報告します。"
+
+
+class FakeOpenAIServer():
+    """
+    別スレッドで動く代役サーバー。
+
+    Args:
+        latency (float): 各リクエストの基本の応答時間(秒)。
+        latency_per_mb (float): アップロード1MBあたりに追加する応答時間(秒)。
+        payload_limit (int): 受け付けるリクエストの最大バイト数。超えると413を返す。
+        rate_limit_prob (float): 429を返す確率。
+        stream_chunks (int): ストリーミング時に分割して返す差分の数。
+    """
+
+    def __init__(
+        self,
+        latency=0.2,
+        latency_per_mb=0.1,
+        payload_limit=25 * 1024 * 1024,
+        rate_limit_prob=0.0,
+        stream_chunks=20,
+        port=0,
+    ):
+        self.latency = latency
+        self.latency_per_mb = latency_per_mb
+        self.payload_limit = payload_limit
+        self.rate_limit_prob = rate_limit_prob
+        self.stream_chunks = stream_chunks
+        self.stats = {
+            "transcription_requests": 0,
+            "response_requests": 0,
+            "uploaded_bytes": 0,
+            "rate_limited": 0,
+            "payload_too_large": 0,
+        }
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer(("127.0.0.1", port), self._handler())
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+
+    @property
+    def base_url(self):
+        host, port = self._server.server_address
+        return f"http://{host}:{port}/v1"
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def count(self, key, value=1):
+        with self._lock:
+            self.stats[key] += value
+
+    def _handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def send_json(self, status, body, headers=None):
+                data = json.dumps(body, ensure_ascii=False).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(data)
+
+            def send_error_json(self, status, message, headers=None):
+                self.send_json(status, {"error": {"message": message, "type": "fake_error", "code": None}}, headers)
+
+            def do_GET(self):
+                if self.path.rstrip("/").endswith("/stats"):
+                    with server._lock:
+                        self.send_json(200, dict(server.stats))
+                else:
+                    self.send_error_json(404, "not found")
+
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length", 0))
+                body = self.rfile.read(length)
+                if length > server.payload_limit:
+                    server.count("payload_too_large")
+                    self.send_error_json(413, f"payload too large: {length} bytes")
+                    return
+                if random.random() < server.rate_limit_prob:
+                    server.count("rate_limited")
+                    self.send_error_json(429, "rate limited", {"Retry-After": "0.1"})
+                    return
+
+                if self.path.endswith("/audio/transcriptions"):
+                    self.transcription(body)
+                elif self.path.endswith("/responses"):
+                    self.response(json.loads(body))
+                else:
+                    self.send_error_json(404, f"not found: {self.path}")
+
+            def transcription(self, body):
+                server.count("transcription_requests")
+                server.count("uploaded_bytes", len(body))
+                megabytes = len(body) / 1024 / 1024
+                time.sleep(server.latency + server.latency_per_mb * megabytes)
+
+                n_chars = max(1, int(megabytes * CHARS_PER_MB))
+                text = (SAMPLE_TEXT * (n_chars // len(SAMPLE_TEXT) + 1))[:n_chars]
+                match = re.search(rb'name="response_format"\r\n\r\n([a-z_]+)', body)
+                response_format = match.group(1).decode() if match else "json"
+                if response_format == "text":
+                    data = text.encode("utf-8")
+                    self.send_response(200)
+                    self.send_header("Content-Type", "text/plain; charset=utf-8")
+                    self.send_header("Content-Length", str(len(data)))
+                    self.end_headers()
+                    self.wfile.write(data)
+                elif response_format == "verbose_json":
+                    # 1文を1セグメント、1秒ずつとして返す
+                    sentences = [s + "。" for s in text.split("。") if s]
+                    segments = [
+                        {"id": i, "start": float(i), "end": float(i + 1), "text": sentence}
+                        for i, sentence in enumerate(sentences)
+                    ]
+                    self.send_json(200, {
+                        "task": "transcribe",
+                        "language": "japanese",
+                        "duration": float(len(segments)),
+                        "text": text,
+                        "segments": segments,
+                    })
+                else:
+                    self.send_json(200, {"text": text})
+
+            def response(self, request):
+                server.count("response_requests")
+                time.sleep(server.latency)
+                text = "# 会議概要\n- 代役サーバーが生成した議事録です。\n# 次回検討事項\n- なし\n"
+                response_id = f"resp_{uuid.uuid4().hex}"
+                message = {
+                    "id": f"msg_{uuid.uuid4().hex}",
+                    "type": "message",
+                    "role": "assistant",
+                    "status": "completed",
+                    "content": [{"type": "output_text", "text": text, "annotations": []}],
+                }
+                response = {
+                    "id": response_id,
+                    "object": "response",
+                    "created_at": int(time.time()),
+                    "status": "completed",
+                    "model": request.get("model", ""),
+                    "output": [message],
+                    "parallel_tool_calls": True,
+                    "tool_choice": "auto",
+                    "tools": [],
+                }
+                if not request.get("stream"):
+                    self.send_json(200, response)
+                    return
+
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                self.send_header("Connection", "close")
+                self.end_headers()
+                step = max(1, len(text) // server.stream_chunks)
+                events = [{"type": "response.created", "response": {**response, "status": "in_progress", "output": []}}]
+                for i in range(0, len(text), step):
+                    events.append({
+                        "type": "response.output_text.delta",
+                        "item_id": message["id"],
+                        "output_index": 0,
+                        "content_index": 0,
+                        "delta": text[i:i + step],
+                        "logprobs": [],
+                    })
+                events.append({"type": "response.completed", "response": response})
+                for sequence_number, event in enumerate(events):
+                    event["sequence_number"] = sequence_number
+                    payload = json.dumps(event, ensure_ascii=False)
+                    self.wfile.write(f"event: {event['type']}\ndata: {payload}\n\n".encode("utf-8"))
+                    self.wfile.flush()
+                    # 生成にかかる時間を真似て少しずつ返す
+                    time.sleep(server.latency / len(events))
+                self.close_connection = True
+
+        return Handler
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=0.2)
+    parser.add_argument("--latency-per-mb", type=float, default=0.1)
+    parser.add_argument("--payload-limit-mb", type=float, default=25)
+    parser.add_argument("--rate-limit-prob", type=float, default=0.0)
+    args = parser.parse_args()
+
+    with FakeOpenAIServer(
+        latency=args.latency,
+        latency_per_mb=args.latency_per_mb,
+        payload_limit=int(args.payload_limit_mb * 1024 * 1024),
+        rate_limit_prob=args.rate_limit_prob,
+        port=args.port,
+    ) as server:
+        print(f"OPENAI_BASE_URL={server.base_url}")
+        try:
+            threading.Event().wait()
+        except KeyboardInterrupt:
+            pass
+
+
+if __name__ == "__main__":
+    main()
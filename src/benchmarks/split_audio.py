@@ -0,0 +1,116 @@
+"""
+SpeechToText.split_audio のベンチマーク。
+
+旧実装(10秒から1秒ずつ縮めながら書き出し→サイズ確認→削除を繰り返すループ)と、
+事前にチャンク境界を計算して各チャンクを1回だけ書き出す現在の実装を比較する。
+
+実行方法(srcディレクトリで):
+    python -m benchmarks.split_audio --minutes 5 10 20 --max-size-mb 1
+"""
+import argparse
+import os
+import shutil
+import tempfile
+import time
+
+# APIは呼ばないが、クライアントの初期化にキーが必要
+os.environ.setdefault("OPENAI_API_KEY", "benchmark")
+
+from pydub import AudioSegment
+
+from modules.speech_to_text import SpeechToText
+
+
+def make_synthetic_wav(path, minutes, frame_rate=44100, channels=2, sample_width=2):
+    """ホワイトノイズのWAVを作成する。"""
+    frames = int(minutes * 60 * frame_rate)
+    audio = AudioSegment(
+        data=os.urandom(frames * channels * sample_width),
+        sample_width=sample_width,
+        frame_rate=frame_rate,
+        channels=channels,
+    )
+    audio.export(path, format="wav")
+
+
+def legacy_split_audio(voice_path, max_size):
+    """変更前の split_audio をそのまま再現したもの。"""
+    audio = AudioSegment.from_file(voice_path)
+    chunks = []
+    start = 0
+    duration_ms = len(audio)
+    exports = 0
+    while start < duration_ms:
+        end = start + 10000
+        while end <= duration_ms:
+            chunk = audio[start:end]
+            chunk_path = f'{voice_path}_chunk_{start}.wav'
+            chunk.export(chunk_path, format="wav")
+            exports += 1
+            if os.path.getsize(chunk_path) > max_size:
+                os.remove(chunk_path)
+                if end - start <= 1000:
+                    raise ValueError("Cannot split audio into small enough chunks.")
+                end -= 1000
+            else:
+                break
+        else:
+            chunk = audio[start:duration_ms]
+            chunk_path = f'{voice_path}_chunk_{start}.wav'
+            chunk.export(chunk_path, format="wav")
+            exports += 1
+            end = duration_ms
+        chunks.append(chunk_path)
+        start = end
+    return chunks, exports
+
+
+def run(minutes, max_size):
+    workdir = tempfile.mkdtemp()
+    try:
+        voice_path = os.path.join(workdir, "voice.wav")
+        make_synthetic_wav(voice_path, minutes)
+
+        start = time.perf_counter()
+        legacy_chunks, exports = legacy_split_audio(voice_path, max_size)
+        legacy_time = time.perf_counter() - start
+        for chunk_path in legacy_chunks:
+            os.remove(chunk_path)
+
+        # 旧実装と条件を揃えるため、元の音声と同じ形式のWAVで書き出す
+        speech_to_text = SpeechToText({
+            "VOICE_PATH": voice_path,
+            "VOICE_MODEL_NAME": "",
+            "OUTPUT_PATH": workdir,
+            "UPLOAD_FORMAT": "wav",
+            "UPLOAD_CHANNELS": 2,
+            "UPLOAD_FRAME_RATE": 44100,
+        })
+        speech_to_text.MAX_SIZE = max_size
+        start = time.perf_counter()
+        chunks = speech_to_text.split_audio(voice_path)
+        current_time = time.perf_counter() - start
+        largest = max(os.path.getsize(chunk.path) for chunk in chunks)
+
+        print(
+            f"{minutes:>6.1f}分 | 旧: {legacy_time:7.2f}秒 ({len(legacy_chunks)}チャンク, 書き出し{exports}回)"
+            f" | 新: {current_time:7.2f}秒 ({len(chunks)}チャンク, 最大 {largest / 1024 / 1024:.2f}MB)"
+        )
+        assert largest <= max_size
+    finally:
+        shutil.rmtree(workdir)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--minutes", type=float, nargs="+", default=[2, 4, 8])
+    parser.add_argument("--max-size-mb", type=float, default=1)
+    args = parser.parse_args()
+
+    max_size = int(args.max_size_mb * 1024 * 1024)
+    for minutes in args.minutes:
+        run(minutes, max_size)
+
+
+if __name__ == "__main__":
+    main()
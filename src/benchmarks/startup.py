@@ -0,0 +1,83 @@
+"""
+起動時間とツール呼び出しごとの初期化コストのベンチマーク。
+
+- 起動時間: modules.speech_to_text / modules.summary を読み込むプロセスの実行時間。
+  重いライブラリ(openai, pydub, tqdm, yaml)を最初に読み込んでいた変更前の状態と比較する。
+- 初期化コスト: ツールが呼ばれるたびに設定ファイルを読み、APIクライアントを作り直していた変更前の状態と、
+  Runtime で共有したインスタンスを使う現在の状態を比較する。
+
+実行方法(srcディレクトリで):
+    python -m benchmarks.startup --repeat 10
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+# APIは呼ばないが、クライアントの初期化にキーが必要
+os.environ.setdefault("OPENAI_API_KEY", "benchmark")
+
+from modules.runtime import CONFIG_PATH, Runtime
+
+# 変更前は各モジュールの読み込み時にこれらを読み込んでいた
+EAGER_IMPORTS = "import openai, pydub, tqdm, yaml; "
+MODULE_IMPORTS = "import modules.speech_to_text, modules.summary"
+
+
+def time_process(code, repeat):
+    """python -c code の実行時間の中央値(秒)。"""
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, "-c", code], check=True)
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings)
+
+
+def time_setup(setup, repeat):
+    """setup() の実行時間の中央値(ミリ秒)。"""
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        setup()
+        timings.append((time.perf_counter() - start) * 1000)
+    return statistics.median(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=10)
+    parser.add_argument("--config", default=CONFIG_PATH if os.path.exists(CONFIG_PATH) else "config.yaml")
+    args = parser.parse_args()
+
+    baseline = time_process("pass", args.repeat)
+    before = time_process(EAGER_IMPORTS + MODULE_IMPORTS, args.repeat)
+    after = time_process(MODULE_IMPORTS, args.repeat)
+    print("起動時間(中央値, Python自体の起動を除く)")
+    print(f"  変更前(重いライブラリを先に読み込む): {(before - baseline) * 1000:7.1f}ms")
+    print(f"  変更後(使うときに読み込む)        : {(after - baseline) * 1000:7.1f}ms")
+
+    def setup_per_call():
+        # 変更前と同じく、呼び出しのたびに設定ファイルを読んでクライアントを作る
+        runtime = Runtime(args.config)
+        runtime.speech_to_text
+        runtime.summary
+
+    shared = Runtime(args.config)
+
+    def setup_shared():
+        shared.speech_to_text
+        shared.summary
+
+    # 1回目は読み込みのコストを含むので除外する
+    setup_per_call()
+    setup_shared()
+    print("ツール呼び出しごとの初期化コスト(中央値)")
+    print(f"  変更前(毎回作り直す): {time_setup(setup_per_call, args.repeat):7.2f}ms")
+    print(f"  変更後(共有する)    : {time_setup(setup_shared, args.repeat):7.3f}ms")
+
+
+if __name__ == "__main__":
+    main()
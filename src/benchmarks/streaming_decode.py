@@ -0,0 +1,122 @@
+"""
+長時間の録音を分割するときのピークメモリ(RSS)のベンチマーク。
+
+ffmpegで合成した長い m4a を用意し、録音全体を AudioSegment.from_file でデコードしてから切り出す方法と、
+SpeechToText.iter_chunks でffmpegのパイプから少しずつデコードする方法を、それぞれ別プロセスで実行して比較する。
+
+実行方法(srcディレクトリで):
+    python -m benchmarks.streaming_decode --hours 0.5 1 3
+"""
+import argparse
+import json
+import os
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+# APIは呼ばないが、クライアントの初期化にキーが必要
+os.environ.setdefault("OPENAI_API_KEY", "benchmark")
+
+
+def make_synthetic_m4a(path, hours):
+    """10秒ごとに発話と無音が入れ替わるステレオ44.1kHzの m4a を作成する。"""
+    seconds = int(hours * 3600)
+    expression = "0.3*sin(2*PI*220*t)*gt(sin(2*PI*t/20),0)"
+    subprocess.run(
+        [
+            "ffmpeg", "-nostdin", "-loglevel", "error", "-y",
+            "-f", "lavfi", "-i", f"aevalsrc={expression}:s=44100:d={seconds}",
+            "-ac", "2", "-c:a", "aac", "-b:a", "64k",
+            path,
+        ],
+        check=True,
+    )
+
+
+def split_in_memory(voice_path, config):
+    """録音全体をデコードしてから固定長で切り出す(変更前の方法)。"""
+    from pydub import AudioSegment
+
+    from modules.speech_to_text import SpeechToText
+
+    speech_to_text = SpeechToText(config)
+    audio = AudioSegment.from_file(voice_path)
+    chunk_length_ms = speech_to_text.chunk_length_ms()
+    chunk_paths = []
+    for start in range(0, len(audio), chunk_length_ms):
+        chunk_path = f'{voice_path}_chunk_{start}.{speech_to_text.upload_encoding.format}'
+        speech_to_text.upload_encoding.export(audio[start:start + chunk_length_ms], chunk_path)
+        chunk_paths.append(chunk_path)
+    return chunk_paths
+
+
+def split_streaming(voice_path, config):
+    """ffmpegのパイプから少しずつデコードする(現在の方法)。"""
+    from modules.speech_to_text import SpeechToText
+
+    speech_to_text = SpeechToText(config)
+    return [chunk.path for chunk in speech_to_text.iter_chunks(voice_path)]
+
+
+def child(mode, voice_path, config):
+    """別プロセスで分割を1回だけ実行し、時間とピークRSSをJSONで出力する。"""
+    start = time.perf_counter()
+    split = split_in_memory if mode == "in-memory" else split_streaming
+    chunk_paths = split(voice_path, config)
+    elapsed = time.perf_counter() - start
+    for chunk_path in chunk_paths:
+        os.remove(chunk_path)
+    # Linuxでは ru_maxrss はKB単位
+    peak_rss_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    print(json.dumps({"seconds": elapsed, "chunks": len(chunk_paths), "peak_rss_mb": peak_rss_mb}))
+
+
+def run(hours, config):
+    workdir = tempfile.mkdtemp()
+    try:
+        voice_path = os.path.join(workdir, "voice.m4a")
+        make_synthetic_m4a(voice_path, hours)
+        row = [f"{hours:>5.1f}時間"]
+        for mode in ("in-memory", "streaming"):
+            output = subprocess.run(
+                [sys.executable, "-m", "benchmarks.streaming_decode", "--child", mode, voice_path, json.dumps(config)],
+                check=True,
+                capture_output=True,
+                text=True,
+            ).stdout
+            result = json.loads(output.strip().splitlines()[-1])
+            row.append(
+                f"{mode}: {result['peak_rss_mb']:8.1f}MB {result['seconds']:7.1f}秒 ({result['chunks']}チャンク)"
+            )
+        print(" | ".join(row))
+    finally:
+        shutil.rmtree(workdir)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--hours", type=float, nargs="+", default=[0.5, 1, 3])
+    parser.add_argument("--max-chunk-seconds", type=int, default=600)
+    parser.add_argument("--child", nargs=3, metavar=("MODE", "VOICE_PATH", "CONFIG"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        mode, voice_path, config = args.child
+        child(mode, voice_path, json.loads(config))
+        return
+
+    config = {
+        "VOICE_PATH": "",
+        "VOICE_MODEL_NAME": "",
+        "OUTPUT_PATH": "",
+        "MAX_CHUNK_SECONDS": args.max_chunk_seconds,
+    }
+    for hours in args.hours:
+        run(hours, config)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,170 @@
+"""
+ネットワークもAPIの課金も使わない、文字起こしと議事録作成のベンチマーク。
+
+合成音声を作り、ローカルの代役サーバー(benchmarks.fake_openai)に SpeechToText と SummaryMinutes を向けて、
+以下を計測する。
+- 分割: 分割・エンコードにかかった時間、エンコードのスループット(音声の長さ / 処理時間)、チャンク数
+- アップロード: アップロードしたバイト数、リクエスト数、429の回数
+- 全体: 文字起こしと議事録作成を合わせた時間
+- メモリ: 文字起こしと議事録作成のプロセスとffmpegのピークRSS
+  (ru_maxrss はプロセスの中で累積するので、録音の長さごとに別プロセスで計測する)
+
+実行方法(リポジトリのルートで):
+    just run-bench --minutes 10 60 --latency 0.5 --rate-limit-prob 0.1
+"""
+import argparse
+import json
+import os
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+from benchmarks.fake_openai import FakeOpenAIServer
+from benchmarks.synthetic import make_speech_like_wav
+
+
+def make_config(workdir, voice_path, args):
+    import yaml
+
+    with open(args.config, "r") as f:
+        config = yaml.safe_load(f)
+    config.update({
+        "VOICE_PATH": voice_path,
+        "OUTPUT_PATH": os.path.join(workdir, "outputs"),
+        # 毎回APIを呼ぶよう、キャッシュは実行ごとに空の場所を使う
+        "TRANSCRIPTION_CACHE_PATH": os.path.join(workdir, "cache", "transcriptions"),
+        "SUMMARY_CACHE_PATH": os.path.join(workdir, "cache", "summaries"),
+        "RETRY_BASE_SECONDS": 0.1,
+    })
+    if args.max_chunk_seconds:
+        config["MAX_CHUNK_SECONDS"] = args.max_chunk_seconds
+    return config
+
+
+def peak_rss_mb():
+    """このプロセスと子プロセス(ffmpeg)のピークRSS(MB)。Linuxでは ru_maxrss はKB単位。"""
+    own = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024
+    return own, children
+
+
+def run(minutes, args):
+    from modules.runtime import Runtime
+    from modules.speech_to_text import SpeechToText
+    from modules.summary import SummaryMinutes
+
+    workdir = tempfile.mkdtemp()
+    try:
+        voice_path = os.path.join(workdir, "voice.wav")
+        make_speech_like_wav(voice_path, minutes)
+        config = make_config(workdir, voice_path, args)
+
+        with FakeOpenAIServer(
+            latency=args.latency,
+            latency_per_mb=args.latency_per_mb,
+            payload_limit=int(args.payload_limit_mb * 1024 * 1024),
+            rate_limit_prob=args.rate_limit_prob,
+        ) as server:
+            os.environ["OPENAI_BASE_URL"] = server.base_url
+            os.environ["OPENAI_API_KEY"] = "benchmark"
+            runtime = Runtime(config=config)
+            speech_to_text = SpeechToText(config, runtime=runtime)
+            summary = SummaryMinutes(config, runtime=runtime)
+
+            # 分割とエンコードだけを計測する
+            start = time.perf_counter()
+            chunks = list(speech_to_text.iter_chunks(voice_path))
+            split_seconds = time.perf_counter() - start
+            upload_bytes = sum(os.path.getsize(chunk.path) for chunk in chunks)
+            kept_ms = sum(chunk.end_ms - chunk.start_ms for chunk in chunks)
+            for chunk in chunks:
+                os.remove(chunk.path)
+
+            # 文字起こしから議事録までの全体を計測する
+            start = time.perf_counter()
+            transcription = runtime.run(speech_to_text.atranscribe_audio_to_text(voice_path))
+            transcribed = time.perf_counter()
+            summary.summarize_text(transcription, use_cache=False)
+            end = time.perf_counter()
+
+        own_rss, ffmpeg_rss = peak_rss_mb()
+        return {
+            "audio_minutes": minutes,
+            "split_seconds": round(split_seconds, 3),
+            "encode_speed": round(minutes * 60 / split_seconds, 1),
+            "chunks": len(chunks),
+            "kept_audio_ratio": round(kept_ms / (minutes * 60 * 1000), 3),
+            "upload_mb": round(upload_bytes / 1024 / 1024, 2),
+            "server": dict(server.stats),
+            "transcription_seconds": round(transcribed - start, 3),
+            "summary_seconds": round(end - transcribed, 3),
+            "end_to_end_seconds": round(end - start, 3),
+            "peak_rss_mb": round(own_rss, 1),
+            "peak_ffmpeg_rss_mb": round(ffmpeg_rss, 1),
+        }
+    finally:
+        shutil.rmtree(workdir)
+
+
+def child(minutes, args):
+    """別プロセスで1つの長さの計測を実行し、結果をJSONで出力する。"""
+    print(json.dumps(run(minutes, args), ensure_ascii=False))
+
+
+def run_in_subprocess(minutes, args):
+    """前の長さの計測のピークRSSが残らないよう、長さごとに新しいプロセスで計測する。"""
+    options = {key: value for key, value in vars(args).items() if key not in ("minutes", "child", "json")}
+    output = subprocess.run(
+        [sys.executable, "-m", "benchmarks.suite", "--child", str(minutes), json.dumps(options)],
+        check=True,
+        stdout=subprocess.PIPE,
+        text=True,
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--minutes", type=float, nargs="+", default=[10])
+    parser.add_argument("--config", default="config.yaml", help="ベースにする設定ファイル")
+    parser.add_argument("--max-chunk-seconds", type=int, default=None)
+    parser.add_argument("--latency", type=float, default=0.2, help="代役サーバーの基本の応答時間(秒)")
+    parser.add_argument("--latency-per-mb", type=float, default=0.1, help="アップロード1MBあたりの追加の応答時間(秒)")
+    parser.add_argument("--payload-limit-mb", type=float, default=25)
+    parser.add_argument("--rate-limit-prob", type=float, default=0.0, help="429を返す確率")
+    parser.add_argument("--json", help="結果をJSONで保存するパス")
+    parser.add_argument("--child", nargs=2, metavar=("MINUTES", "OPTIONS"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        minutes, options = args.child
+        child(float(minutes), argparse.Namespace(**json.loads(options)))
+        return
+
+    if shutil.which("ffmpeg") is None:
+        raise SystemExit("ffmpeg が見つかりません。音声のデコード・エンコードに必要です。")
+
+    results = []
+    for minutes in args.minutes:
+        result = run_in_subprocess(minutes, args)
+        results.append(result)
+        server = result["server"]
+        print(
+            f"{minutes:>6.1f}分 | 分割 {result['split_seconds']:6.2f}秒 (x{result['encode_speed']}, "
+            f"{result['chunks']}チャンク, 残した音声 {result['kept_audio_ratio']:.0%})"
+            f" | アップロード {result['upload_mb']:6.2f}MB / {server['transcription_requests']}リクエスト"
+            f" (429: {server['rate_limited']}, 413: {server['payload_too_large']})"
+            f" | 全体 {result['end_to_end_seconds']:6.2f}秒 (文字起こし {result['transcription_seconds']:.2f}秒)"
+            f" | ピークRSS {result['peak_rss_mb']:.0f}MB (ffmpeg {result['peak_ffmpeg_rss_mb']:.0f}MB)"
+        )
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,52 @@
+"""ベンチマーク用の、発話に似た合成音声を作る。"""
+import wave
+
+import numpy as np
+
+# 一度に書き出す長さ(秒)。長い音声でもメモリ使用量はこの長さで決まる
+BLOCK_SECONDS = 30
+
+
+def speech_like_samples(seconds, frame_rate, rng):
+    """
+    発話と間(ま)が交互に続く、モノラルの合成音声を返す。
+
+    発話は基本周波数が揺らぐ調波音を音節(4〜6Hz)ごとに振幅変調したもので、
+    発話の間には0.2〜1.5秒、ときどき5〜20秒の無音を入れる。
+    """
+    n = int(seconds * frame_rate)
+    samples = np.zeros(n, dtype=np.float32)
+    position = 0
+    while position < n:
+        utterance = int(rng.uniform(1.5, 8.0) * frame_rate)
+        end = min(position + utterance, n)
+        t = np.arange(end - position, dtype=np.float32) / frame_rate
+        f0 = rng.uniform(100, 220) * (1 + 0.05 * np.sin(2 * np.pi * rng.uniform(0.5, 2) * t))
+        phase = 2 * np.pi * np.cumsum(f0) / frame_rate
+        voiced = sum(np.sin(k * phase) / k for k in range(1, 6))
+        envelope = np.clip(np.sin(2 * np.pi * rng.uniform(4, 6) * t), 0, None) ** 0.5
+        noise = rng.standard_normal(len(t)).astype(np.float32) * 0.05
+        samples[position:end] = 0.25 * (voiced * envelope + noise)
+        position = end
+        pause = rng.uniform(5, 20) if rng.random() < 0.05 else rng.uniform(0.2, 1.5)
+        position += int(pause * frame_rate)
+    # 録音機材のノイズ
+    samples += rng.standard_normal(n).astype(np.float32) * 0.002
+    return samples
+
+
+def make_speech_like_wav(path, minutes, frame_rate=44100, channels=2, seed=0):
+    """発話に似た合成音声を16bitのWAVとして書き出す。"""
+    rng = np.random.default_rng(seed)
+    total = minutes * 60
+    with wave.open(path, "wb") as f:
+        f.setnchannels(channels)
+        f.setsampwidth(2)
+        f.setframerate(frame_rate)
+        written = 0.0
+        while written < total:
+            seconds = min(BLOCK_SECONDS, total - written)
+            mono = np.clip(speech_like_samples(seconds, frame_rate, rng), -1, 1)
+            pcm = (mono * 32767).astype("<i2")
+            f.writeframes(np.repeat(pcm, channels).tobytes())
+            written += seconds
@@ -0,0 +1,64 @@
+"""
+会議のタイムライン(音量と発話の割合)の図を作る時間と、図のJSONの大きさのベンチマーク。
+
+synthetic.py の合成音声から求めたフレームごとの音量を繰り返して長い会議の音量とし、
+全てのフレームをそのまま描く場合と、timeline_figure で間引いて描く場合を比較する。
+デコードの時間は含まない(2回目からは保存したフレームごとの音量を使うため)。
+
+実行方法(srcディレクトリで):
+    python -m benchmarks.timeline --hours 1 3
+"""
+import argparse
+import statistics
+import time
+
+import numpy as np
+
+from benchmarks.synthetic import speech_like_samples
+from modules.analytics import ANALYSIS_FRAME_RATE, MeetingActivity, timeline_figure
+from modules.audio import UPLOAD_SAMPLE_WIDTH, frame_energy_dbfs, mean_dbfs
+
+
+def synthetic_activity(hours, seed=0):
+    """10分の合成音声の音量を hours 時間分に繰り返した MeetingActivity。"""
+    rng = np.random.default_rng(seed)
+    samples = np.clip(speech_like_samples(600, ANALYSIS_FRAME_RATE, rng), -1, 1)
+    pcm = (samples * 32767).astype("<i2")
+    energy_db = frame_energy_dbfs(pcm, ANALYSIS_FRAME_RATE, 1, UPLOAD_SAMPLE_WIDTH)
+    energy_db = np.tile(energy_db, int(np.ceil(hours * 6)))[: int(hours * 3600 * 1000 / 20)].astype(np.float32)
+    return MeetingActivity(energy_db, mean_dbfs(energy_db) - 16, 500)
+
+
+def measure(build, repeat):
+    """build() の実行時間の中央値(秒)と、できた図のJSONの大きさ(バイト)。"""
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fig = build()
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings), len(fig.to_json())
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--hours", type=float, nargs="+", default=[1, 3])
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--max-points", type=int, default=4000)
+    args = parser.parse_args()
+
+    for hours in args.hours:
+        activity = synthetic_activity(hours)
+        frames = len(activity.energy_db)
+        # 1回目はplotlyの読み込みを含むので除外する
+        timeline_figure(activity, max_points=args.max_points)
+        full_seconds, full_bytes = measure(
+            lambda: timeline_figure(activity, max_points=frames, bin_ms=activity.frame_ms), 1
+        )
+        seconds, size = measure(lambda: timeline_figure(activity, max_points=args.max_points), args.repeat)
+        print(f"{hours}時間({frames}フレーム)")
+        print(f"  間引かない: {full_seconds:7.2f}秒, JSON {full_bytes / 1024 / 1024:7.1f}MB")
+        print(f"  間引く    : {seconds:7.2f}秒, JSON {size / 1024:7.1f}KB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,186 @@
+import argparse
+import asyncio
+import contextlib
+import hashlib
+import logging
+import os
+import sqlite3
+import time
+
+from modules import telemetry
+from modules.audio import AUDIO_EXTENSIONS
+from modules.pipeline import MinutesPipeline
+from modules.runtime import get_runtime
+from modules.speech_to_text import is_chunk_file, recording_output_dir, write_text
+from modules.watcher import DirectoryWatcher
+
+logging.basicConfig(
+    filename="log/app.log",
+    level=logging.INFO,
+    format="%(asctime)s [%(levelname)s] %(message)s"
+)
+telemetry.configure("log/spans.jsonl")
+
+
+def is_recording(path):
+    """録音として取り込むファイルかどうか(隠しファイルとチャンクの一時ファイルは除く)。"""
+    name = os.path.basename(path)
+    extension = os.path.splitext(name)[1].lstrip(".").lower()
+    return not name.startswith(".") and extension in AUDIO_EXTENSIONS and not is_chunk_file(path)
+
+
+def file_digest(path):
+    """ファイルの中身のSHA-256。"""
+    with open(path, "rb") as f:
+        return hashlib.file_digest(f, "sha256").hexdigest()
+
+
+class IngestLedger():
+    """
+    取り込んだ録音を中身のハッシュごとに記録するSQLiteの台帳。
+
+    同じ録音を別の名前でコピーした場合や、デーモンを再起動した場合も、処理済みの録音は処理し直さない。
+    失敗した録音は記録だけ残し、次に検出したときにもう一度処理する。
+    """
+
+    def __init__(self, path):
+        self.path = path
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with self.connect() as connection:
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS recordings ("
+                " digest TEXT PRIMARY KEY, voice_path TEXT NOT NULL, status TEXT NOT NULL,"
+                " output_dir TEXT, error TEXT, updated_at REAL NOT NULL)"
+            )
+
+    @contextlib.contextmanager
+    def connect(self):
+        connection = sqlite3.connect(self.path, timeout=30)
+        try:
+            with connection:
+                yield connection
+        finally:
+            connection.close()
+
+    def is_done(self, digest):
+        with self.connect() as connection:
+            row = connection.execute(
+                "SELECT 1 FROM recordings WHERE digest = ? AND status = 'done'", (digest,)
+            ).fetchone()
+        return row is not None
+
+    def record(self, digest, voice_path, status, output_dir=None, error=None):
+        """録音の処理結果("done" / "failed")を記録する。"""
+        with self.connect() as connection:
+            connection.execute(
+                "INSERT OR REPLACE INTO recordings (digest, voice_path, status, output_dir, error, updated_at)"
+                " VALUES (?, ?, ?, ?, ?, ?)",
+                (digest, voice_path, status, output_dir, error, time.time()),
+            )
+
+
+async def process_recording(voice_path, pipeline, semaphore):
+    """録音の文字起こしと議事録を、録音ごとのディレクトリに書き出す(batch.py と同じ構成)。"""
+    output_dir = recording_output_dir(pipeline.speech_to_text.output_path, voice_path)
+    os.makedirs(output_dir, exist_ok=True)
+    _, minutes = await pipeline.run(
+        voice_path,
+        os.path.join(output_dir, "transcript.txt"),
+        semaphore=semaphore,
+    )
+    await asyncio.to_thread(write_text, os.path.join(output_dir, "minutes.md"), minutes)
+    return output_dir
+
+
+async def run_daemon(directories, config, workers, settle_seconds, poll_seconds):
+    """
+    ディレクトリを監視し、書き込みが終わった録音から順に文字起こしと議事録の作成を行う。
+
+    同時に処理する録音は workers 件までで、APIリクエストの同時実行数(MAX_CONCURRENCY)は全録音で共有する。
+    録音は中身のハッシュで識別し、処理済みのもの・処理中のものは取り込まない。
+    """
+    runtime = get_runtime()
+    pipeline = MinutesPipeline(runtime.speech_to_text, runtime.summary)
+    semaphore = asyncio.Semaphore(runtime.speech_to_text.max_concurrency)
+    ledger = IngestLedger(
+        config.get("INGEST_STATE_PATH") or os.path.join(runtime.speech_to_text.output_path, "ingest.sqlite3")
+    )
+    queue = asyncio.Queue()
+    # キューに入っているか処理中の録音のハッシュ
+    in_flight = set()
+
+    async def worker():
+        while True:
+            voice_path, digest, queued = await queue.get()
+            start = time.perf_counter()
+            try:
+                output_dir = await process_recording(voice_path, pipeline, semaphore)
+            except Exception as e:
+                logging.error(f"{voice_path} の処理に失敗しました", exc_info=e)
+                print(f"失敗: {voice_path}: {e}")
+                await asyncio.to_thread(ledger.record, digest, voice_path, "failed", error=str(e))
+                status = "error"
+            else:
+                logging.info(f"{voice_path} の処理が完了しました: {output_dir}")
+                print(f"完了: {voice_path} -> {output_dir}")
+                await asyncio.to_thread(ledger.record, digest, voice_path, "done", output_dir)
+                status = "ok"
+            finally:
+                in_flight.discard(digest)
+                queue.task_done()
+            telemetry.record(
+                "ingest",
+                time.perf_counter() - start,
+                status,
+                path=voice_path,
+                queue_wait_ms=round((start - queued) * 1000, 3),
+            )
+            if config.get("METRICS_PATH"):
+                telemetry.write_prometheus(config["METRICS_PATH"])
+
+    watcher = DirectoryWatcher(
+        directories,
+        include=is_recording,
+        settle_seconds=settle_seconds,
+        poll_seconds=poll_seconds,
+    )
+    tasks = [asyncio.create_task(worker()) for _ in range(workers)]
+    try:
+        async for voice_path in watcher.watch():
+            try:
+                digest = await asyncio.to_thread(file_digest, voice_path)
+            except FileNotFoundError:
+                continue
+            if digest in in_flight or await asyncio.to_thread(ledger.is_done, digest):
+                logging.info(f"処理済みの録音のため取り込みません: {voice_path}")
+                continue
+            in_flight.add(digest)
+            print(f"取り込み: {voice_path}")
+            queue.put_nowait((voice_path, digest, time.perf_counter()))
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="ディレクトリに置かれた録音を自動で文字起こしし、議事録を作成します。")
+    parser.add_argument("directories", nargs="*", help="監視するディレクトリ(省略時は設定ファイルの INGEST_DIRS)")
+    parser.add_argument("--workers", type=int, default=None, help="同時に処理する録音の数")
+    args = parser.parse_args()
+
+    config = get_runtime().config
+    directories = args.directories or config.get("INGEST_DIRS") or ["data"]
+    workers = args.workers or config.get("INGEST_WORKERS", 2)
+    settle_seconds = config.get("INGEST_SETTLE_SECONDS", 10)
+    poll_seconds = config.get("INGEST_POLL_SECONDS", 5)
+
+    print(f"{', '.join(directories)} を監視しています。Ctrl+Cで終了します。")
+    try:
+        get_runtime().run(run_daemon(directories, config, workers, settle_seconds, poll_seconds))
+    except KeyboardInterrupt:
+        print("終了します。")
+
+
+if __name__ == "__main__":
+    main()
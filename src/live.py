@@ -0,0 +1,102 @@
+import argparse
+import asyncio
+import datetime
+import logging
+import os
+import signal
+
+from modules import telemetry
+from modules.live import LiveTranscriber
+from modules.pipeline import MinutesPipeline
+from modules.runtime import get_runtime
+from modules.speech_to_text import write_text
+
+logging.basicConfig(
+    filename="log/app.log",
+    level=logging.INFO,
+    format="%(asctime)s [%(levelname)s] %(message)s"
+)
+telemetry.configure("log/spans.jsonl")
+
+
+def print_window(chunk, text):
+    print(f"[{chunk.start_ms // 60000:02d}:{chunk.start_ms // 1000 % 60:02d}] {text}", flush=True)
+
+
+async def run_live(source, input_format, with_minutes):
+    """
+    録音中の音声を文字起こしし、議事録の下書きを更新しながら、録音が終わったら議事録を仕上げる。
+
+    結果は batch.py と同じく OUTPUT_PATH/<録音のファイル名>/ に書き出す。
+    下書き(minutes_draft.md)はセクションの要点メモができるたびに書き直す。
+    """
+    runtime = get_runtime()
+    if input_format is None and source != "-":
+        name = os.path.splitext(os.path.basename(source))[0]
+    else:
+        name = f"live_{datetime.datetime.now().strftime('%Y%m%d_%H%M%S')}"
+    output_dir = os.path.join(runtime.speech_to_text.output_path, name)
+    os.makedirs(output_dir, exist_ok=True)
+    transcription_path = os.path.join(output_dir, "transcript.txt")
+
+    live = LiveTranscriber(runtime.speech_to_text)
+    loop = asyncio.get_running_loop()
+    # Ctrl+C では入力の読み込みだけを止め、読み込み済みの音声の文字起こしと議事録の作成は続ける
+    loop.add_signal_handler(signal.SIGINT, live.stop)
+    try:
+        if not with_minutes:
+            await live.run(source, transcription_path, input_format, on_text=print_window)
+            return output_dir
+
+        notes = {}
+        draft_path = os.path.join(output_dir, "minutes_draft.md")
+
+        def on_note(index, note):
+            notes[index] = note
+            write_text(draft_path, "\n\n".join(notes[i] for i in sorted(notes)))
+            print(f"議事録の下書きを更新しました({len(notes)}セクション): {draft_path}", flush=True)
+
+        pipeline = MinutesPipeline(runtime.speech_to_text, runtime.summary)
+        _, minutes = await pipeline.run_live(
+            source,
+            transcription_path,
+            input_format,
+            on_text=print_window,
+            on_note=on_note,
+            live=live,
+        )
+        write_text(os.path.join(output_dir, "minutes.md"), minutes)
+        return output_dir
+    finally:
+        loop.remove_signal_handler(signal.SIGINT)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="録音中の音声を文字起こしし、録音が終わったらすぐに議事録を作成します。"
+    )
+    parser.add_argument(
+        "source",
+        help="録音中のファイル、--format で指定した入力デバイス、または標準入力(-)",
+    )
+    parser.add_argument(
+        "--format",
+        dest="input_format",
+        default=None,
+        help="ffmpegの入力形式(avfoundation / pulse / alsa / dshow など)",
+    )
+    parser.add_argument("--no-minutes", action="store_true", help="文字起こしだけを行う")
+    args = parser.parse_args()
+
+    print("録音を読み込んでいます。Ctrl+Cで読み込みを止めると、残りの文字起こしと議事録の作成を行います。")
+    try:
+        output_dir = get_runtime().run(run_live(args.source, args.input_format, not args.no_minutes))
+    except Exception as e:
+        logging.error(f"{args.source} のライブ文字起こしに失敗しました", exc_info=e)
+        print("Error:", e)
+        return
+    print(f"完了: {output_dir}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,17 +1,23 @@
-from agents import Agent, Runner, function_tool
 import asyncio
-from dotenv import load_dotenv
-load_dotenv()
-import yaml
+import datetime
+import json
 import logging
+import os
+import time
+from dataclasses import dataclass
 
-from modules.speech_to_text import SpeechToText
-from modules.summary import SummaryMinutes
+from agents import Agent, RunContextWrapper, Runner, function_tool
+from openai.types.responses import ResponseTextDeltaEvent
 
+from modules import telemetry
+from modules.archive import format_ms
+from modules.pipeline import MinutesPipeline
+from modules.runtime import get_runtime
+from modules.summary import estimate_tokens
 
-with open("config/config.yaml", "r") as f:
-    config = yaml.safe_load(f)
-model_name = config["SUMMARIZE_MODEL_NAME"]
+# 設定ファイルとAPIクライアントはプロセス全体で共有する
+runtime = get_runtime()
+model_name = runtime.config["SUMMARIZE_MODEL_NAME"]
 
 # ログの基本設定
 logging.basicConfig(
@@ -19,53 +25,309 @@ logging.basicConfig(
     level=logging.INFO,
     format="%(asctime)s [%(levelname)s] %(message)s"
 )
+# 処理段階ごとの所要時間(スパン)はJSON Linesで別のファイルに出力する
+telemetry.configure("log/spans.jsonl")
+
+# 進捗の表示に使う処理段階の名前
+STAGE_NAMES = {"transcription": "文字起こし", "summary": "要約"}
+# 会話の履歴に残す、以前のツールの結果の長さ(文字数)と、履歴全体のトークン数の上限
+HISTORY_TOOL_OUTPUT_CHARS = runtime.config.get("HISTORY_TOOL_OUTPUT_CHARS", 2000)
+HISTORY_MAX_TOKENS = runtime.config.get("HISTORY_MAX_TOKENS", 50000)
+
+
+@dataclass
+class ChatContext:
+    """
+    チャットの間ツールで共有する状態。
+
+    progress にはツールの進捗(ProgressEvent)が届き、チャットのループが表示する。
+    semaphore は同時に呼ばれたツールの間で、文字起こしのAPIリクエストの同時実行数を共有するためのもの。
+    first_token_time は、その応答で最初に表示したトークン(エージェントの返答かツールが生成した議事録)の時刻。
+    """
+    progress: asyncio.Queue
+    semaphore: asyncio.Semaphore
+    first_token_time: float | None = None
+
+    def print_delta(self, delta):
+        """ストリーミングで届いた差分を表示し、最初の差分なら時刻を記録する。"""
+        if self.first_token_time is None:
+            self.first_token_time = time.perf_counter()
+        print(delta, end="", flush=True)
+
+
+def output_dir(voice_path):
+    """録音を指定したときの出力先(batch.py と同じく OUTPUT_PATH/<録音名>_<パスのハッシュ>)。"""
+    from modules.speech_to_text import recording_output_dir
+
+    path = recording_output_dir(runtime.speech_to_text.output_path, voice_path)
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+def join_results(voice_paths, results):
+    """複数の録音の結果を、録音名の見出しを付けて1つにまとめる。"""
+    return "\n\n".join(f"# {os.path.basename(path)}\n{result}" for path, result in zip(voice_paths, results))
+
 
 @function_tool
-def voice_to_text():
+async def voice_to_text(
+    ctx: RunContextWrapper[ChatContext],
+    voice_paths: list[str] | None = None,
+    refresh: bool = False,
+):
     """
     音声から文字起こしをします。
     ここで作成された文字起こしが、後に議事録を作成する際に使用されます。
+    録音ファイルと設定が変わっていなければ、前回の文字起こしをすぐに返します。
+
+    Args:
+        voice_paths: ユーザーが録音のパスを指定した場合のみ渡します。複数の録音は同時に文字起こしします。
+        refresh: ユーザーが文字起こしのやり直しを求めた場合のみ True にします。
     """
     logging.info("文字起こしの生成を開始します...")
-    speech_to_text = SpeechToText()
-    result = speech_to_text.transcribe_audio_to_text()
+    speech_to_text = runtime.speech_to_text
+    if not voice_paths:
+        result = await speech_to_text.atranscribe_audio_to_text(
+            semaphore=ctx.context.semaphore,
+            use_cache=not refresh,
+            on_progress=ctx.context.progress.put_nowait,
+        )
+    else:
+        results = await asyncio.gather(*(
+            speech_to_text.atranscribe_audio_to_text(
+                voice_path,
+                os.path.join(output_dir(voice_path), "transcript.txt"),
+                semaphore=ctx.context.semaphore,
+                use_cache=not refresh,
+                on_progress=ctx.context.progress.put_nowait,
+            )
+            for voice_path in voice_paths
+        ))
+        result = join_results(voice_paths, results)
     logging.info("文字起こしが完了しました")
     return result
 
 @function_tool
-def summary():
+async def summary(
+    ctx: RunContextWrapper[ChatContext],
+    voice_paths: list[str] | None = None,
+    refresh: bool = False,
+):
     """
     この関数はSummaryMinutesという外部モジュールを呼び出して使用します。
     SummaryMinutesは文字起こしされたゼミナールの様子を議事録としてまとめて、
     ネクストアクションがわかるようにしてくれるクラスです。
+    文字起こしと設定が変わっていなければ、前回作成した議事録をすぐに返します。
+
+    Args:
+        voice_paths: voice_to_text に録音のパスを渡して文字起こしした場合は、同じパスを渡します。
+        refresh: ユーザーが議事録の作り直しを求めた場合のみ True にします。
     """
     logging.info("議事録の生成を開始します...")
-    summary = SummaryMinutes()
-    result = summary.summary()
+    summary = runtime.summary
+    archive = runtime.speech_to_text.archive
+    if not voice_paths:
+        # 生成された議事録はその場で表示する
+        result = await summary.asummary(
+            on_delta=ctx.context.print_delta,
+            use_cache=not refresh,
+            on_progress=ctx.context.progress.put_nowait,
+        )
+        print()
+        # output.txt は設定ファイルの録音の文字起こしなので、その会議の議事録としてアーカイブに保存する
+        await asyncio.to_thread(archive.set_minutes, runtime.speech_to_text.voice_path, result)
+    else:
+        from modules.speech_to_text import read_text, write_text
+
+        async def run(voice_path):
+            directory = output_dir(voice_path)
+            transcript_path = os.path.join(directory, "transcript.txt")
+            if not os.path.exists(transcript_path):
+                return "文字起こしがありません。先に voice_to_text でこの録音を文字起こししてください。"
+            transcription = await asyncio.to_thread(read_text, transcript_path)
+            # 複数の議事録が混ざらないよう、ストリーミングでは表示しない
+            minutes = await summary.asummarize_text(
+                transcription,
+                use_cache=not refresh,
+                on_progress=ctx.context.progress.put_nowait,
+                label=os.path.basename(voice_path),
+            )
+            await asyncio.to_thread(write_text, os.path.join(directory, "minutes.md"), minutes)
+            await asyncio.to_thread(archive.set_minutes, voice_path, minutes)
+            return minutes
+
+        result = join_results(voice_paths, await asyncio.gather(*(run(path) for path in voice_paths)))
+        await asyncio.to_thread(summary.cache.save_stats)
     logging.info("議事録の生成が完了しました")
     return result
 
+@function_tool
+async def voice_to_minutes(
+    ctx: RunContextWrapper[ChatContext],
+    voice_paths: list[str] | None = None,
+    refresh: bool = False,
+):
+    """
+    音声の文字起こしと議事録の作成を並行して進め、議事録を返します。
+    文字起こしと議事録の両方が必要な場合は、voice_to_text と summary を順番に呼ぶよりも速く終わります。
+    録音ファイルと設定が変わっていなければ、前回の結果をすぐに返します。
+
+    Args:
+        voice_paths: ユーザーが録音のパスを指定した場合のみ渡します。複数の録音は同時に処理します。
+        refresh: ユーザーが作り直しを求めた場合のみ True にします。
+    """
+    logging.info("文字起こしと議事録の生成を開始します...")
+    pipeline = MinutesPipeline(runtime.speech_to_text, runtime.summary)
+    if not voice_paths:
+        _, result = await pipeline.run(
+            on_delta=ctx.context.print_delta,
+            use_cache=not refresh,
+            on_progress=ctx.context.progress.put_nowait,
+            semaphore=ctx.context.semaphore,
+        )
+        print()
+    else:
+        from modules.speech_to_text import write_text
+
+        async def run(voice_path):
+            directory = output_dir(voice_path)
+            # 複数の議事録が混ざらないよう、ストリーミングでは表示しない
+            _, minutes = await pipeline.run(
+                voice_path,
+                os.path.join(directory, "transcript.txt"),
+                use_cache=not refresh,
+                on_progress=ctx.context.progress.put_nowait,
+                semaphore=ctx.context.semaphore,
+            )
+            await asyncio.to_thread(write_text, os.path.join(directory, "minutes.md"), minutes)
+            return minutes
+
+        result = join_results(voice_paths, await asyncio.gather(*(run(path) for path in voice_paths)))
+    logging.info("文字起こしと議事録の生成が完了しました")
+    return result
+
+@function_tool
+async def search_meetings(query: str, limit: int = 10):
+    """
+    これまでに文字起こしした全てのゼミナールの文字起こしと議事録を全文検索します。
+    過去の会議で話された内容や決まったことについての質問には、音声を文字起こしし直さずにこのツールで調べます。
+    結果には会議名・録音日・録音の中での時刻(議事録の場合は「議事録」)と該当箇所が含まれます。
+
+    Args:
+        query: 検索する語。空白で区切ると、すべての語を含む箇所を探します。
+        limit: 返す結果の最大数。
+    """
+    logging.info(f"過去の会議を検索します: {query}")
+    results = await asyncio.to_thread(runtime.speech_to_text.archive.search, query, limit)
+    if not results:
+        return "該当する箇所は見つかりませんでした。"
+    lines = []
+    for result in results:
+        date = datetime.datetime.fromtimestamp(result["recorded_at"]).strftime("%Y-%m-%d")
+        if result["kind"] == "minutes":
+            where = "議事録"
+        else:
+            where = f"{format_ms(result['start_ms'])}-{format_ms(result['end_ms'])}"
+        lines.append(f"- {result['title']} ({date}, {where}): {result['snippet']}")
+    return "\n".join(lines)
+
+def trim_history(items, tool_output_chars=HISTORY_TOOL_OUTPUT_CHARS, max_tokens=HISTORY_MAX_TOKENS):
+    """
+    次の質問に続けて送る会話の履歴を短くする。
+
+    直前のやり取りより前のツールの結果(文字起こしや議事録の全文)は先頭の tool_output_chars 文字だけを残し、
+    全文は保存先のファイルを参照するよう書き換える。それでも max_tokens を超える場合は、古いやり取りから取り除く。
+    """
+    # ユーザーの発言ごとのやり取りに分ける(ツールの呼び出しと結果は同じやり取りの中にある)
+    turns = []
+    for item in items:
+        if not turns or item.get("role") == "user":
+            turns.append([])
+        turns[-1].append(item)
+    note = (
+        f"\n…(以前の結果のため省略しました。全文は {runtime.speech_to_text.output_path} 以下の"
+        " output.txt / <録音名>_<ハッシュ>/transcript.txt / <録音名>_<ハッシュ>/minutes.md にあります。"
+        "必要ならツールをもう一度呼ぶと、保存済みの結果がすぐに返ります)"
+    )
+    for turn in turns[:-1]:
+        for i, item in enumerate(turn):
+            if item.get("type") != "function_call_output":
+                continue
+            output = item.get("output")
+            if isinstance(output, str) and len(output) > tool_output_chars:
+                turn[i] = {**item, "output": output[:tool_output_chars] + note}
+    while len(turns) > 1 and estimate_tokens(json.dumps(turns, ensure_ascii=False, default=str)) > max_tokens:
+        turns.pop(0)
+    return [item for turn in turns for item in turn]
+
+async def show_progress(queue):
+    """ツールから届いた進捗を、録音・処理段階ごとに1行で表示する。"""
+    while True:
+        event = await queue.get()
+        total = event.total if event.total is not None else "?"
+        eta = f" (残り約{event.eta_seconds:.0f}秒)" if event.eta_seconds is not None else ""
+        end = "\n" if event.done == event.total else ""
+        print(f"\r[{event.label}] {STAGE_NAMES[event.stage]}: {event.done}/{total}{eta}\033[K", end=end, flush=True)
+
 async def main():
-    agent = Agent(
+    agent = Agent[ChatContext](
         name="Minutes agent",
-        instructions="Summarize seminar class transcription from folder",
+        instructions=(
+            "Summarize seminar class transcription from folder. "
+            "Answer follow-up questions from the transcript and minutes already in this conversation; "
+            "call the tools again only when the user asks for a new recording or to redo the work. "
+            "When the user asks about several recordings, pass all of them in one call so they run concurrently. "
+            "When summarizing recordings transcribed with voice_paths, pass the same voice_paths to summary. "
+            "Tool results from earlier turns may be shortened; if you need the full text, call the tool again "
+            "(unchanged recordings return the saved result immediately). "
+            "For questions about past meetings, use search_meetings instead of transcribing audio again."
+        ),
         model=model_name,
-        tools=[voice_to_text, summary]
+        tools=[voice_to_text, summary, voice_to_minutes, search_meetings]
+    )
+    context = ChatContext(
+        progress=asyncio.Queue(),
+        semaphore=asyncio.Semaphore(runtime.speech_to_text.max_concurrency),
     )
+    progress_printer = asyncio.create_task(show_progress(context.progress))
 
+    # 会話の履歴(ツールの呼び出しと結果を含む)。次の質問はこれに続けて送る(trim_history で長さを抑える)
+    history = []
     print("チャットを開始します。'exit'で終了します。")
-    while True:
-        user_input = input("あなた: ")
-        if user_input.lower() in ["exit", "quit"]:
-            print("チャットを終了します。")
-            break
-        result = await Runner.run(agent, user_input)
-        print("エージェント:", result.final_output)
+    try:
+        while True:
+            # 入力を待つ間もイベントループを止めない
+            user_input = await asyncio.to_thread(input, "あなた: ")
+            if user_input.lower() in ["exit", "quit"]:
+                print("チャットを終了します。")
+                break
+            start = time.perf_counter()
+            context.first_token_time = None
+            print("エージェント: ", end="", flush=True)
+            result = Runner.run_streamed(agent, [*history, {"role": "user", "content": user_input}], context=context)
+            async for event in result.stream_events():
+                if event.type == "raw_response_event" and isinstance(event.data, ResponseTextDeltaEvent):
+                    context.print_delta(event.data.delta)
+            print()
+            history = trim_history(result.to_input_list())
+            end = time.perf_counter()
+            first_token_time = context.first_token_time
+            ttft = f"{(first_token_time-start):.2f}秒" if first_token_time is not None else "-"
+            print(f"(最初のトークンまでの時間: {ttft} / 応答にかかった時間: {(end-start):.2f}秒)")
+            telemetry.record(
+                "agent_turn",
+                end - start,
+                ttft_ms=round((first_token_time - start) * 1000, 3) if first_token_time is not None else None,
+            )
+            if runtime.config.get("METRICS_PATH"):
+                telemetry.write_prometheus(runtime.config["METRICS_PATH"])
+    finally:
+        progress_printer.cancel()
 
 if __name__ == "__main__":
 
     try:
-        asyncio.run(main())
+        runtime.run(main())
     except Exception as e:
         logging.error("予期せぬエラーが発生しました", exc_info=True)
         print("Error:", e)
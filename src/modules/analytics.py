@@ -0,0 +1,281 @@
+import math
+import os
+import tempfile
+from dataclasses import dataclass
+
+import numpy as np
+
+from modules.audio import (
+    FRAME_MS,
+    UPLOAD_SAMPLE_WIDTH,
+    decode_pcm_windows,
+    detect_silences,
+    frame_energy_dbfs,
+    mean_dbfs,
+    pcm_to_array,
+)
+from modules.cache import ResultCache, file_fingerprint
+from modules.runtime import get_runtime
+from modules.telemetry import span
+
+# 音量の計算に使うサンプリングレート(発話の有無と音量の推移には8kHzのモノラルで十分)
+ANALYSIS_FRAME_RATE = 8000
+# 一度にデコードする長さ(フレームの長さの倍数にして、ウィンドウの境界でフレームが欠けないようにする)
+DECODE_WINDOW_MS = 60_000
+# 図の1系列に描く点の数の上限
+MAX_POINTS = 4000
+
+
+def minmax_decimate(x, y, max_points):
+    """
+    系列を max_points / 2 個の区間に分け、各区間の最小値と最大値の点だけを残す。
+
+    音量のピークや無音の谷を残したまま点を減らせるので、波形の包絡線を描くのに向く。
+
+    Returns:
+        tuple[np.ndarray, np.ndarray]: 間引いた x と y。
+    """
+    n = len(y)
+    if n <= max_points:
+        return x, y
+    buckets = max_points // 2
+    size = math.ceil(n / buckets)
+    # 最後の区間の不足分は末尾の値で埋める(argmin/argmax の位置は n-1 に丸める)
+    padded = np.pad(y, (0, buckets * size - n), mode="edge").reshape(buckets, size)
+    base = np.arange(buckets) * size
+    lo = np.minimum(base + padded.argmin(axis=1), n - 1)
+    hi = np.minimum(base + padded.argmax(axis=1), n - 1)
+    # 区間の中では元の順番に並べる
+    indices = np.stack((np.minimum(lo, hi), np.maximum(lo, hi)), axis=1).reshape(-1)
+    return x[indices], y[indices]
+
+
+def lttb(x, y, max_points):
+    """
+    Largest-Triangle-Three-Buckets で max_points 個の点を選ぶ。
+
+    各区間から、前に選んだ点と次の区間の平均とで作る三角形が最も大きくなる点を選ぶので、
+    なめらかな系列の形を少ない点で保てる。
+
+    Returns:
+        tuple[np.ndarray, np.ndarray]: 間引いた x と y。
+    """
+    n = len(y)
+    if n <= max_points or max_points < 3:
+        return x, y
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    # 先頭と末尾の点は必ず残し、その間を max_points - 2 個の区間に分ける
+    edges = np.linspace(1, n - 1, max_points - 1).astype(np.int64)
+    # 各区間の平均(次の区間の代表点に使う)。最後の区間の次は末尾の点
+    counts = np.diff(edges)
+    mean_x = np.append(np.add.reduceat(x[:n - 1], edges[:-1]) / counts, x[-1])
+    mean_y = np.append(np.add.reduceat(y[:n - 1], edges[:-1]) / counts, y[-1])
+    selected = np.empty(max_points, dtype=np.int64)
+    selected[0], selected[-1] = 0, n - 1
+    a = 0
+    for i in range(max_points - 2):
+        lo, hi = edges[i], edges[i + 1]
+        area = np.abs((x[a] - mean_x[i + 1]) * (y[lo:hi] - y[a]) - (x[a] - x[lo:hi]) * (mean_y[i + 1] - y[a]))
+        a = lo + int(area.argmax())
+        selected[i + 1] = a
+    return x[selected], y[selected]
+
+
+@dataclass
+class MeetingActivity:
+    """
+    録音全体の音量と発話の有無をフレームごとに持つ。
+
+    閾値は録音全体の平均音量からの相対値(SILENCE_THRESH_DB)で決め、
+    閾値より静かな区間が min_silence_ms 以上続くところを無音、それ以外を発話とみなす。
+    """
+    energy_db: np.ndarray
+    threshold_db: float
+    min_silence_ms: int
+    frame_ms: int = FRAME_MS
+
+    @property
+    def duration_ms(self):
+        return len(self.energy_db) * self.frame_ms
+
+    def speech(self):
+        """フレームごとの発話の有無。"""
+        silences = detect_silences(self.energy_db, self.threshold_db, self.min_silence_ms, self.frame_ms)
+        # 無音区間の始まりで +1、終わりで -1 して累積和をとる
+        change = np.zeros(len(self.energy_db) + 1, dtype=np.int32)
+        change[silences[:, 0] // self.frame_ms] += 1
+        change[silences[:, 1] // self.frame_ms] -= 1
+        return np.cumsum(change[:-1]) <= 0
+
+    def speech_ratio(self):
+        """録音全体のうち発話している時間の割合。"""
+        return float(self.speech().mean()) if len(self.energy_db) else 0.0
+
+    def binned(self, bin_ms):
+        """
+        bin_ms ごとに発話の割合と平均音量を求める。
+
+        Returns:
+            tuple[np.ndarray, np.ndarray, np.ndarray]: 各区間の開始時刻(ミリ秒)、発話の割合(0〜1)、平均音量(dBFS)。
+        """
+        per_bin = max(1, bin_ms // self.frame_ms)
+        n = len(self.energy_db)
+        bins = math.ceil(n / per_bin)
+        pad = bins * per_bin - n
+
+        def sums(values):
+            return np.pad(values, (0, pad)).reshape(bins, per_bin).sum(axis=1)
+
+        counts = sums(np.ones(n, dtype=np.float32))
+        ratio = sums(self.speech().astype(np.float32)) / counts
+        power = sums(10 ** (self.energy_db.astype(np.float64) / 10)) / counts
+        loudness = 10 * np.log10(np.maximum(power, 1e-12))
+        return np.arange(bins) * per_bin * self.frame_ms, ratio, loudness
+
+
+def timeline_figure(activity, title=None, max_points=MAX_POINTS, bin_ms=None):
+    """
+    音量の推移と発話の割合のタイムラインを、PlotlyConfig のテンプレートで描く。
+
+    フレームごとの音量は最小値・最大値で、区間ごとの発話の割合は LTTB で max_points 個以下に間引くので、
+    録音の長さによらず図のJSONは小さく、描画も速い。
+
+    Args:
+        activity (MeetingActivity): 録音の音量と発話の有無。
+        title (str): 図のタイトル。
+        max_points (int): 1系列に描く点の数の上限。
+        bin_ms (int): 発話の割合を求める区間の長さ。省略時は10秒以上で、区間の数が max_points を超えない長さ。
+
+    Returns:
+        plotly.graph_objects.Figure: 上段に音量、下段に発話の割合を描いた図。
+    """
+    import plotly.graph_objects as go
+    from plotly.subplots import make_subplots
+
+    from modules.plotly.config import PlotlyConfig
+
+    PlotlyConfig.set_custom_plotly_template()
+    config = PlotlyConfig()
+    colors = config.colors
+
+    # 横軸は分。JSONを小さくするため float32 にする
+    minutes = np.arange(len(activity.energy_db), dtype=np.float32) * (activity.frame_ms / 60000)
+    x, loudness = minmax_decimate(minutes, activity.energy_db.astype(np.float32), max_points)
+    if bin_ms is None:
+        bin_ms = max(10_000, math.ceil(activity.duration_ms / max_points / 1000) * 1000)
+    starts, ratio, _ = activity.binned(bin_ms)
+    bin_x, bin_ratio = lttb((starts + bin_ms / 2) / 60000, ratio * 100, max_points)
+
+    fig = make_subplots(rows=2, cols=1, shared_xaxes=True, row_heights=[0.65, 0.35], vertical_spacing=0.06)
+    fig.add_trace(
+        go.Scatter(x=x, y=loudness, mode="lines", name="音量 (dBFS)", line=dict(color=colors.base, width=1)),
+        row=1,
+        col=1,
+    )
+    fig.add_hline(
+        y=activity.threshold_db,
+        line=dict(color=colors.primary, width=1, dash="dash"),
+        annotation_text="無音の閾値",
+        row=1,
+        col=1,
+    )
+    fig.add_trace(
+        go.Scatter(
+            x=bin_x.astype(np.float32),
+            y=bin_ratio.astype(np.float32),
+            mode="lines",
+            name=f"発話の割合 (%, {bin_ms // 1000}秒ごと)",
+            line=dict(color=colors.secondary, width=1.5, shape="hv"),
+            fill="tozeroy",
+        ),
+        row=2,
+        col=1,
+    )
+    fig.update_layout(**config.layout_defaults, legend=config.legend, title=title)
+    fig.update_xaxes(gridcolor=colors.grid)
+    fig.update_yaxes(gridcolor=colors.grid)
+    fig.update_xaxes(title_text="経過時間 (分)", row=2, col=1)
+    fig.update_yaxes(title_text="dBFS", row=1, col=1)
+    fig.update_yaxes(title_text="%", range=[0, 100], row=2, col=1)
+    return fig
+
+
+class MeetingAnalytics():
+    """
+    録音の音量と発話の有無を解析し、タイムラインの図を作る。
+
+    録音はffmpegから少しずつデコードしてフレームごとの音量だけを残すので、
+    数時間の録音でもメモリに載るのは数MBの配列だけになる。
+    フレームごとの音量は録音ファイルごとに ANALYTICS_PATH(省略時は OUTPUT_PATH/analytics)に保存し、
+    2回目からはデコードせずに図を作る。
+    """
+
+    def __init__(self, config=None, runtime=None):
+        runtime = runtime or get_runtime()
+        if config is None:
+            config = runtime.config
+        self.config = config
+        self.voice_path = config["VOICE_PATH"]
+        self.output_path = config.get("ANALYTICS_PATH") or os.path.join(config["OUTPUT_PATH"], "analytics")
+        # 無音の判定は音声分割と同じ設定を使う
+        self.silence_thresh_db = config.get("SILENCE_THRESH_DB", -16)
+        self.min_silence_ms = config.get("MIN_SILENCE_MS", 500)
+
+    def energy_path(self, voice_path):
+        key = ResultCache.make_key("energy", *file_fingerprint(voice_path), ANALYSIS_FRAME_RATE, FRAME_MS)
+        return os.path.join(self.output_path, f"{key[:16]}.npy")
+
+    def decode_energy(self, voice_path):
+        """録音をデコードしながら、フレームごとの音量(dBFS)を求める。"""
+        windows = decode_pcm_windows(voice_path, ANALYSIS_FRAME_RATE, 1, DECODE_WINDOW_MS)
+        energies = [
+            frame_energy_dbfs(pcm_to_array(data, UPLOAD_SAMPLE_WIDTH), ANALYSIS_FRAME_RATE, 1, UPLOAD_SAMPLE_WIDTH)
+            for data in windows
+        ]
+        return np.concatenate(energies).astype(np.float32) if energies else np.empty(0, dtype=np.float32)
+
+    def energy(self, voice_path):
+        """フレームごとの音量。保存したものがあればデコードしない。"""
+        path = self.energy_path(voice_path)
+        if os.path.exists(path):
+            return np.load(path, mmap_mode="r")
+        with span("analytics_decode", path=voice_path) as decode_span:
+            energy_db = self.decode_energy(voice_path)
+            decode_span.set(frames=len(energy_db))
+        os.makedirs(self.output_path, exist_ok=True)
+        # 書き込み中に終了しても壊れたファイルを読まないよう、一時ファイルに書いてから置き換える
+        fd, tmp_path = tempfile.mkstemp(dir=self.output_path, prefix=".", suffix=".npy")
+        with os.fdopen(fd, "wb") as f:
+            np.save(f, energy_db)
+        os.replace(tmp_path, path)
+        return energy_db
+
+    def activity(self, voice_path=None):
+        """録音の音量と発話の有無。"""
+        energy_db = self.energy(voice_path or self.voice_path)
+        return MeetingActivity(
+            energy_db,
+            mean_dbfs(energy_db) + self.silence_thresh_db,
+            self.min_silence_ms,
+        )
+
+    def timeline(self, voice_path=None, max_points=MAX_POINTS):
+        """録音のタイムラインの図を作る。"""
+        voice_path = voice_path or self.voice_path
+        activity = self.activity(voice_path)
+        with span("timeline", path=voice_path, frames=len(activity.energy_db), max_points=max_points):
+            return timeline_figure(activity, title=os.path.basename(voice_path), max_points=max_points)
+
+
+if __name__ == "__main__":
+
+    try:
+        from modules.plotly.config import PlotlyConfig
+
+        analytics = MeetingAnalytics()
+        activity = analytics.activity()
+        print(f"発話の割合: {activity.speech_ratio():.1%}")
+        PlotlyConfig.save_png(analytics.timeline(), "timeline")
+    except Exception as e:
+        print("Error:", e)
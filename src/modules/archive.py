@@ -0,0 +1,452 @@
+import contextlib
+import os
+import sqlite3
+import time
+
+from modules.cache import ResultCache, file_fingerprint
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS meetings (
+    id INTEGER PRIMARY KEY,
+    fingerprint TEXT NOT NULL UNIQUE,
+    voice_path TEXT NOT NULL,
+    title TEXT NOT NULL,
+    recorded_at REAL NOT NULL,
+    archived_at REAL NOT NULL,
+    transcript_path TEXT,
+    minutes TEXT
+);
+CREATE TABLE IF NOT EXISTS segments (
+    id INTEGER PRIMARY KEY,
+    meeting_id INTEGER NOT NULL REFERENCES meetings(id) ON DELETE CASCADE,
+    start_ms INTEGER,
+    end_ms INTEGER,
+    text TEXT NOT NULL,
+    -- 会議の中での順番(0から)。ページ単位の読み出しを会議の長さによらず範囲の検索にする
+    position INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS segments_meeting ON segments(meeting_id, start_ms);
+
+-- 日本語は単語の区切りがないので、3文字ずつに区切るtrigramで索引を作る
+CREATE VIRTUAL TABLE IF NOT EXISTS segments_fts USING fts5(
+    text, content='segments', content_rowid='id', tokenize='trigram'
+);
+CREATE VIRTUAL TABLE IF NOT EXISTS minutes_fts USING fts5(
+    minutes, content='meetings', content_rowid='id', tokenize='trigram'
+);
+
+-- 「予算」「次回」のような2文字の語はtrigramでは探せないので、2文字ずつに区切った語(bigrams)の索引も作る
+CREATE VIRTUAL TABLE IF NOT EXISTS segments_bigram USING fts5(text, content='', tokenize='unicode61');
+CREATE VIRTUAL TABLE IF NOT EXISTS minutes_bigram USING fts5(minutes, content='', tokenize='unicode61');
+
+CREATE TRIGGER IF NOT EXISTS segments_ai AFTER INSERT ON segments BEGIN
+    INSERT INTO segments_fts(rowid, text) VALUES (new.id, new.text);
+    INSERT INTO segments_bigram(rowid, text) VALUES (new.id, bigrams(new.text));
+END;
+CREATE TRIGGER IF NOT EXISTS segments_ad AFTER DELETE ON segments BEGIN
+    INSERT INTO segments_fts(segments_fts, rowid, text) VALUES ('delete', old.id, old.text);
+    INSERT INTO segments_bigram(segments_bigram, rowid, text) VALUES ('delete', old.id, bigrams(old.text));
+END;
+CREATE TRIGGER IF NOT EXISTS meetings_ai AFTER INSERT ON meetings BEGIN
+    INSERT INTO minutes_fts(rowid, minutes) VALUES (new.id, new.minutes);
+    INSERT INTO minutes_bigram(rowid, minutes) VALUES (new.id, bigrams(new.minutes));
+END;
+CREATE TRIGGER IF NOT EXISTS meetings_ad AFTER DELETE ON meetings BEGIN
+    INSERT INTO minutes_fts(minutes_fts, rowid, minutes) VALUES ('delete', old.id, old.minutes);
+    INSERT INTO minutes_bigram(minutes_bigram, rowid, minutes) VALUES ('delete', old.id, bigrams(old.minutes));
+END;
+CREATE TRIGGER IF NOT EXISTS meetings_au AFTER UPDATE OF minutes ON meetings BEGIN
+    INSERT INTO minutes_fts(minutes_fts, rowid, minutes) VALUES ('delete', old.id, old.minutes);
+    INSERT INTO minutes_fts(rowid, minutes) VALUES (new.id, new.minutes);
+    INSERT INTO minutes_bigram(minutes_bigram, rowid, minutes) VALUES ('delete', old.id, bigrams(old.minutes));
+    INSERT INTO minutes_bigram(rowid, minutes) VALUES (new.id, bigrams(new.minutes));
+END;
+"""
+# position の列がない以前のアーカイブにも作れるよう、列を追加してから作る索引
+INDEXES = """
+CREATE UNIQUE INDEX IF NOT EXISTS segments_position ON segments(meeting_id, position);
+"""
+# スキーマのバージョン(PRAGMA user_version)。1でbigramの索引、2で position の列を追加した
+SCHEMA_VERSION = 2
+
+# trigramの索引で検索できる最短の語の長さ。これより短い語を含む検索はbigramの索引で行う
+MIN_MATCH_CHARS = 3
+# bigramの索引で検索できる最短の語の長さ。1文字の語を含む検索は索引を使わずに LIKE で行う
+MIN_BIGRAM_CHARS = 2
+
+SEGMENT_SEARCH_SQL = (
+    "SELECT m.title, m.voice_path, m.recorded_at, 'transcript' AS kind, s.start_ms, s.end_ms,"
+    " {snippet} AS snippet, bm25({table}) AS rank"
+    " FROM {table} JOIN segments s ON s.id = {table}.rowid JOIN meetings m ON m.id = s.meeting_id"
+    " WHERE {table} MATCH :match ORDER BY rank LIMIT :limit"
+)
+MINUTES_SEARCH_SQL = (
+    "SELECT m.title, m.voice_path, m.recorded_at, 'minutes' AS kind, NULL AS start_ms, NULL AS end_ms,"
+    " {snippet} AS snippet, bm25({table}) AS rank"
+    " FROM {table} JOIN meetings m ON m.id = {table}.rowid"
+    " WHERE {table} MATCH :match ORDER BY rank LIMIT :limit"
+)
+
+
+def bigrams(text):
+    """文字列を2文字ずつずらして区切り、空白でつなげる(「予算案」→「予算 算案」)。"""
+    if text is None:
+        return None
+    return " ".join(text[i:i + 2] for i in range(max(len(text) - 1, 1)))
+
+
+def phrase(term):
+    """語をFTS5のフレーズにする(演算子として解釈されないよう引用符で囲む)。"""
+    return '"' + term.replace('"', '""') + '"'
+
+
+def match_terms(terms):
+    """
+    検索語から、使う索引とFTS5の検索式を決める。
+
+    Returns:
+        tuple[str | None, str | None]: "trigram" / "bigram" と検索式。1文字の語を含む場合は (None, None)。
+    """
+    shortest = min(len(term) for term in terms)
+    if shortest >= MIN_MATCH_CHARS:
+        return "trigram", " ".join(phrase(term) for term in terms)
+    if shortest >= MIN_BIGRAM_CHARS:
+        # 語の中の2文字ずつの並びが続けて現れる箇所を探す
+        return "bigram", " ".join(phrase(bigrams(term)) for term in terms)
+    return None, None
+
+
+def like_params(terms):
+    """LIKE で部分一致を探すための :term0, :term1, ... の値を返す。"""
+    params = {}
+    for i, term in enumerate(terms):
+        escaped = term.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+        params[f"term{i}"] = f"%{escaped}%"
+    return params
+
+
+def like_conditions(column, terms):
+    """column が全ての語を含む条件(like_params の値を使う)。"""
+    return " AND ".join(f"{column} LIKE :term{i} ESCAPE '\\'" for i in range(len(terms)))
+
+
+def merge_ranked(results, limit):
+    """
+    表ごとに検索した結果を1つの順位にまとめる。
+
+    bm25 のスコアは表ごとに尺度が違うので、それぞれの表の最良のスコアとの比(1が最良)にしてから並べる。
+    """
+    merged = []
+    for rows in results:
+        if not rows:
+            continue
+        best = rows[0]["rank"]
+        for row in rows:
+            row["score"] = row["rank"] / best if best else 1.0
+        merged += rows
+    merged.sort(key=lambda row: row["score"], reverse=True)
+    return merged[:limit]
+
+
+def excerpt(text, term, width=24):
+    """text の中で term が最初に現れる箇所の前後 width 文字を返す。"""
+    position = text.find(term)
+    if position < 0:
+        return text[:width * 2]
+    start = max(position - width, 0)
+    end = position + len(term) + width
+    return (
+        ("…" if start > 0 else "")
+        + text[start:position] + "[" + term + "]" + text[position + len(term):end]
+        + ("…" if end < len(text) else "")
+    )
+
+
+def format_ms(ms):
+    """ミリ秒を h:mm:ss の形式にする。"""
+    if ms is None:
+        return "-"
+    seconds = ms // 1000
+    return f"{seconds // 3600}:{seconds // 60 % 60:02d}:{seconds % 60:02d}"
+
+
+class MeetingArchive():
+    """
+    過去の会議の文字起こし(時刻付きのセグメント)と議事録を保存し、全文検索するSQLiteのアーカイブ。
+
+    会議は録音ファイル(パス・サイズ・更新時刻)で識別し、同じ録音を文字起こしし直した場合は置き換える。
+    接続は操作ごとに開くので、複数のスレッドから使える。
+    """
+
+    def __init__(self, path):
+        self.path = path
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with self.connect() as connection:
+            connection.executescript(SCHEMA)
+            version = connection.execute("PRAGMA user_version").fetchone()[0]
+            if version < 1:
+                # 以前のバージョンで作ったアーカイブには、すでにある会議のbigramの索引を作る
+                connection.execute("INSERT INTO segments_bigram(segments_bigram) VALUES ('delete-all')")
+                connection.execute("INSERT INTO minutes_bigram(minutes_bigram) VALUES ('delete-all')")
+                connection.execute(
+                    "INSERT INTO segments_bigram(rowid, text) SELECT id, bigrams(text) FROM segments"
+                )
+                connection.execute(
+                    "INSERT INTO minutes_bigram(rowid, minutes) SELECT id, bigrams(minutes) FROM meetings"
+                )
+            if version < 2:
+                columns = {row["name"] for row in connection.execute("PRAGMA table_info(segments)")}
+                if "position" not in columns:
+                    # すでにある会議のセグメントには、追加した順に番号を付ける
+                    connection.execute("ALTER TABLE segments ADD COLUMN position INTEGER NOT NULL DEFAULT 0")
+                    connection.execute(
+                        "UPDATE segments SET position = numbered.position FROM ("
+                        " SELECT id, ROW_NUMBER() OVER (PARTITION BY meeting_id ORDER BY id) - 1 AS position"
+                        " FROM segments"
+                        ") AS numbered WHERE segments.id = numbered.id"
+                    )
+            connection.executescript(INDEXES)
+            if version < SCHEMA_VERSION:
+                connection.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+
+    @contextlib.contextmanager
+    def connect(self):
+        connection = sqlite3.connect(self.path, timeout=30)
+        connection.row_factory = sqlite3.Row
+        # bigramの索引を更新するトリガーで使う
+        connection.create_function("bigrams", 1, bigrams, deterministic=True)
+        connection.execute("PRAGMA foreign_keys = ON")
+        # 書き込み中も他のプロセスから検索できるようにする
+        connection.execute("PRAGMA journal_mode = WAL")
+        try:
+            with connection:
+                yield connection
+        finally:
+            connection.close()
+
+    @staticmethod
+    def fingerprint(voice_path):
+        return ResultCache.make_key(*file_fingerprint(voice_path))
+
+    def add_meeting(self, voice_path, segments, transcript_path=None, minutes=None):
+        """
+        会議の文字起こしを保存する。同じ録音がすでにあれば置き換える。
+
+        Args:
+            voice_path (str): 録音ファイルのパス。
+            segments (Iterable[tuple[int | None, int | None, str]]): 録音の中での開始・終了時刻(ミリ秒)とテキスト。
+            transcript_path (str): 文字起こしを保存したファイルのパス。
+            minutes (str): 議事録。後から set_minutes で追加してもよい。
+
+        Returns:
+            int: 会議のID。
+        """
+        fingerprint = self.fingerprint(voice_path)
+        with self.connect() as connection:
+            connection.execute("DELETE FROM meetings WHERE fingerprint = ?", (fingerprint,))
+            meeting_id = connection.execute(
+                "INSERT INTO meetings"
+                " (fingerprint, voice_path, title, recorded_at, archived_at, transcript_path, minutes)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (
+                    fingerprint,
+                    os.path.abspath(voice_path),
+                    os.path.basename(voice_path),
+                    os.path.getmtime(voice_path),
+                    time.time(),
+                    transcript_path,
+                    minutes,
+                ),
+            ).lastrowid
+            connection.executemany(
+                "INSERT INTO segments (meeting_id, position, start_ms, end_ms, text) VALUES (?, ?, ?, ?, ?)",
+                (
+                    (meeting_id, position, *segment)
+                    for position, segment in enumerate(segment for segment in segments if segment[2])
+                ),
+            )
+        return meeting_id
+
+    def has_meeting(self, voice_path):
+        with self.connect() as connection:
+            row = connection.execute(
+                "SELECT 1 FROM meetings WHERE fingerprint = ?", (self.fingerprint(voice_path),)
+            ).fetchone()
+        return row is not None
+
+    def set_minutes(self, voice_path, minutes):
+        """
+        会議の議事録を保存する。
+
+        Returns:
+            bool: 録音がアーカイブにあり、保存できた場合は True。
+        """
+        with self.connect() as connection:
+            cursor = connection.execute(
+                "UPDATE meetings SET minutes = ? WHERE fingerprint = ?",
+                (minutes, self.fingerprint(voice_path)),
+            )
+        return cursor.rowcount > 0
+
+    def meetings(self):
+        """アーカイブにある会議を、録音が新しい順に返す。"""
+        with self.connect() as connection:
+            rows = connection.execute(
+                "SELECT m.id, m.title, m.voice_path, m.recorded_at, m.transcript_path,"
+                " m.minutes IS NOT NULL AS has_minutes, COUNT(s.id) AS segments, MAX(s.end_ms) AS duration_ms"
+                " FROM meetings m LEFT JOIN segments s ON s.meeting_id = m.id"
+                " GROUP BY m.id ORDER BY m.recorded_at DESC"
+            ).fetchall()
+        return [dict(row) for row in rows]
+
+    def segment_count(self, meeting_id):
+        """会議のセグメントの数を返す。"""
+        with self.connect() as connection:
+            # 最後のセグメントを索引で引く(COUNT は会議のセグメントを全て数える)
+            row = connection.execute(
+                "SELECT position FROM segments WHERE meeting_id = ? ORDER BY position DESC LIMIT 1", (meeting_id,)
+            ).fetchone()
+        return 0 if row is None else row[0] + 1
+
+    def segments(self, meeting_id, lo=0, hi=None):
+        """
+        会議のセグメントのうち、lo 番目から hi 番目まで(hi は含まない)を返す。
+
+        番号(position)の範囲で索引を引くので、会議の長さや何ページ目かによらず速い。
+
+        Returns:
+            list[tuple[int | None, int | None, str]]: 開始・終了時刻(ミリ秒)とテキスト。
+        """
+        sql = "SELECT start_ms, end_ms, text FROM segments WHERE meeting_id = ? AND position >= ?"
+        params = [meeting_id, lo]
+        if hi is not None:
+            sql += " AND position < ?"
+            params.append(hi)
+        with self.connect() as connection:
+            rows = connection.execute(f"{sql} ORDER BY position", params).fetchall()
+        return [tuple(row) for row in rows]
+
+    def segments_at(self, meeting_id, positions):
+        """
+        会議のセグメントのうち、番号が positions のものを番号の順に返す。
+
+        Returns:
+            list[tuple[int, int | None, int | None, str]]: 番号・開始・終了時刻(ミリ秒)とテキスト。
+        """
+        positions = [int(position) for position in positions]
+        if not positions:
+            return []
+        placeholders = ", ".join("?" * len(positions))
+        with self.connect() as connection:
+            rows = connection.execute(
+                "SELECT position, start_ms, end_ms, text FROM segments"
+                f" WHERE meeting_id = ? AND position IN ({placeholders}) ORDER BY position",
+                (meeting_id, *positions),
+            ).fetchall()
+        return [tuple(row) for row in rows]
+
+    def segment_at(self, meeting_id, ms):
+        """
+        会議の中で、時刻 ms を含むセグメント(なければ ms の後に始まる最初のセグメント)の番号を返す。
+
+        セグメントは開始時刻の順に並んでいるので、ms までに始まった最後のセグメントを索引で引く。
+        """
+        with self.connect() as connection:
+            row = connection.execute(
+                "SELECT position, end_ms FROM segments WHERE meeting_id = ? AND start_ms <= ?"
+                " ORDER BY start_ms DESC LIMIT 1",
+                (meeting_id, ms),
+            ).fetchone()
+        if row is None:
+            return 0
+        position, end_ms = row
+        # ms より前に始まったセグメントは、ms をまたいでいればその番号にする
+        return position if end_ms is None or end_ms > ms else position + 1
+
+    def search_segments(self, meeting_id, query):
+        """
+        会議のセグメントのうち、空白で区切った語をすべて含むものの番号を順に返す。
+
+        語の長さによる索引の使い分けは search と同じで、索引を使う場合は一致したセグメントだけを読む。
+        1文字の語を含む場合は会議のセグメントを全て調べる。
+
+        Returns:
+            list[int]: セグメントの番号。
+        """
+        terms = query.split()
+        if not terms:
+            return []
+        index, match = match_terms(terms)
+        if index is not None:
+            table = "segments_fts" if index == "trigram" else "segments_bigram"
+            sql = (
+                f"SELECT s.position FROM {table} JOIN segments s ON s.id = {table}.rowid"
+                f" WHERE {table} MATCH :match AND s.meeting_id = :meeting_id ORDER BY s.position"
+            )
+            params = {"match": match}
+        else:
+            sql = (
+                "SELECT position FROM segments"
+                f" WHERE meeting_id = :meeting_id AND {like_conditions('text', terms)} ORDER BY position"
+            )
+            params = like_params(terms)
+        with self.connect() as connection:
+            rows = connection.execute(sql, {"meeting_id": meeting_id, **params}).fetchall()
+        return [row[0] for row in rows]
+
+    def search(self, query, limit=10):
+        """
+        文字起こしと議事録を全文検索する。
+
+        空白で区切った語をすべて含むセグメント・議事録を、関連度の高い順に返す。
+        3文字以上の語はtrigram、2文字の語を含む場合はbigramの索引で探す。
+        1文字の語を含む場合は索引を使わずに部分一致で探し(会議の数に比例して遅くなる)、録音が新しい順に返す。
+
+        Returns:
+            list[dict]: 会議名・録音の日時・区間(ミリ秒)・該当箇所を含む結果。議事録の場合、区間は None。
+        """
+        terms = query.split()
+        if not terms:
+            return []
+        index, match = match_terms(terms)
+        with self.connect() as connection:
+            if index is not None:
+                if index == "trigram":
+                    tables = ("segments_fts", "minutes_fts")
+                    snippets = (
+                        "snippet(segments_fts, 0, '[', ']', '…', 24)",
+                        "snippet(minutes_fts, 0, '[', ']', '…', 24)",
+                    )
+                else:
+                    tables = ("segments_bigram", "minutes_bigram")
+                    snippets = ("s.text", "m.minutes")
+                params = {"match": match, "limit": limit}
+                rows = merge_ranked(
+                    [
+                        [
+                            dict(row)
+                            for row in connection.execute(sql.format(table=table, snippet=snippet), params).fetchall()
+                        ]
+                        for sql, table, snippet in zip((SEGMENT_SEARCH_SQL, MINUTES_SEARCH_SQL), tables, snippets)
+                    ],
+                    limit,
+                )
+            else:
+                sql = (
+                    "SELECT * FROM ("
+                    " SELECT m.title, m.voice_path, m.recorded_at, 'transcript' AS kind, s.start_ms, s.end_ms,"
+                    "  s.text AS snippet"
+                    " FROM segments s JOIN meetings m ON m.id = s.meeting_id"
+                    f" WHERE {like_conditions('s.text', terms)}"
+                    " UNION ALL"
+                    " SELECT m.title, m.voice_path, m.recorded_at, 'minutes', NULL, NULL, m.minutes"
+                    " FROM meetings m"
+                    f" WHERE {like_conditions('m.minutes', terms)}"
+                    ") ORDER BY recorded_at DESC, start_ms LIMIT :limit"
+                )
+                params = {"limit": limit, **like_params(terms)}
+                rows = [dict(row) for row in connection.execute(sql, params).fetchall()]
+        if index != "trigram":
+            for row in rows:
+                row["snippet"] = excerpt(row["snippet"], terms[0])
+        return rows
@@ -0,0 +1,244 @@
+import subprocess
+from dataclasses import dataclass
+
+import numpy as np
+
+# pydubが書き出すWAV(RIFF)ヘッダのバイト数
+WAV_HEADER_SIZE = 44
+# Whisper APIがそのまま受け付ける拡張子
+SUPPORTED_FORMATS = {"flac", "m4a", "mp3", "mp4", "mpeg", "mpga", "oga", "ogg", "wav", "webm"}
+# 録音として扱う拡張子(APIが受け付けない形式は再エンコードしてアップロードする)
+AUDIO_EXTENSIONS = SUPPORTED_FORMATS | {"aac", "aiff", "wma"}
+# アップロード用に書き出すときのサンプル幅(16bit)
+UPLOAD_SAMPLE_WIDTH = 2
+
+# 音量を計算するフレームの長さ(ミリ秒)
+FRAME_MS = 20
+# 一度に処理するフレーム数(float変換による一時メモリを抑えるため)
+BLOCK_FRAMES = 8192
+
+
+def pcm_to_array(raw_data, sample_width):
+    """
+    PCMのバイト列をNumPy配列に変換する(コピーなし)。
+
+    24bitは対応するdtypeがないため、上位16bitだけを取り出して扱う。
+    """
+    if sample_width == 3:
+        data = np.frombuffer(raw_data, dtype=np.uint8).reshape(-1, 3)
+        return data[:, 1:].copy().view("<i2").reshape(-1)
+    dtype = {1: np.uint8, 2: "<i2", 4: "<i4"}[sample_width]
+    return np.frombuffer(raw_data, dtype=dtype)
+
+
+def decode_pcm_windows(path, frame_rate, channels, window_ms, start_ms=None, duration_ms=None):
+    """
+    ffmpegのパイプから16bitのPCMを window_ms ずつ読み出すジェネレータ。
+
+    録音全体をメモリに展開しないので、長時間の録音でもメモリ使用量はウィンドウの長さで決まる。
+    start_ms, duration_ms を指定すると、その範囲だけをデコードする。
+
+    Yields:
+        bytes: インターリーブされたPCM。最後のウィンドウ以外は window_ms ちょうどの長さ。
+    """
+    command = ["ffmpeg", "-nostdin", "-loglevel", "error"]
+    if start_ms is not None:
+        command += ["-ss", f"{start_ms / 1000:.3f}"]
+    if duration_ms is not None:
+        command += ["-t", f"{duration_ms / 1000:.3f}"]
+    command += [
+        "-i", path,
+        "-f", "s16le", "-acodec", "pcm_s16le",
+        "-ac", str(channels), "-ar", str(frame_rate),
+        "-",
+    ]
+    window_bytes = int(frame_rate * window_ms / 1000) * channels * UPLOAD_SAMPLE_WIDTH
+    process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    try:
+        while True:
+            data = process.stdout.read(window_bytes)
+            if not data:
+                break
+            yield data
+    finally:
+        process.stdout.close()
+        if process.poll() is None:
+            # 途中で読むのをやめた場合はffmpegを止める
+            process.kill()
+        stderr = process.stderr.read().decode(errors="replace")
+        process.stderr.close()
+        if process.wait() not in (0, -9):
+            raise RuntimeError(f"ffmpeg failed to decode {path}: {stderr.strip()}")
+
+
+def live_decode_command(source, frame_rate, channels, input_format=None, idle_timeout_ms=None):
+    """
+    録音中のファイルや入力デバイスを16bitのPCMにデコードし続けるffmpegのコマンド。
+
+    input_format を指定すると source をその形式の入力(avfoundation / pulse などのデバイスや "-" の標準入力)として読む。
+    指定せず source がファイルなら、ファイルの末尾に達しても書き足されるのを待ちながら読み続け、
+    idle_timeout_ms の間書き足されなければ録音が終わったとみなして終了する。
+    """
+    command = ["ffmpeg", "-nostdin", "-loglevel", "error"]
+    if input_format is not None:
+        command += ["-f", input_format, "-i", source]
+    elif source == "-":
+        command += ["-i", "pipe:0"]
+    else:
+        command += ["-follow", "1", "-rw_timeout", str(int((idle_timeout_ms or 10000) * 1000)), "-i", f"file:{source}"]
+    command += [
+        "-f", "s16le", "-acodec", "pcm_s16le",
+        "-ac", str(channels), "-ar", str(frame_rate),
+        "-",
+    ]
+    return command
+
+
+def frame_energy_dbfs(samples, frame_rate, channels, sample_width, frame_ms=FRAME_MS):
+    """
+    フレームごとのRMSをdBFSで返す。
+
+    Args:
+        samples (np.ndarray): インターリーブされたPCMサンプル。
+        frame_rate (int): サンプリングレート。
+        channels (int): チャンネル数。
+        sample_width (int): 1サンプルのバイト数。
+        frame_ms (int): フレームの長さ(ミリ秒)。
+
+    Returns:
+        np.ndarray: 各フレームの音量(dBFS)。
+    """
+    frame_size = max(1, int(frame_rate * frame_ms / 1000)) * channels
+    n_frames = len(samples) // frame_size
+    # 8bitは符号なしなので中心を0に合わせる。24bitは pcm_to_array で16bitになっている
+    offset = 128.0 if sample_width == 1 else 0.0
+    bits = 16 if sample_width == 3 else 8 * sample_width
+    full_scale = float(2 ** (bits - 1))
+
+    energy = np.empty(n_frames, dtype=np.float32)
+    frames = samples[: n_frames * frame_size].reshape(n_frames, frame_size)
+    for i in range(0, n_frames, BLOCK_FRAMES):
+        block = frames[i : i + BLOCK_FRAMES].astype(np.float32) - offset
+        energy[i : i + BLOCK_FRAMES] = np.sqrt(np.mean(block * block, axis=1))
+    return 20 * np.log10(np.maximum(energy, 1e-6) / full_scale)
+
+
+def mean_dbfs(energy_db):
+    """フレームごとの音量から全体の平均音量(dBFS)を求める。"""
+    if len(energy_db) == 0:
+        return -np.inf
+    return float(10 * np.log10(np.mean(10 ** (energy_db.astype(np.float64) / 10))))
+
+
+def detect_silences(energy_db, silence_thresh_db, min_silence_ms, frame_ms=FRAME_MS):
+    """
+    閾値より静かな区間が min_silence_ms 以上続く箇所を探す。
+
+    Returns:
+        np.ndarray: 無音区間の (開始ミリ秒, 終了ミリ秒) を並べた (n, 2) の配列。
+    """
+    silent = np.concatenate(([0], (energy_db < silence_thresh_db).astype(np.int8), [0]))
+    edges = np.diff(silent)
+    starts = np.flatnonzero(edges == 1)
+    ends = np.flatnonzero(edges == -1)
+    keep = (ends - starts) * frame_ms >= min_silence_ms
+    return np.stack((starts[keep], ends[keep]), axis=1).astype(np.int64) * frame_ms
+
+
+def plan_chunks(duration_ms, max_chunk_ms, silences, drop_silence_ms, keep_silence_ms, min_chunk_ms=1000):
+    """
+    無音の位置をもとにチャンク境界を決める。
+
+    drop_silence_ms 以上の無音は前後 keep_silence_ms だけ残して取り除き、
+    残った有音区間を max_chunk_ms 以下になるよう、なるべく無音の中央で区切る。
+
+    Returns:
+        list[tuple[int, int]]: 元の音声でのチャンクの (開始ミリ秒, 終了ミリ秒)。
+    """
+    silences = np.asarray(silences, dtype=np.int64).reshape(-1, 2)
+
+    # 長い無音を取り除いた有音区間
+    long_silences = silences[(silences[:, 1] - silences[:, 0]) >= drop_silence_ms]
+    regions = []
+    cursor = 0
+    for silence_start, silence_end in long_silences.tolist():
+        # 先頭・末尾の無音は前後に残す必要がない
+        if silence_start > cursor:
+            regions.append((cursor, min(silence_start + keep_silence_ms, duration_ms)))
+        cursor = duration_ms if silence_end >= duration_ms else max(silence_end - keep_silence_ms, cursor)
+    if cursor < duration_ms:
+        regions.append((cursor, duration_ms))
+
+    # 境界の候補は無音区間の中央
+    midpoints = (silences[:, 0] + silences[:, 1]) // 2
+    midpoint_list = midpoints.tolist()
+
+    chunks = []
+    for region_start, region_end in regions:
+        start = region_start
+        while region_end - start > max_chunk_ms:
+            limit = start + max_chunk_ms
+            lo = np.searchsorted(midpoints, start + min_chunk_ms, side="right")
+            hi = np.searchsorted(midpoints, limit, side="right")
+            # 上限までに無音がなければ上限の位置で切る
+            end = midpoint_list[hi - 1] if hi > lo else limit
+            chunks.append((start, end))
+            start = end
+        if region_end - start > 0:
+            chunks.append((start, region_end))
+    return chunks
+
+
+def parse_bitrate(bitrate):
+    """"32k" のようなビットレート表記をbpsに変換する。"""
+    bitrate = str(bitrate).strip().lower()
+    if bitrate.endswith("k"):
+        return int(float(bitrate[:-1]) * 1000)
+    return int(bitrate)
+
+
+@dataclass(frozen=True)
+class EncodingProfile:
+    """
+    アップロードするチャンクのエンコード設定。
+
+    音声認識には16kHzモノラルで十分なので、ダウンミックスとリサンプリングをしてから
+    圧縮形式で書き出すことで、1リクエストに収まる録音時間を伸ばす。
+    """
+    format: str = "mp3"
+    channels: int = 1
+    frame_rate: int = 16000
+    bitrate: str | None = "32k"
+    codec: str | None = None
+
+    @property
+    def lossless(self):
+        return self.format in ("wav", "flac")
+
+    def bytes_per_ms(self):
+        """書き出し後の1ミリ秒あたりのバイト数(上限)。"""
+        if self.lossless:
+            # FLACは非圧縮のPCMを超えないものとして扱う
+            return self.frame_rate * self.channels * UPLOAD_SAMPLE_WIDTH / 1000
+        return parse_bitrate(self.bitrate) / 8 / 1000
+
+    def max_chunk_ms(self, max_size):
+        """max_size バイトに収まるチャンクの最大長(ミリ秒)。"""
+        frame_width = self.channels * UPLOAD_SAMPLE_WIDTH
+        if self.format == "wav":
+            # ヘッダとミリ秒→フレームの丸め誤差の分だけ差し引けば正確に求まる
+            budget = max_size - WAV_HEADER_SIZE - frame_width
+        else:
+            # コンテナのヘッダやフレーム境界の誤差を見込んで余裕を持たせる
+            budget = max_size * 0.95 - 64 * 1024
+        return int(budget // self.bytes_per_ms())
+
+    def export(self, audio, path):
+        """ダウンミックス・リサンプリングしてから書き出す。"""
+        audio = audio.set_channels(self.channels).set_frame_rate(self.frame_rate).set_sample_width(UPLOAD_SAMPLE_WIDTH)
+        kwargs = {"format": self.format}
+        if self.codec:
+            kwargs["codec"] = self.codec
+        if self.bitrate and not self.lossless:
+            kwargs["bitrate"] = self.bitrate
+        audio.export(path, **kwargs)
@@ -0,0 +1,145 @@
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+
+
+def file_fingerprint(path):
+    """
+    ファイルのパス・サイズ・更新時刻を返す。
+
+    大きな録音でも中身を読まずに、前回から変わったかどうかを判定するために使う。
+    """
+    stat = os.stat(path)
+    return os.path.abspath(path), stat.st_size, stat.st_mtime_ns
+
+
+class ResultCache():
+    """
+    APIの結果を保存するディスク上のキャッシュ。
+
+    キーは入力内容のハッシュで、値は文字列。合計サイズが max_bytes を超えたら、
+    最後に使われたのが古いもの(ファイルのアクセス時刻)から順に削除する。
+    ttl_seconds を指定すると、作成(ファイルの更新時刻)からその秒数を過ぎたものは使わない。
+    """
+
+    def __init__(self, directory, max_bytes, ttl_seconds=None):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self.hits = 0
+        self.misses = 0
+        # stats.json に反映済みのヒット数・ミス数
+        self._saved = {"hits": 0, "misses": 0}
+        self._lock = threading.Lock()
+        os.makedirs(self.directory, exist_ok=True)
+        self._size = sum(size for _, _, size in self._entries())
+
+    @staticmethod
+    def make_key(*parts):
+        """bytes または str を順番に連結したもののハッシュをキーにする。"""
+        digest = hashlib.sha256()
+        for part in parts:
+            data = part if isinstance(part, bytes) else str(part).encode("utf-8")
+            # 区切りが曖昧にならないよう長さも含める
+            digest.update(len(data).to_bytes(8, "little"))
+            digest.update(data)
+        return digest.hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.directory, key[:2], key)
+
+    def _entries(self):
+        for root, _, files in os.walk(self.directory):
+            for name in files:
+                if name == "stats.json" or name.startswith("."):
+                    continue
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                yield path, stat.st_atime, stat.st_size
+
+    def get(self, key):
+        """キャッシュがあれば値を返す。なければ None を返す。"""
+        path = self._path(key)
+        value = None
+        try:
+            stat = os.stat(path)
+            created = stat.st_mtime
+            if self.ttl_seconds is not None and time.time() - created > self.ttl_seconds:
+                # 期限切れのものは削除する
+                os.remove(path)
+                with self._lock:
+                    self._size -= stat.st_size
+            else:
+                with open(path, "r", encoding="utf-8") as f:
+                    value = f.read()
+                # LRUのために最終利用時刻(アクセス時刻)を更新する。更新時刻は作成時刻のまま残す
+                os.utime(path, (time.time(), created))
+        except FileNotFoundError:
+            pass
+        with self._lock:
+            if value is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return value
+
+    def set(self, key, value):
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # 書き込み途中のファイルが読まれないよう、一時ファイルに書いてから置き換える
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix=".")
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            f.write(value)
+        previous = os.path.getsize(path) if os.path.exists(path) else 0
+        os.replace(tmp_path, path)
+        with self._lock:
+            self._size += os.path.getsize(path) - previous
+            if self._size > self.max_bytes:
+                self._evict()
+
+    def _evict(self):
+        entries = sorted(self._entries(), key=lambda entry: entry[1])
+        self._size = sum(size for _, _, size in entries)
+        for path, _, size in entries:
+            if self._size <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            self._size -= size
+
+    @property
+    def stats(self):
+        """このインスタンスでのヒット数・ミス数と、これまでの累計。"""
+        total = self._load_stats()
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "total_hits": total["hits"] + self.hits - self._saved["hits"],
+            "total_misses": total["misses"] + self.misses - self._saved["misses"],
+            "size_bytes": self._size,
+        }
+
+    def _load_stats(self):
+        try:
+            with open(os.path.join(self.directory, "stats.json"), "r") as f:
+                return json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return {"hits": 0, "misses": 0}
+
+    def save_stats(self):
+        """累計のヒット数・ミス数を stats.json に保存する。"""
+        with self._lock:
+            total = self._load_stats()
+            total["hits"] += self.hits - self._saved["hits"]
+            total["misses"] += self.misses - self._saved["misses"]
+            with open(os.path.join(self.directory, "stats.json"), "w") as f:
+                json.dump(total, f)
+            self._saved = {"hits": self.hits, "misses": self.misses}
@@ -0,0 +1,208 @@
+import collections
+import functools
+import logging
+import re
+import time
+from dataclasses import dataclass
+
+# 文の区切り。区切りの記号は直前の文に含める(英語の "." は、後ろに空白か行末が続く場合だけ区切りとみなす)
+SENTENCE_PATTERN = re.compile(r"(?:[^。！？!?.\n]|\.(?!\s|$))+[。！？!?.]*|[。！？!?.]+")
+# 同じ語句が3回以上続く、whisperによくある繰り返し(数字だけの並びは対象にしない)
+REPEAT_PATTERN = re.compile(r"(\D{2,20}?)\1{2,}")
+# 重複の判定では句読点・空白を無視する
+NORMALIZE_PATTERN = re.compile(r"[\s、。，．,.！？!?「」『』()（）…・ー〜~]+")
+# 英数字どうしの文をつなぐときは空白を入れる
+ASCII_WORD_END = re.compile(r"[\x21-\x7e]$")
+# これより短い文は、直前の文と同じ場合だけ重複とみなす(「はい。」などの相づちは離れて何度も現れるため)
+DEDUPE_MIN_CHARS = 5
+
+
+@functools.cache
+def tokenizer(model_name):
+    """
+    モデルのトークナイザーを返す。tiktoken がない場合は None を返す。
+
+    モデル名から分からない場合は、最近のモデルが使う o200k_base を使う。
+    """
+    try:
+        import tiktoken
+    except ImportError:
+        # 依存関係に入っているが、入っていない環境では compaction スパンのトークン数も見積もりになる
+        logging.warning("tiktoken が見つからないため、%s のトークン数はバイト数から見積もります", model_name)
+        return None
+    try:
+        return tiktoken.encoding_for_model(model_name)
+    except KeyError:
+        return tiktoken.get_encoding("o200k_base")
+
+
+def count_tokens(text, model_name):
+    """モデルのトークン数を数える。tiktoken がない場合は estimate_tokens で見積もる。"""
+    encoding = tokenizer(model_name)
+    if encoding is None:
+        from modules.summary import estimate_tokens
+
+        return estimate_tokens(text)
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+@dataclass
+class CompactionReport:
+    """圧縮の前後のトークン数と、取り除いたものの件数。"""
+    tokens_before: int = 0
+    tokens_after: int = 0
+    repeats: int = 0
+    fillers: int = 0
+    hallucinations: int = 0
+    duplicates: int = 0
+
+    @property
+    def saved_tokens(self):
+        return self.tokens_before - self.tokens_after
+
+
+def join_sentences(sentences):
+    """文をつなげて1行にする。英語の文の間には空白を入れる。"""
+    line = sentences[0]
+    for sentence in sentences[1:]:
+        if ASCII_WORD_END.search(line) and sentence[0].isascii():
+            line += " "
+        line += sentence
+    return line
+
+
+class CompactionStream():
+    """
+    文字起こしを先頭から少しずつ受け取って圧縮する。
+
+    直近の文を覚えておくので、チャンクの境界で重複した文も取り除ける。
+    """
+
+    def __init__(self, compactor):
+        self.compactor = compactor
+        self.recent = collections.deque(maxlen=compactor.dedupe_window)
+        self.report = CompactionReport()
+        # 圧縮にかかった時間の合計(秒)
+        self.seconds = 0.0
+
+    def feed(self, text):
+        """text を圧縮して返す。行の区切りは保つ。"""
+        start = time.perf_counter()
+        compactor = self.compactor
+        report = self.report
+        lines = []
+        for line in text.split("\n"):
+            sentences = []
+            for sentence in SENTENCE_PATTERN.findall(line):
+                sentence, repeats = REPEAT_PATTERN.subn(r"\1", sentence)
+                report.repeats += repeats
+                sentence, fillers = compactor.filler_pattern.subn("", sentence)
+                report.fillers += fillers
+                sentence = sentence.strip()
+                key = NORMALIZE_PATTERN.sub("", sentence)
+                if not key:
+                    continue
+                if key in compactor.hallucinations:
+                    report.hallucinations += 1
+                    continue
+                if (self.recent and self.recent[-1] == key) or (len(key) >= DEDUPE_MIN_CHARS and key in self.recent):
+                    report.duplicates += 1
+                    continue
+                self.recent.append(key)
+                sentences.append(sentence)
+            if sentences:
+                lines.append(join_sentences(sentences))
+        compacted = "\n".join(lines)
+        report.tokens_before += compactor.count_tokens(text)
+        report.tokens_after += compactor.count_tokens(compacted)
+        self.seconds += time.perf_counter() - start
+        return compacted
+
+
+class TranscriptCompactor():
+    """
+    要約の前に文字起こしを圧縮する。
+
+    whisperの繰り返し(同じ語句の連続)をまとめ、フィラー(えーと、あの、など)と
+    無音部分に現れる定型文(ご視聴ありがとうございました、など)を取り除き、
+    チャンクの境界などで重複した文を取り除く。
+    PROMPT_TOKEN_BUDGET は1回のプロンプトに送る文字起こしの上限で、超えるプロンプトは fit_budget で収める。
+    """
+
+    def __init__(self, model_name, fillers=(), hallucinations=(), dedupe_window=8, token_budget=None):
+        self.model_name = model_name
+        self.fillers = tuple(fillers)
+        self.hallucinations = frozenset(NORMALIZE_PATTERN.sub("", phrase) for phrase in hallucinations)
+        self.dedupe_window = dedupe_window
+        self.token_budget = token_budget
+        # 文頭か読点・空白の後にあり、読点・空白が続くか文末にあるフィラーだけを取り除く
+        # (「あの本」の「あの」のような、言葉の一部は残す)
+        words = "|".join(re.escape(filler) for filler in sorted(self.fillers, key=len, reverse=True))
+        self.filler_pattern = re.compile(
+            rf"(?<![^\s、,])(?:{words})ー*(?:[、,\s]+|(?=[。！？!?.]|$))" if words else r"(?!)"
+        )
+
+    @classmethod
+    def from_config(cls, config, model_name):
+        return cls(
+            model_name,
+            fillers=config.get("FILLERS", []),
+            hallucinations=config.get("HALLUCINATION_PHRASES", []),
+            dedupe_window=config.get("DEDUPE_WINDOW", 8),
+            token_budget=config.get("PROMPT_TOKEN_BUDGET"),
+        )
+
+    def settings(self):
+        """圧縮の結果に影響する設定。"""
+        return {
+            "fillers": self.fillers,
+            "hallucinations": sorted(self.hallucinations),
+            "dedupe_window": self.dedupe_window,
+            "token_budget": self.token_budget,
+        }
+
+    def count_tokens(self, text):
+        return count_tokens(text, self.model_name)
+
+    def stream(self):
+        return CompactionStream(self)
+
+    def fit_budget(self, text, budget=None):
+        """
+        トークン数が budget(省略時は token_budget)を超える場合、短い文(相づちなど)から順に取り除いて収める。
+
+        1回のプロンプトに送る文字起こしに使う。すべての文を取り除くことはせず、最も長い文は残す。
+
+        Returns:
+            tuple[str, int]: 収めた文字起こしと、取り除いた文の数。
+        """
+        budget = self.token_budget if budget is None else budget
+        if budget is None:
+            return text, 0
+        excess = self.count_tokens(text) - budget
+        if excess <= 0:
+            return text, 0
+        lines = [SENTENCE_PATTERN.findall(line) for line in text.split("\n")]
+        sentences = [(i, j, sentence) for i, line in enumerate(lines) for j, sentence in enumerate(line)]
+        dropped = set()
+        # 最も長い文は残す
+        for i, j, sentence in sorted(sentences, key=lambda item: len(item[2]))[:-1]:
+            if excess <= 0:
+                break
+            dropped.add((i, j))
+            excess -= self.count_tokens(sentence)
+        fitted = "\n".join(
+            "".join(sentence for j, sentence in enumerate(line) if (i, j) not in dropped)
+            for i, line in enumerate(lines)
+        )
+        return "\n".join(line for line in fitted.split("\n") if line), len(dropped)
+
+    def compact(self, text):
+        """
+        文字起こし全体を圧縮する。PROMPT_TOKEN_BUDGET には収めない(分割して要約すれば収まる場合があるため)。
+
+        Returns:
+            tuple[str, CompactionReport]: 圧縮した文字起こしと、圧縮の結果。
+        """
+        stream = self.stream()
+        return stream.feed(text), stream.report
@@ -0,0 +1,97 @@
+import json
+import os
+import tempfile
+
+from modules.cache import ResultCache, file_fingerprint
+
+
+class TranscriptionJournal():
+    """
+    文字起こしジョブのチャンクごとの進捗を記録するジャーナル。
+
+    録音ファイル(パス・サイズ・更新時刻)と分割の設定が同じであれば同じジャーナルを読み込むので、
+    途中で失敗・中断したジョブを再実行すると、完了していないチャンクだけを処理できる。
+    """
+
+    def __init__(self, output_path, voice_path, settings):
+        self.job_id = ResultCache.make_key(
+            *file_fingerprint(voice_path),
+            json.dumps(settings, sort_keys=True),
+        )[:16]
+        self.path = os.path.join(output_path, "jobs", f"{self.job_id}.json")
+        if os.path.exists(self.path):
+            with open(self.path, "r", encoding="utf-8") as f:
+                self.data = json.load(f)
+        else:
+            self.data = {
+                "voice_path": voice_path,
+                "settings": settings,
+                "split_completed": False,
+                "chunks": {},
+            }
+
+    @property
+    def split_completed(self):
+        """全チャンクの境界が記録済みかどうか。"""
+        return self.data["split_completed"]
+
+    def chunks(self):
+        """記録済みのチャンクをインデックス順に返す。"""
+        return [self.data["chunks"][key] for key in sorted(self.data["chunks"], key=int)]
+
+    def done_indices(self):
+        return {int(key) for key, entry in self.data["chunks"].items() if entry["status"] == "done"}
+
+    def text(self, index):
+        """完了済みのチャンクの文字起こし結果を返す。未完了なら None を返す。"""
+        entry = self.data["chunks"].get(str(index))
+        if entry is None or entry["status"] != "done":
+            return None
+        return entry["text"]
+
+    def segments(self, index):
+        """完了済みのチャンクの時刻付きのセグメントを返す。未完了なら None を返す。"""
+        entry = self.data["chunks"].get(str(index))
+        if entry is None or entry["status"] != "done":
+            return None
+        return [tuple(segment) for segment in entry["segments"]]
+
+    def add(self, chunk):
+        """チャンクの境界を記録する。すでに記録済みなら状態はそのまま。"""
+        if str(chunk.index) not in self.data["chunks"]:
+            self.data["chunks"][str(chunk.index)] = {
+                "index": chunk.index,
+                "start_ms": chunk.start_ms,
+                "end_ms": chunk.end_ms,
+                "status": "pending",
+                "text": None,
+                "segments": None,
+                "error": None,
+            }
+            self.save()
+
+    def record(self, chunk, status, text=None, segments=None, error=None):
+        """チャンクの状態("done" / "failed")と結果を記録する。"""
+        entry = self.data["chunks"][str(chunk.index)]
+        entry.update(status=status, text=text, segments=segments, error=error)
+        self.save()
+
+    def mark_split_completed(self):
+        self.data["split_completed"] = True
+        self.save()
+
+    def failed(self):
+        return [entry for entry in self.chunks() if entry["status"] != "done"]
+
+    def save(self):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        # 書き込み中に終了してもジャーナルが壊れないよう、一時ファイルに書いてから置き換える
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(self.path), prefix=".")
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(self.data, f, ensure_ascii=False)
+        os.replace(tmp_path, self.path)
+
+    def remove(self):
+        """ジョブが完了したらジャーナルを削除する。"""
+        if os.path.exists(self.path):
+            os.remove(self.path)
@@ -0,0 +1,302 @@
+import asyncio
+import datetime
+import os
+import time
+import wave
+
+import numpy as np
+
+from modules.archive import format_ms
+from modules.audio import (
+    FRAME_MS,
+    UPLOAD_SAMPLE_WIDTH,
+    detect_silences,
+    frame_energy_dbfs,
+    live_decode_command,
+    pcm_to_array,
+)
+from modules.progress import ProgressTracker
+from modules.runtime import get_runtime
+from modules.segments import SegmentStore
+from modules.telemetry import record, span
+
+# 書き込み中には読めない形式(録音の終わりに索引を書くもの)
+UNTAILABLE_FORMATS = {"m4a", "mp4", "mov", "3gp"}
+# ffmpegから一度に読む長さ
+READ_BLOCK_MS = 250
+
+
+def find_cut(energy_db, threshold_db, min_silence_ms, min_window_ms, max_window_ms, frame_ms=FRAME_MS):
+    """
+    バッファの先頭から区切るウィンドウの長さ(ミリ秒)を決める。
+
+    min_window_ms から max_window_ms までの最初の間(無音区間の中央)で区切る。
+    その範囲に間がなく、max_window_ms 以上たまっていれば max_window_ms の位置で区切り、
+    どちらでもなければ None を返す(まだ区切らない)。バッファは READ_BLOCK_MS ずつ伸びるので、
+    max_window_ms を超えていても、ウィンドウは max_window_ms より長くしない。
+    """
+    duration_ms = len(energy_db) * frame_ms
+    if duration_ms < min_window_ms:
+        return None
+    silences = detect_silences(energy_db, threshold_db, min_silence_ms, frame_ms)
+    midpoints = (silences[:, 0] + silences[:, 1]) // 2
+    candidates = midpoints[(midpoints >= min_window_ms) & (midpoints <= max_window_ms)]
+    if len(candidates):
+        return int(candidates[0])
+    if duration_ms >= max_window_ms:
+        return max_window_ms
+    return None
+
+
+class LiveTranscriber():
+    """
+    録音中のファイルや入力デバイスの音声を、間で区切ったウィンドウごとに文字起こしする。
+
+    ウィンドウは LIVE_MIN_WINDOW_SECONDS を過ぎてから最初の間で閉じ、間がなければ LIVE_MAX_WINDOW_SECONDS で閉じる。
+    閉じたウィンドウはすぐにアップロードし、先頭から順番が揃った分を文字起こしのファイルとセグメントのストアに追記するので、
+    録音が終わった時点で残っているのは最後のウィンドウの文字起こしだけになる。
+    入力デバイスから読む場合は、受け取った音声を OUTPUT_PATH/live/<開始日時>.wav にも保存する。
+    """
+
+    def __init__(self, speech_to_text=None):
+        self.speech_to_text = speech_to_text or get_runtime().speech_to_text
+        config = self.speech_to_text.config
+        self.min_window_ms = config.get("LIVE_MIN_WINDOW_SECONDS", 10) * 1000
+        # ウィンドウはアップロードできる大きさを超えないようにする
+        self.max_window_ms = min(
+            config.get("LIVE_MAX_WINDOW_SECONDS", 30) * 1000, self.speech_to_text.chunk_length_ms()
+        )
+        self.idle_timeout_ms = config.get("LIVE_IDLE_TIMEOUT_SECONDS", 10) * 1000
+        self.process = None
+        # 録音の保存先(ファイルを追いかける場合はそのファイル)。run を呼ぶと決まる
+        self.voice_path = None
+        # 文字起こしに失敗したウィンドウの (開始, 終了) ミリ秒。run を呼ぶと決まる
+        self.failed_windows = []
+
+    def stop(self):
+        """入力の読み込みを止める。読み込み済みの音声の文字起こしは続ける。"""
+        if self.process is not None and self.process.returncode is None:
+            self.process.terminate()
+
+    async def run(
+        self,
+        source,
+        transcription_path=None,
+        input_format=None,
+        on_text=None,
+        on_progress=None,
+        semaphore=None,
+    ):
+        """
+        音声を読み込みながら文字起こしする。入力が終わる(ファイルが書き足されなくなる、stop が呼ばれる)まで続ける。
+
+        終わったら録音ファイルの文字起こしとして、セグメントのストア・文字起こしのキャッシュ・アーカイブに保存するので、
+        後から同じ録音を指定すると文字起こしし直さずに使える。
+        失敗したウィンドウがあった場合は、欠けた文字起こしを録音の文字起こしとしては保存しない。
+        出力ファイルの先頭に欠けた区間の警告を書き、failed_windows に区間を残す。
+
+        Args:
+            source (str): 録音中のファイルのパス、input_format の入力(デバイス名など)、または標準入力("-")。
+            transcription_path (str): 出力ファイルのパス。省略時は OUTPUT_PATH/output.txt。
+            input_format (str): ffmpegの入力形式(avfoundation / pulse / alsa / dshow など)。
+            on_text (Callable[[AudioChunk, str], None]): 順番が揃ったウィンドウごとに呼ばれる関数。
+            on_progress (Callable[[ProgressEvent], None]): 指定するとウィンドウが終わるたびに進捗を送る。
+            semaphore (asyncio.Semaphore): APIリクエストの同時実行数を制限するセマフォ。省略時は MAX_CONCURRENCY。
+
+        Returns:
+            str: 文字起こし結果。
+        """
+        speech_to_text = self.speech_to_text
+        profile = speech_to_text.upload_encoding
+        live_dir = os.path.join(speech_to_text.output_path, "live")
+        os.makedirs(live_dir, exist_ok=True)
+        started = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
+        recorder = None
+        if input_format is None and source != "-":
+            extension = os.path.splitext(source)[1].lstrip(".").lower()
+            if extension in UNTAILABLE_FORMATS:
+                raise ValueError(
+                    f"録音中の {extension} ファイルは読めません。"
+                    f"wav / mp3 / ogg / flac などで録音してください: {source}"
+                )
+            self.voice_path = source
+        else:
+            self.voice_path = os.path.join(live_dir, f"{started}.wav")
+            recorder = wave.open(self.voice_path, "wb")
+            recorder.setnchannels(profile.channels)
+            recorder.setsampwidth(UPLOAD_SAMPLE_WIDTH)
+            recorder.setframerate(profile.frame_rate)
+        if transcription_path is None:
+            transcription_path = os.path.join(speech_to_text.output_path, "output.txt")
+        label = os.path.basename(self.voice_path)
+        # 録音中はファイルの更新時刻が変わり続けるので、録音が終わるまでは専用のストアに追記する
+        store = SegmentStore(os.path.join(live_dir, f"{started}_segments"))
+        store.clear()
+        if semaphore is None:
+            semaphore = asyncio.Semaphore(speech_to_text.max_concurrency)
+        tracker = ProgressTracker(label, "transcription", on_progress)
+
+        bytes_per_ms = profile.frame_rate * profile.channels * UPLOAD_SAMPLE_WIDTH // 1000
+
+        def to_index(ms):
+            return ms * profile.frame_rate // 1000 * profile.channels
+
+        chunks = {}
+        results = {}
+        # ウィンドウを閉じた時刻(文字起こしが追記されるまでの遅れの計測に使う)
+        closed_times = {}
+        text_list = []
+        failed = self.failed_windows = []
+        tasks = []
+        start = time.perf_counter()
+
+        with open(transcription_path, "w", encoding="utf-8") as output:
+
+            def flush_in_order():
+                while len(text_list) in results:
+                    index = len(text_list)
+                    text, segments = results.pop(index)
+                    text_list.append(text)
+                    if text:
+                        output.write(text if output.tell() == 0 else "\n" + text)
+                        output.flush()
+                    store.append(segments)
+                    # ウィンドウを閉じてから文字起こしが揃うまでの時間
+                    record("live_window", time.perf_counter() - closed_times.pop(index), chunk=index, chars=len(text))
+                    if on_text is not None and text:
+                        on_text(chunks[index], text)
+
+            async def worker(chunk):
+                try:
+                    async with semaphore:
+                        results[chunk.index] = await speech_to_text.transcribe_chunk(chunk)
+                except Exception as e:
+                    # 録音は止められないので、失敗したウィンドウは飛ばして続ける
+                    print(f"Error in chunk {chunk.path} ({chunk.start_ms}ms-): {e}")
+                    failed.append((chunk.start_ms, chunk.end_ms))
+                    results[chunk.index] = ("", [])
+                finally:
+                    os.remove(chunk.path)
+                    tracker.advance()
+                flush_in_order()
+
+            async def close_window(samples, start_ms, end_ms):
+                index = len(chunks)
+                chunk = await asyncio.to_thread(
+                    speech_to_text.export_chunk, index, self.voice_path, samples, start_ms, end_ms
+                )
+                chunks[index] = chunk
+                closed_times[index] = time.perf_counter()
+                tasks.append(asyncio.create_task(worker(chunk)))
+
+            command = live_decode_command(
+                source, profile.frame_rate, profile.channels, input_format, self.idle_timeout_ms
+            )
+            self.process = await asyncio.create_subprocess_exec(
+                *command,
+                stdout=asyncio.subprocess.PIPE,
+                stderr=asyncio.subprocess.PIPE,
+            )
+            buffer = np.empty(0, dtype=np.int16)
+            buffer_start_ms = 0
+            # 無音の閾値に使う、それまでに閉じたウィンドウの平均音量の累積値
+            power_sum, frame_count = 0.0, 0
+            remainder = b""
+            try:
+                while True:
+                    data = await self.process.stdout.read(READ_BLOCK_MS * bytes_per_ms)
+                    eof = not data
+                    # パイプからはサンプルの途中までしか届かないことがあるので、端数は次に回す
+                    data = remainder + data
+                    aligned = len(data) - len(data) % (UPLOAD_SAMPLE_WIDTH * profile.channels)
+                    data, remainder = data[:aligned], data[aligned:]
+                    if data:
+                        if recorder is not None:
+                            recorder.writeframes(data)
+                        buffer = np.concatenate((buffer, pcm_to_array(data, UPLOAD_SAMPLE_WIDTH)))
+                    while len(buffer):
+                        energy_db = frame_energy_dbfs(buffer, profile.frame_rate, profile.channels, UPLOAD_SAMPLE_WIDTH)
+                        power = 10 ** (energy_db.astype(np.float64) / 10)
+                        total = power_sum + float(power.sum())
+                        count = frame_count + len(power)
+                        threshold_db = (
+                            10 * np.log10(total / count) + speech_to_text.silence_thresh_db if total > 0 else 0.0
+                        )
+                        if eof:
+                            cut_ms = len(buffer) * 1000 // (profile.frame_rate * profile.channels)
+                        else:
+                            cut_ms = find_cut(
+                                energy_db,
+                                threshold_db,
+                                speech_to_text.min_silence_ms,
+                                self.min_window_ms,
+                                self.max_window_ms,
+                            )
+                            if cut_ms is None:
+                                break
+                        window_frames = min(cut_ms // FRAME_MS, len(energy_db))
+                        power_sum += float(power[:window_frames].sum())
+                        frame_count += window_frames
+                        samples = buffer[:to_index(cut_ms)]
+                        # 全体が閾値より静かなウィンドウはアップロードしない
+                        if window_frames and np.any(energy_db[:window_frames] >= threshold_db):
+                            await close_window(samples, buffer_start_ms, buffer_start_ms + cut_ms)
+                        buffer = buffer[to_index(cut_ms):].copy()
+                        buffer_start_ms += cut_ms
+                        if eof:
+                            break
+                    if eof:
+                        break
+                tracker.set_total(len(chunks))
+                stderr = (await self.process.stderr.read()).decode(errors="replace")
+                await self.process.wait()
+                if buffer_start_ms == 0 and not chunks:
+                    raise RuntimeError(f"ffmpeg failed to read {source}: {stderr.strip()}")
+                await asyncio.gather(*tasks)
+            finally:
+                if self.process.returncode is None:
+                    self.process.kill()
+                    await self.process.wait()
+                for task in tasks:
+                    task.cancel()
+                await asyncio.gather(*tasks, return_exceptions=True)
+                if recorder is not None:
+                    recorder.close()
+
+        texts = "\n".join(text for text in text_list if text)
+        record(
+            "live_transcription",
+            time.perf_counter() - start,
+            "error" if failed else "ok",
+            path=self.voice_path,
+            audio_ms=buffer_start_ms,
+            chunks=len(chunks),
+            failed_chunks=len(failed),
+            chars=len(texts),
+        )
+        if failed:
+            # 欠けた文字起こしをキャッシュやアーカイブに残すと、後から同じ録音を指定したときに文字起こしし直されない
+            warning = self.failure_warning()
+            print(f"Warning: {warning} 文字起こしのキャッシュとアーカイブには保存しません: {transcription_path}")
+            with open(transcription_path, "w", encoding="utf-8") as output:
+                output.write(f"{warning}\n\n{texts}")
+            return texts
+        store.mark_complete(voice_path=os.path.abspath(self.voice_path), chunks=len(chunks))
+        with span("archive", path=self.voice_path, segments=len(store)):
+            await asyncio.to_thread(self.finalize, store, texts, transcription_path)
+        return texts
+
+    def failure_warning(self):
+        """失敗したウィンドウの区間を挙げて、文字起こしが欠けていることを知らせる文を返す。"""
+        ranges = ", ".join(f"{format_ms(start)}-{format_ms(end)}" for start, end in sorted(self.failed_windows))
+        return f"※ 次の区間の文字起こしに失敗したため、この文字起こしは一部が欠けています: {ranges}"
+
+    def finalize(self, store, texts, transcription_path):
+        """録音が終わったファイルの文字起こしとして保存する。"""
+        speech_to_text = self.speech_to_text
+        segments = store.rows()
+        speech_to_text.segment_store(self.voice_path).replace(
+            segments, voice_path=os.path.abspath(self.voice_path), live=True
+        )
+        speech_to_text.cache.set(speech_to_text.transcript_key(self.voice_path), texts)
+        speech_to_text.archive.add_meeting(self.voice_path, segments, transcription_path)
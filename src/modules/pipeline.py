@@ -0,0 +1,256 @@
+import asyncio
+import os
+import time
+from dataclasses import asdict
+
+from modules.progress import ProgressTracker
+from modules.runtime import get_runtime
+from modules.summary import split_sections
+from modules.telemetry import record
+
+
+class MinutesPipeline():
+    """
+    文字起こしと議事録の作成を並行して進めるパイプライン。
+
+    文字起こしが先頭から順番に揃うたびに、SECTION_TOKENS 分たまったセクションから要点メモの作成を始める。
+    最後のチャンクの文字起こしが終わった時点で残っているのは、最後のセクションの要約とまとめ(reduce)だけになる。
+    どちらもイベントループ上で非同期に進めるので、複数の録音のパイプラインを同時に動かせる。
+    """
+
+    def __init__(self, speech_to_text=None, summary=None):
+        self.speech_to_text = speech_to_text or get_runtime().speech_to_text
+        self.summary = summary or get_runtime().summary
+
+    async def run(
+        self,
+        voice_path=None,
+        transcription_path=None,
+        on_delta=None,
+        use_cache=True,
+        on_progress=None,
+        semaphore=None,
+    ):
+        """
+        録音から文字起こしと議事録を作成する。
+
+        Args:
+            voice_path (str): 音声ファイルのパス。省略時は設定ファイルの VOICE_PATH。
+            transcription_path (str): 文字起こしの出力先。省略時は OUTPUT_PATH/output.txt。
+            on_delta (Callable[[str], None]): 指定すると議事録をストリーミングで生成し、差分ごとに呼ばれる。
+            use_cache (bool): False にすると前回の文字起こし・議事録を使わずに作り直す。
+            on_progress (Callable[[ProgressEvent], None]): 指定すると文字起こしと要約の進捗を送る。
+            semaphore (asyncio.Semaphore): 文字起こしのAPIリクエストの同時実行数を制限するセマフォ。
+                複数の録音で同じものを渡すと、全体で同時実行数を共有できる。
+
+        Returns:
+            tuple[str, str]: 文字起こしと議事録。
+        """
+        voice_path = voice_path or self.speech_to_text.voice_path
+
+        def transcribe(on_text):
+            return self.speech_to_text.atranscribe_audio_to_text(
+                voice_path,
+                transcription_path,
+                on_text=on_text,
+                semaphore=semaphore,
+                use_cache=use_cache,
+                on_progress=on_progress,
+            )
+
+        transcription, minutes = await self.summarize_while(
+            transcribe, os.path.basename(voice_path), on_delta, use_cache, on_progress
+        )
+        await asyncio.to_thread(self.speech_to_text.archive.set_minutes, voice_path, minutes)
+        return transcription, minutes
+
+    async def run_live(
+        self,
+        source,
+        transcription_path=None,
+        input_format=None,
+        on_text=None,
+        on_delta=None,
+        on_note=None,
+        on_progress=None,
+        semaphore=None,
+        live=None,
+    ):
+        """
+        録音中のファイルや入力デバイスを文字起こししながら議事録を作成する。
+
+        セクションの要点メモは録音の途中から作り始めるので、録音が終わってから残っているのは
+        最後のウィンドウの文字起こしと、最後のセクションの要約とまとめだけになる。
+
+        Args:
+            source (str): 録音中のファイルのパス、または input_format の入力(LiveTranscriber.run を参照)。
+            transcription_path (str): 文字起こしの出力先。省略時は OUTPUT_PATH/output.txt。
+            input_format (str): ffmpegの入力形式(avfoundation / pulse など)。
+            on_text (Callable[[AudioChunk, str], None]): 順番が揃ったウィンドウの文字起こしごとに呼ばれる。
+            on_delta (Callable[[str], None]): 指定すると議事録をストリーミングで生成し、差分ごとに呼ばれる。
+            on_note (Callable[[int, str], None]): セクションの要点メモ(議事録の下書き)ができるたびに呼ばれる。
+            on_progress (Callable[[ProgressEvent], None]): 指定すると文字起こしと要約の進捗を送る。
+            semaphore (asyncio.Semaphore): 文字起こしのAPIリクエストの同時実行数を制限するセマフォ。
+            live (LiveTranscriber): 入力を途中で止めるために呼び出し元で作った LiveTranscriber。
+
+        Returns:
+            tuple[str, str]: 文字起こしと議事録。失敗したウィンドウがあった場合、議事録の先頭に警告を付ける。
+        """
+        from modules.live import LiveTranscriber
+
+        live = live or LiveTranscriber(self.speech_to_text)
+
+        def transcribe(on_section_text):
+            def on_window_text(chunk, text):
+                if on_text is not None:
+                    on_text(chunk, text)
+                on_section_text(chunk, text)
+
+            return live.run(
+                source,
+                transcription_path,
+                input_format,
+                on_text=on_window_text,
+                on_progress=on_progress,
+                semaphore=semaphore,
+            )
+
+        label = os.path.basename(source) if input_format is None else source
+        transcription, minutes = await self.summarize_while(transcribe, label, on_delta, True, on_progress, on_note)
+        if live.failed_windows:
+            # 欠けた文字起こしから作った議事録は、録音の議事録としてアーカイブに残さない
+            minutes = f"{live.failure_warning()}\n\n{minutes}"
+        else:
+            await asyncio.to_thread(self.speech_to_text.archive.set_minutes, live.voice_path, minutes)
+        return transcription, minutes
+
+    async def summarize_while(self, transcribe, label, on_delta, use_cache, on_progress, on_note=None):
+        """
+        文字起こしを進めながら、揃ったセクションから要点メモを作り、最後にまとめて議事録にする。
+
+        1回で要約するか分割して要約するかと、セクションの分け方は SummaryMinutes.asummarize_text と同じにするので、
+        同じ文字起こしからはどちらでも同じ議事録ができる(キャッシュのキーも同じ)。
+        文字起こしが1回のプロンプトに収まらなくなるまでは、セクションの要約を始めない。
+
+        Args:
+            transcribe (Callable[[Callable[[AudioChunk, str], None]], Awaitable[str]]):
+                チャンクの文字起こしが順番に揃うたびに on_text を呼び、最後に文字起こし全体を返すコルーチンを作る関数。
+
+        Returns:
+            tuple[str, str]: 文字起こしと議事録。
+        """
+        section_semaphore = asyncio.Semaphore(self.summary.summary_max_concurrency)
+        # セクションの総数は文字起こしが終わるまで分からない
+        tracker = ProgressTracker(label, "summary", on_progress)
+        section_tokens = self.summary.section_tokens
+        note_tasks = []
+        # 圧縮済みで、まだセクションとして送っていない文字起こし
+        pending = ""
+        # pending のUTF-8のバイト数。チャンクごとに pending 全体を数え直さないよう、足した分だけ増やす
+        pending_bytes = 0
+        # 1回のプロンプトに収まらなくなり、分割して要約すると決まったかどうか
+        split = False
+        # セクションに分ける前に、届いたチャンクから順に圧縮する
+        compaction = self.summary.compactor.stream() if self.summary.compactor is not None else None
+
+        async def summarize_section(index, section):
+            async with section_semaphore:
+                note = await self.summary.asummarize_section(index, section)
+            tracker.advance()
+            if on_note is not None:
+                on_note(index, note)
+            return note
+
+        def submit(section):
+            index = len(note_tasks) + 1
+            note_tasks.append(asyncio.create_task(summarize_section(index, section)))
+
+        def on_text(chunk, text):
+            nonlocal pending, pending_bytes, split
+            if compaction is not None:
+                text = compaction.feed(text)
+            if not text:
+                return
+            pending_bytes += len(text.encode("utf-8")) + (1 if pending else 0)
+            pending = f"{pending}\n{text}" if pending else text
+            # estimate_tokens(pending) と同じ値
+            pending_tokens = pending_bytes // 3
+            if not split:
+                # 文字起こしは伸びる一方なので、一度収まらなくなれば最後まで収まらない。
+                # モデルのトークン数を数えるのは、見積もりが MAP_REDUCE_THRESHOLD_TOKENS 以下の間だけ
+                fits = pending_tokens <= self.summary.map_reduce_threshold_tokens
+                if fits and self.summary.fits_single_prompt(pending):
+                    return
+                split = True
+            if pending_tokens < section_tokens:
+                return
+            # 埋まったセクションから要約を始め、最後の端数は次のチャンクと合わせる
+            sections = split_sections(pending, section_tokens)
+            # 最後の行が1行だけで上限を超えて文字数で切られた場合、split_sections はその断片に次の行を足さない
+            lines = pending.splitlines()
+            last_line = lines[-1] if lines else ""
+            tail = [] if len(last_line.encode("utf-8")) + 1 > section_tokens * 3 else sections[-1:]
+            for section in sections[:len(sections) - len(tail)]:
+                for part in self.summary.fit_section(section):
+                    submit(part)
+            pending = tail[0] if tail else ""
+            pending_bytes = len(pending.encode("utf-8"))
+
+        start = time.perf_counter()
+        try:
+            transcription = await transcribe(on_text)
+            transcribed = time.perf_counter()
+
+            key = self.summary.cache_key(transcription)
+            if not split:
+                # 短い録音は分割せずに1回で要約する。前回の文字起こしを使った場合もここで、議事録のキャッシュを探す
+                minutes = await self.summary.asummarize_text(transcription, on_delta, use_cache, on_progress, label)
+            elif use_cache and (cached := await asyncio.to_thread(self.summary.cache.get, key)) is not None:
+                # 録音の更新時刻だけが変わった場合など、文字起こしが前回と同じなら議事録も作り直さない
+                minutes = cached
+                if on_delta is not None:
+                    on_delta(minutes)
+            else:
+                for section in self.summary.split(pending):
+                    submit(section)
+                if compaction is not None:
+                    report = compaction.report
+                    record(
+                        "compaction",
+                        compaction.seconds,
+                        model=self.summary.model_name,
+                        incremental=True,
+                        **asdict(report),
+                        saved_tokens=report.saved_tokens,
+                    )
+                tracker.set_total(len(note_tasks))
+                notes = await asyncio.gather(*note_tasks)
+                minutes = await self.summary.areduce(notes, on_delta, on_progress, label)
+                # summary ツールからも同じ議事録を使えるようにする
+                await asyncio.to_thread(self.summary.cache.set, key, minutes)
+        finally:
+            # 途中でエラーになった場合や議事録がキャッシュにあった場合は、残りの要約を止める
+            for task in note_tasks:
+                task.cancel()
+            await asyncio.gather(*note_tasks, return_exceptions=True)
+
+        end = time.perf_counter()
+        # 文字起こし完了から議事録完成までの時間(tail_ms)が、並行して進めたことで短くなる部分
+        record(
+            "pipeline",
+            end - start,
+            transcription_ms=round((transcribed - start) * 1000, 3),
+            tail_ms=round((end - transcribed) * 1000, 3),
+            sections=len(note_tasks),
+        )
+        return transcription, minutes
+
+
+if __name__ == "__main__":
+
+    try:
+        pipeline = MinutesPipeline()
+        _, minutes = get_runtime().run(pipeline.run(on_delta=lambda delta: print(delta, end="", flush=True)))
+        print()
+    except Exception as e:
+        print("Error:", e)
@@ -0,0 +1,51 @@
+import time
+from dataclasses import dataclass
+
+
+@dataclass
+class ProgressEvent:
+    """
+    長い処理の進捗。
+
+    label は処理の対象(録音のファイル名など)、stage は処理の段階("transcription" / "summary")。
+    total と eta_seconds は、全体の件数がまだ分からない間は None になる。
+    """
+    label: str
+    stage: str
+    done: int
+    total: int | None
+    eta_seconds: float | None
+
+
+class ProgressTracker():
+    """
+    完了した件数から残り時間を見積もり、変化があるたびに ProgressEvent を callback に送る。
+
+    残り時間は、それまでの1件あたりの平均所要時間から求める。callback が None なら何もしない。
+    """
+
+    def __init__(self, label, stage, callback, total=None):
+        self.label = label
+        self.stage = stage
+        self.callback = callback
+        self.total = total
+        self.done = 0
+        self.start = time.perf_counter()
+
+    def eta_seconds(self):
+        if self.total is None or self.done == 0:
+            return None
+        elapsed = time.perf_counter() - self.start
+        return elapsed / self.done * (self.total - self.done)
+
+    def emit(self):
+        if self.callback is not None:
+            self.callback(ProgressEvent(self.label, self.stage, self.done, self.total, self.eta_seconds()))
+
+    def set_total(self, total):
+        self.total = total
+        self.emit()
+
+    def advance(self, n=1):
+        self.done += n
+        self.emit()
@@ -0,0 +1,108 @@
+import asyncio
+import functools
+import weakref
+
+from dotenv import load_dotenv
+
+from modules.telemetry import span
+
+load_dotenv()
+
+CONFIG_PATH = "config/config.yaml"
+
+
+class Runtime():
+    """
+    プロセス全体で使い回す実行コンテキスト。
+
+    設定ファイルの読み込み、APIクライアント(コネクションプール)の作成、
+    SpeechToText / SummaryMinutes の初期化は最初に使われたときに1回だけ行う。
+    openai・yaml などの重いライブラリも使うときまで読み込まない。
+    """
+
+    def __init__(self, config_path=CONFIG_PATH, config=None):
+        self.config_path = config_path
+        # イベントループごとの非同期APIクライアント
+        self._async_clients = weakref.WeakKeyDictionary()
+        if config is not None:
+            self.config = config
+
+    @functools.cached_property
+    def config(self):
+        import yaml
+
+        with span("config_load", path=self.config_path), open(self.config_path, "r") as f:
+            return yaml.safe_load(f)
+
+    def _http_limits(self):
+        import httpx
+
+        config = self.config
+        return httpx.Limits(
+            max_connections=config.get("HTTP_MAX_CONNECTIONS", 32),
+            max_keepalive_connections=config.get("HTTP_MAX_KEEPALIVE_CONNECTIONS", 16),
+            keepalive_expiry=config.get("HTTP_KEEPALIVE_SECONDS", 60),
+        )
+
+    @functools.cached_property
+    def client(self):
+        """同期のAPIクライアント。接続はキープアライブで使い回す。"""
+        from openai import DefaultHttpxClient, OpenAI
+
+        return OpenAI(http_client=DefaultHttpxClient(limits=self._http_limits()))
+
+    @property
+    def async_client(self):
+        """
+        実行中のイベントループで使う非同期のAPIクライアント。接続はキープアライブで使い回す。
+
+        コネクションプールは作ったときのイベントループでしか使えないので、asyncio.run のたびに別のクライアントを作る
+        (前のループの接続を使うと、サーバーが受け取ったリクエストが失敗扱いになり、リトライで二重に送ってしまう)。
+        このクライアントを使う処理はリクエストごとに自前でリトライするので、SDKのリトライは無効にしている。
+        """
+        loop = asyncio.get_running_loop()
+        client = self._async_clients.get(loop)
+        if client is None:
+            from openai import AsyncOpenAI, DefaultAsyncHttpxClient
+
+            client = AsyncOpenAI(max_retries=0, http_client=DefaultAsyncHttpxClient(limits=self._http_limits()))
+            self._async_clients[loop] = client
+        return client
+
+    async def aclose_clients(self):
+        """実行中のイベントループで作った非同期のAPIクライアントを閉じ、コネクションプールの接続を切る。"""
+        client = self._async_clients.pop(asyncio.get_running_loop(), None)
+        if client is not None:
+            await client.close()
+
+    def run(self, coroutine):
+        """
+        asyncio.run でコルーチンを実行し、終わったらそのイベントループで作ったAPIクライアントを閉じる。
+
+        イベントループが終わるとクライアントは使えなくなるので、閉じずに残すと接続が漏れる。
+        """
+        async def main():
+            try:
+                return await coroutine
+            finally:
+                await self.aclose_clients()
+
+        return asyncio.run(main())
+
+    @functools.cached_property
+    def speech_to_text(self):
+        from modules.speech_to_text import SpeechToText
+
+        return SpeechToText(self.config, runtime=self)
+
+    @functools.cached_property
+    def summary(self):
+        from modules.summary import SummaryMinutes
+
+        return SummaryMinutes(self.config, runtime=self)
+
+
+@functools.cache
+def get_runtime():
+    """プロセスで共有する Runtime を返す。"""
+    return Runtime()
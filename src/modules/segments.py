@@ -0,0 +1,144 @@
+import json
+import os
+
+import numpy as np
+
+# 列ごとのファイルと型。どれも1セグメント1要素のリトルエンディアンの int64
+COLUMNS = ("start_ms", "end_ms", "text_end")
+DTYPE = np.dtype("<i8")
+# 終了時刻が分からないセグメント(出力形式が text で、録音を分割しなかった場合)の end_ms
+UNKNOWN_MS = -1
+
+
+class SegmentStore():
+    """
+    時刻付きのセグメントを列ごとのファイルに保存するストア。
+
+    開始・終了時刻(ミリ秒)と、全セグメントのテキストをつなげたUTF-8のバッファ(text.bin)の中での
+    終了位置をそれぞれ別のファイルに持つ。どのファイルも追記するだけで更新でき、
+    読むときは np.memmap で必要な範囲だけを読むので、長い録音でも全体を読み込まずにインデックスの範囲で取り出せる。
+
+    セグメントは開始時刻の順に、重ならないように追加する(文字起こしの結果はチャンクの順に揃ってから追加される)。
+    書き込むのは1つのプロセスだけで、読むのは他のプロセスからでもよい。
+    読むだけの場合は readonly=True で開く(書き込み中の行を途中で終わったものとして削除しない)。
+    """
+
+    def __init__(self, directory, readonly=False):
+        self.directory = directory
+        if not readonly:
+            os.makedirs(directory, exist_ok=True)
+            # 前回の書き込みが途中で終わっていれば、揃っている行まで戻す
+            self.truncate(len(self))
+
+    def _path(self, name):
+        return os.path.join(self.directory, name)
+
+    def _rows_in(self, name):
+        path = self._path(name)
+        return os.path.getsize(path) // DTYPE.itemsize if os.path.exists(path) else 0
+
+    def __len__(self):
+        # text_end は最後に書くので、揃っている行の数は列の長さの最小値になる
+        return min(self._rows_in(f"{name}.i8") for name in COLUMNS)
+
+    @property
+    def complete(self):
+        """録音全体のセグメントが揃っているかどうか。"""
+        return self.meta().get("complete", False)
+
+    def meta(self):
+        try:
+            with open(self._path("meta.json"), "r", encoding="utf-8") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+
+    def mark_complete(self, **meta):
+        """録音全体のセグメントを追加し終えたことを記録する。meta も一緒に保存する。"""
+        with open(self._path("meta.json"), "w", encoding="utf-8") as f:
+            json.dump({**meta, "complete": True, "segments": len(self)}, f, ensure_ascii=False)
+
+    def column(self, name, count=None):
+        """列をメモリマップした配列を返す。count を省略すると揃っている全ての行。"""
+        count = len(self) if count is None else count
+        if count == 0:
+            return np.empty(0, dtype=DTYPE)
+        return np.memmap(self._path(f"{name}.i8"), dtype=DTYPE, mode="r", shape=(count,))
+
+    def clear(self):
+        """全てのセグメントを削除する。"""
+        self._remove_meta()
+        self.truncate(0)
+
+    def _remove_meta(self):
+        if os.path.exists(self._path("meta.json")):
+            os.remove(self._path("meta.json"))
+
+    def truncate(self, count):
+        """先頭の count 個だけを残す。"""
+        if count < len(self):
+            self._remove_meta()
+        text_bytes = int(self.column("text_end", count)[-1]) if count else 0
+        sizes = {f"{name}.i8": count * DTYPE.itemsize for name in COLUMNS}
+        sizes["text.bin"] = text_bytes
+        for name, size in sizes.items():
+            with open(self._path(name), "ab") as f:
+                f.truncate(size)
+
+    def append(self, segments):
+        """
+        セグメントを末尾に追加する。
+
+        Args:
+            segments (Iterable[tuple[int, int | None, str]]): 開始・終了時刻(ミリ秒)とテキスト。
+                終了時刻が分からない場合は None。
+        """
+        segments = list(segments)
+        if not segments:
+            return
+        count = len(self)
+        offset = int(self.column("text_end", count)[-1]) if count else 0
+        encoded = [text.encode("utf-8") for _, _, text in segments]
+        columns = {
+            "start_ms": np.array([start for start, _, _ in segments], dtype=DTYPE),
+            "end_ms": np.array([UNKNOWN_MS if end is None else end for _, end, _ in segments], dtype=DTYPE),
+            "text_end": offset + np.cumsum([len(data) for data in encoded], dtype=DTYPE),
+        }
+        # テキストを先に書き、text_end を最後に書く(途中で終了しても、揃っていない行は読まれない)
+        with open(self._path("text.bin"), "ab") as f:
+            f.write(b"".join(encoded))
+        for name in COLUMNS:
+            with open(self._path(f"{name}.i8"), "ab") as f:
+                f.write(columns[name].tobytes())
+        self._remove_meta()
+
+    def replace(self, segments, **meta):
+        """全てのセグメントを置き換え、揃ったことを記録する。"""
+        self.clear()
+        self.append(segments)
+        self.mark_complete(**meta)
+
+    def texts(self, lo, hi):
+        """インデックスが lo から hi まで(hi は含まない)のセグメントのテキストを返す。"""
+        if lo >= hi:
+            return []
+        text_end = self.column("text_end")[:hi]
+        bounds = np.concatenate(([text_end[lo - 1] if lo > 0 else 0], text_end[lo:hi]))
+        buffer = np.memmap(self._path("text.bin"), dtype=np.uint8, mode="r", shape=(int(text_end[-1]),))
+        data = buffer[int(bounds[0]):int(bounds[-1])].tobytes()
+        relative = bounds - bounds[0]
+        return [data[relative[i]:relative[i + 1]].decode("utf-8") for i in range(hi - lo)]
+
+    def rows(self, lo=0, hi=None):
+        """
+        インデックスが lo から hi までのセグメントを (開始, 終了, テキスト) のリストで返す。
+
+        終了が分からないセグメントの終了は None。
+        """
+        hi = len(self) if hi is None else hi
+        starts = self.column("start_ms")[lo:hi].tolist()
+        ends = self.column("end_ms")[lo:hi].tolist()
+        return [
+            (start, None if end == UNKNOWN_MS else end, text)
+            for start, end, text in zip(starts, ends, self.texts(lo, hi))
+        ]
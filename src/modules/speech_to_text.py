@@ -1,126 +1,681 @@
+import asyncio
+import datetime
+import functools
+import glob
+import hashlib
+import itertools
+import json
 import os
-import yaml
+import random
+import re
+import shutil
 import time
-import datetime
-from dotenv import load_dotenv
-load_dotenv()
-from openai import OpenAI
-from pydub import AudioSegment
-from tqdm import tqdm
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from dataclasses import asdict, dataclass
+
+import numpy as np
+
+from modules.archive import MeetingArchive
+from modules.audio import (
+    FRAME_MS,
+    SUPPORTED_FORMATS,
+    UPLOAD_SAMPLE_WIDTH,
+    EncodingProfile,
+    decode_pcm_windows,
+    detect_silences,
+    frame_energy_dbfs,
+    mean_dbfs,
+    pcm_to_array,
+    plan_chunks,
+)
+from modules.cache import ResultCache, file_fingerprint
+from modules.journal import TranscriptionJournal
+from modules.progress import ProgressTracker
+from modules.runtime import get_runtime
+from modules.segments import SegmentStore
+from modules.telemetry import record, span
+
+
+@dataclass
+class AudioChunk:
+    """
+    アップロードする音声チャンク。
+
+    start_ms, end_ms は元の録音におけるチャンクの位置(ミリ秒)。
+    分割せずにそのままアップロードする場合、end_ms は None になる。
+    """
+    index: int
+    path: str
+    start_ms: int
+    end_ms: int | None
+
+
+# 録音の隣に書き出すチャンクの一時ファイルの名前(<録音>_chunk_<開始ミリ秒>.<形式>)
+CHUNK_FILE_PATTERN = re.compile(r"_chunk_\d+\.\w+$")
+
+
+def is_chunk_file(path):
+    """SpeechToText がアップロードのために書き出した一時ファイルかどうか。"""
+    return CHUNK_FILE_PATTERN.search(os.path.basename(path)) is not None
+
+
+def read_bytes(path):
+    with open(path, "rb") as f:
+        return f.read()
+
+
+def read_text(path):
+    with open(path, "r", encoding="utf-8") as f:
+        return f.read()
+
+
+def write_text(path, text):
+    """途中で読まれても書きかけの内容にならないよう、書き終えてから置き換える。"""
+    with open(f"{path}.tmp", "w", encoding="utf-8") as f:
+        f.write(text)
+    os.replace(f"{path}.tmp", path)
+
+
+def recording_output_dir(output_path, voice_path):
+    """
+    録音ごとの出力先(OUTPUT_PATH/<録音名>_<パスのハッシュ>)。
+
+    別のディレクトリにある同じ名前の録音が結果を上書きし合わないよう、録音の絶対パスのハッシュの先頭8文字を付ける。
+    """
+    name = os.path.splitext(os.path.basename(voice_path))[0]
+    digest = hashlib.sha256(os.path.abspath(voice_path).encode("utf-8")).hexdigest()[:8]
+    return os.path.join(output_path, f"{name}_{digest}")
+
+
+def parse_transcription(response, chunk):
+    """
+    APIの応答からテキストと、元の録音での時刻に直したセグメントを取り出す。
+
+    verbose_json ではセグメントの時刻がチャンクの先頭からの秒数なので、チャンクの開始位置を足す。
+    セグメントがない出力形式(text / json)では、チャンク全体を1つのセグメントにする。
+
+    Returns:
+        tuple[str, list[tuple[int, int | None, str]]]: テキストと、開始・終了時刻(ミリ秒)付きのセグメント。
+    """
+    if isinstance(response, str):
+        text, segments = response, None
+    else:
+        text, segments = response.text, getattr(response, "segments", None)
+    if segments is None:
+        return text, [(chunk.start_ms, chunk.end_ms, text)] if text else []
+    results = []
+    for segment in segments:
+        start_ms = chunk.start_ms + round(segment.start * 1000)
+        end_ms = chunk.start_ms + round(segment.end * 1000)
+        if chunk.end_ms is not None:
+            # whisperはチャンクの長さを少し超えた終了時刻を返すことがある
+            start_ms, end_ms = min(start_ms, chunk.end_ms), min(end_ms, chunk.end_ms)
+        if segment.text.strip():
+            results.append((start_ms, end_ms, segment.text.strip()))
+    return text, results
+
+
+def retryable_errors():
+    """リトライすれば成功する可能性があるエラー(APITimeoutErrorはAPIConnectionErrorに含まれる)。"""
+    from openai import APIConnectionError, InternalServerError, RateLimitError
+
+    return (APIConnectionError, InternalServerError, RateLimitError)
+
 
 class SpeechToText():
-    def __init__(self):
-        with open("config/config.yaml", "r") as f:
-            config = yaml.safe_load(f)
+    def __init__(self, config=None, runtime=None):
+        # 設定ファイルとAPIクライアントはプロセス全体で共有する
+        runtime = runtime or get_runtime()
+        if config is None:
+            config = runtime.config
+        self.config = config
+        self.runtime = runtime
         self.voice_path = config["VOICE_PATH"]
         self.model_name = config["VOICE_MODEL_NAME"]
-        self.speech_to_text_client = OpenAI()
         self.MAX_SIZE = 25 * 1024 * 1024
+        # 1チャンクの最大長。デコード時のメモリ使用量もこの長さで決まる
+        self.max_chunk_ms = config.get("MAX_CHUNK_SECONDS", 600) * 1000
         self.output_path = config["OUTPUT_PATH"]
+        # APIリクエストの同時実行数とリトライの設定
+        self.max_concurrency = config.get("MAX_CONCURRENCY", 4)
+        self.max_retries = config.get("MAX_RETRIES", 5)
+        self.retry_base_seconds = config.get("RETRY_BASE_SECONDS", 1.0)
+        # 出力形式。verbose_json ならセグメントごとの時刻も受け取る(whisper-1 のみ対応)
+        self.response_format = config.get("RESPONSE_FORMAT", "verbose_json")
+        # 同じチャンクを再びアップロードしないためのキャッシュ
+        self.cache = ResultCache(
+            config.get("TRANSCRIPTION_CACHE_PATH") or os.path.join(self.output_path, "cache", "transcriptions"),
+            config.get("TRANSCRIPTION_CACHE_MAX_MB", 256) * 1024 * 1024,
+        )
+        # キャッシュによって省略できた音声の長さ(ミリ秒)とアップロード量(バイト)
+        self.cache_saved_ms = 0
+        self.cache_saved_bytes = 0
+        # 無音検出の設定
+        self.silence_thresh_db = config.get("SILENCE_THRESH_DB", -16)
+        self.min_silence_ms = config.get("MIN_SILENCE_MS", 500)
+        self.drop_silence_ms = config.get("DROP_SILENCE_MS", 3000)
+        self.keep_silence_ms = config.get("KEEP_SILENCE_MS", 300)
+        # アップロード用のエンコード設定
+        self.upload_encoding = EncodingProfile(
+            format=config.get("UPLOAD_FORMAT", "mp3"),
+            channels=config.get("UPLOAD_CHANNELS", 1),
+            frame_rate=config.get("UPLOAD_FRAME_RATE", 16000),
+            bitrate=config.get("UPLOAD_BITRATE", "32k"),
+            codec=config.get("UPLOAD_CODEC"),
+        )
 
-    def split_audio(self, voice_path):
-        audio = AudioSegment.from_file(voice_path)
-        # チャンクの幅時間を設定
-        chunk_length_ms = int(len(audio) * (self.MAX_SIZE / os.path.getsize(voice_path)))
-        chunks = []
-        start = 0
-        duration_ms = len(audio)
-        # 1秒ごとに増やしながら25MB未満になるように分割
-        while start < duration_ms:
-            end = start + 10000  # まず10秒単位で
-            while end <= duration_ms:
-                chunk = audio[start:end]
-                chunk_path = f'{voice_path}_chunk_{start}.wav'
-                chunk.export(chunk_path, format="wav")
-                if os.path.getsize(chunk_path) > self.MAX_SIZE:
-                    os.remove(chunk_path)
-                    if end - start <= 1000:
-                        # 1秒でも超える場合は強制終了
-                        raise ValueError("Cannot split audio into small enough chunks.")
-                    end -= 1000  # 1秒短くして再トライ
-                else:
-                    break
-            else:
-                # 最後の部分
-                chunk = audio[start:duration_ms]
-                chunk_path = f'{voice_path}_chunk_{start}.wav'
-                chunk.export(chunk_path, format="wav")
-                if os.path.getsize(chunk_path) > self.MAX_SIZE:
-                    raise ValueError("Last chunk is still too large.")
-                end = duration_ms
-            chunks.append(chunk_path)
-            start = end
-        return chunks
-
-    def transcribe_chunk(self, chunk_path):
-        with open(chunk_path, 'rb') as audio_file:
-            return self.speech_to_text_client.audio.transcriptions.create(
-                model=self.model_name,
-                file=audio_file,
-                response_format="text",
+    @functools.cached_property
+    def archive(self):
+        """過去の会議の文字起こしと議事録を検索するためのアーカイブ。"""
+        return MeetingArchive(self.config.get("ARCHIVE_PATH") or os.path.join(self.output_path, "archive.sqlite3"))
+
+    def needs_encoding(self, voice_path):
+        """
+        元のファイルをそのままアップロードできない場合に True を返す。
+
+        MAX_SIZE以下で、APIが対応している形式であれば再エンコードしない。
+        """
+        extension = os.path.splitext(voice_path)[1].lstrip(".").lower()
+        return os.path.getsize(voice_path) > self.MAX_SIZE or extension not in SUPPORTED_FORMATS
+
+    @property
+    def speech_to_text_client(self):
+        """実行中のイベントループの非同期APIクライアント。リトライはチャンクごとに自前で行う。"""
+        return self.runtime.async_client
+
+    def chunk_length_ms(self):
+        """エンコード後にMAX_SIZEに収まり、MAX_CHUNK_SECONDSを超えないチャンクの長さ(ミリ秒)。"""
+        return min(self.upload_encoding.max_chunk_ms(self.MAX_SIZE), self.max_chunk_ms)
+
+    def export_chunk(self, index, voice_path, samples, start_ms, end_ms):
+        """PCMのサンプルをアップロード用の形式で書き出す。"""
+        from pydub import AudioSegment
+
+        profile = self.upload_encoding
+        audio = AudioSegment(
+            samples.tobytes(),
+            sample_width=UPLOAD_SAMPLE_WIDTH,
+            frame_rate=profile.frame_rate,
+            channels=profile.channels,
+        )
+        chunk_path = f'{voice_path}_chunk_{start_ms}.{profile.format}'
+        with span("encode", chunk=index, audio_ms=end_ms - start_ms, format=profile.format) as encode_span:
+            profile.export(audio, chunk_path)
+            size = os.path.getsize(chunk_path)
+            encode_span.set(bytes=size)
+        # 予測したサイズの上限を実際のファイルサイズで検証
+        if size > self.MAX_SIZE:
+            os.remove(chunk_path)
+            raise ValueError(f"Chunk exceeds MAX_SIZE: {chunk_path}")
+        return AudioChunk(index, chunk_path, start_ms, end_ms)
+
+    def export_range(self, index, voice_path, start_ms, end_ms):
+        """録音の指定した範囲だけをデコードして書き出す。"""
+        profile = self.upload_encoding
+        with span("decode", chunk=index, audio_ms=end_ms - start_ms) as decode_span:
+            windows = decode_pcm_windows(
+                voice_path,
+                profile.frame_rate,
+                profile.channels,
+                end_ms - start_ms,
+                start_ms=start_ms,
+                duration_ms=end_ms - start_ms,
             )
+            data = b"".join(windows)
+            decode_span.set(bytes=len(data))
+        samples = pcm_to_array(data, UPLOAD_SAMPLE_WIDTH)
+        return self.export_chunk(index, voice_path, samples, start_ms, end_ms)
 
-    def transcribe_audio_to_text(self) -> str:
+    def settings(self):
+        """チャンクの境界と文字起こし結果に影響する設定。"""
+        return {
+            "model_name": self.model_name,
+            "response_format": self.response_format,
+            "upload_encoding": asdict(self.upload_encoding),
+            "chunk_length_ms": self.chunk_length_ms(),
+            "silence_thresh_db": self.silence_thresh_db,
+            "min_silence_ms": self.min_silence_ms,
+            "drop_silence_ms": self.drop_silence_ms,
+            "keep_silence_ms": self.keep_silence_ms,
+        }
+
+    def segment_store(self, voice_path, readonly=False):
         """
-        Transcribe audio file to text using Whisper model.
+        録音の時刻付きのセグメントのストア。
+
+        文字起こしの結果と同じく、録音ファイルと設定ごとに別のストアになる
+        (省略時は OUTPUT_PATH/segments/<キー>)。
+        """
+        directory = self.config.get("SEGMENTS_PATH") or os.path.join(self.output_path, "segments")
+        return SegmentStore(os.path.join(directory, self.transcript_key(voice_path)[:16]), readonly=readonly)
+
+    def transcript_key(self, voice_path):
+        """
+        録音全体の文字起こしのキャッシュのキー。
+
+        録音ファイル(パス・サイズ・更新時刻)と、結果に影響する設定が同じなら同じキーになる。
+        """
+        return ResultCache.make_key(
+            "transcript",
+            *file_fingerprint(voice_path),
+            json.dumps(self.settings(), sort_keys=True),
+        )
+
+    def remove_stale_chunks(self, voice_path):
+        """前回の実行が途中で終了したときに残った一時ファイルを削除する。"""
+        for chunk_path in glob.glob(f"{glob.escape(voice_path)}_chunk_*"):
+            os.remove(chunk_path)
+
+    def iter_decoded_windows(self, voice_path, window_ms):
+        """decode_pcm_windows のウィンドウごとのデコード時間をスパンとして記録しながら返す。"""
+        profile = self.upload_encoding
+        bytes_per_ms = profile.frame_rate * profile.channels * UPLOAD_SAMPLE_WIDTH / 1000
+        windows = decode_pcm_windows(voice_path, profile.frame_rate, profile.channels, window_ms)
+        try:
+            for window_index in itertools.count():
+                with span("decode", window=window_index) as decode_span:
+                    data = next(windows, None)
+                    if data is not None:
+                        decode_span.set(bytes=len(data), audio_ms=int(len(data) / bytes_per_ms))
+                if data is None:
+                    return
+                yield data
+        finally:
+            # 途中で止めた場合もffmpegを終了させる
+            windows.close()
+
+    def iter_chunks(self, voice_path, skip=()):
+        """
+        音声をffmpegから少しずつデコードし、無音で区切ったチャンクを書き出すジェネレータ。
+
+        メモリに保持するのはチャンク2つ分程度のPCMだけなので、
+        ピークメモリは録音の長さではなく MAX_CHUNK_SECONDS で決まる。
+        無音の閾値は、それまでにデコードした部分の平均音量からの相対値で決める。
 
         Args:
-            audio_file_path (str): Path to the audio file.
-            model_name (str): Name of the Whisper model to use. Default is "base".
+            voice_path (str): 音声ファイルのパス。
+            skip (Container[int]): 書き出しを省略するチャンクのインデックス(path は None になる)。
+
+        Yields:
+            AudioChunk: 書き出したチャンク。
+        """
+        profile = self.upload_encoding
+        chunk_length_ms = self.chunk_length_ms()
+        if chunk_length_ms < 1000:
+            # 1秒でも超える場合は強制終了
+            raise ValueError("Cannot split audio into small enough chunks.")
+
+        def to_index(ms):
+            return ms * profile.frame_rate // 1000 * profile.channels
+
+        frame_size = max(1, int(profile.frame_rate * FRAME_MS / 1000)) * profile.channels
+        buffer = np.empty(0, dtype=np.int16)
+        buffer_start_ms = 0
+        # 平均音量を求めるための累積値
+        power_sum, frame_count = 0.0, 0
+        index = 0
+
+        windows = self.iter_decoded_windows(voice_path, chunk_length_ms)
+        for data in itertools.chain(windows, [None]):
+            eof = data is None
+            if not eof:
+                window = pcm_to_array(data, UPLOAD_SAMPLE_WIDTH)
+                buffer = np.concatenate((buffer, window))
+            duration_ms = len(buffer) * 1000 // (profile.frame_rate * profile.channels)
+            # 1チャンク分より長く溜まるまでは区切る位置を決められない
+            if not eof and duration_ms <= chunk_length_ms:
+                continue
+
+            with span("split", offset_ms=buffer_start_ms, audio_ms=duration_ms) as split_span:
+                energy_db = frame_energy_dbfs(buffer, profile.frame_rate, profile.channels, UPLOAD_SAMPLE_WIDTH)
+                if not eof:
+                    new_energy_db = energy_db[len(energy_db) - len(window) // frame_size:]
+                    power_sum += float(np.sum(10 ** (new_energy_db.astype(np.float64) / 10)))
+                    frame_count += len(new_energy_db)
+                average_db = 10 * np.log10(power_sum / frame_count) if power_sum > 0 else mean_dbfs(energy_db)
+                silences = detect_silences(energy_db, average_db + self.silence_thresh_db, self.min_silence_ms)
+
+                # 無音の中で区切り、長い無音はアップロードしない
+                boundaries = plan_chunks(
+                    duration_ms,
+                    chunk_length_ms,
+                    silences,
+                    self.drop_silence_ms,
+                    self.keep_silence_ms,
+                )
+                split_span.set(silences=len(silences), chunks=len(boundaries))
+            carry_ms = duration_ms
+            if not eof:
+                # 最後のチャンクは次のウィンドウに続く可能性があるので持ち越す
+                if boundaries:
+                    carry_ms = boundaries.pop()[0]
+                else:
+                    carry_ms = max(duration_ms - self.drop_silence_ms, 0)
+
+            for start, end in boundaries:
+                if index in skip:
+                    yield AudioChunk(index, None, buffer_start_ms + start, buffer_start_ms + end)
+                else:
+                    yield self.export_chunk(
+                        index,
+                        voice_path,
+                        buffer[to_index(start):to_index(end)],
+                        buffer_start_ms + start,
+                        buffer_start_ms + end,
+                    )
+                index += 1
+
+            buffer = buffer[to_index(carry_ms):].copy()
+            buffer_start_ms += carry_ms
+
+    def split_audio(self, voice_path):
+        return list(self.iter_chunks(voice_path))
+
+    async def transcribe_chunk(self, chunk):
+        """
+        1チャンクを文字起こしする。
+
+        チャンクの中身・モデル・出力形式が同じ結果がキャッシュにあれば、APIは呼ばない。
+        レート制限や一時的な通信エラーの場合は、ジッター付きの指数バックオフでリトライする。
 
         Returns:
-            str: Transcribed text from the audio file.
+            tuple[str, list[tuple[int, int | None, str]]]: テキストと、元の録音での時刻に直したセグメント。
+        """
+        # 数MBの読み書きでもイベントループを止めないよう、ファイルの操作は別スレッドで行う
+        data = await asyncio.to_thread(read_bytes, chunk.path)
+        audio_ms = chunk.end_ms - chunk.start_ms if chunk.end_ms is not None else None
+        key = ResultCache.make_key(data, self.model_name, self.response_format)
+        cached = await asyncio.to_thread(self.cache.get, key)
+        if cached is not None:
+            if audio_ms is not None:
+                self.cache_saved_ms += audio_ms
+            self.cache_saved_bytes += len(data)
+            # キャッシュにはチャンクの先頭からの時刻で保存してある
+            cached = json.loads(cached)
+            offset = chunk.start_ms
+            return cached["text"], [
+                (offset + start, None if end is None else offset + end, text) for start, end, text in cached["segments"]
+            ]
+
+        # upload はリトライの待ち時間を含むチャンク全体、api_latency は1回のリクエストの所要時間
+        with span("upload", chunk=chunk.index, bytes=len(data), audio_ms=audio_ms) as upload_span:
+            for attempt in range(self.max_retries + 1):
+                try:
+                    with span("api_latency", chunk=chunk.index, attempt=attempt, bytes=len(data)):
+                        transcription = await self.speech_to_text_client.audio.transcriptions.create(
+                            model=self.model_name,
+                            file=(os.path.basename(chunk.path), data),
+                            response_format=self.response_format,
+                        )
+                    break
+                except retryable_errors():
+                    if attempt == self.max_retries:
+                        raise
+                    await asyncio.sleep(self.retry_base_seconds * 2 ** attempt * random.uniform(0.5, 1.5))
+            text, segments = parse_transcription(transcription, chunk)
+            upload_span.set(attempts=attempt + 1, chars=len(text), segments=len(segments))
+        # 同じ音声が録音の別の位置に現れても使えるよう、キャッシュにはチャンクの先頭からの時刻で保存する
+        offset = chunk.start_ms
+        relative = [(start - offset, None if end is None else end - offset, text) for start, end, text in segments]
+        entry = json.dumps({"text": text, "segments": relative}, ensure_ascii=False)
+        await asyncio.to_thread(self.cache.set, key, entry)
+        return text, segments
+
+    def iter_job_chunks(self, voice_path, journal):
+        """
+        ジャーナルの状態に合わせてチャンクを返すジェネレータ。
+
+        すべての境界が記録済みなら、未完了のチャンクの範囲だけをデコードする。
+        そうでなければ最初から分割し直し、完了済みのチャンクは書き出さない。
+        完了済みのチャンクは path が None になる。
+        """
+        if not self.needs_encoding(voice_path):
+            yield AudioChunk(0, None if 0 in journal.done_indices() else voice_path, 0, None)
+        elif journal.split_completed:
+            done = journal.done_indices()
+            for entry in journal.chunks():
+                if entry["index"] in done:
+                    yield AudioChunk(entry["index"], None, entry["start_ms"], entry["end_ms"])
+                else:
+                    yield self.export_range(entry["index"], voice_path, entry["start_ms"], entry["end_ms"])
+        else:
+            yield from self.iter_chunks(voice_path, skip=journal.done_indices())
+
+    async def iter_chunks_from_executor(self, voice_path, executor):
+        """
+        プロセスプールでチャンクの分割・エンコードを行い、終わったら順に受け取る。
+
+        デコードとエンコードはCPUを使うので、複数の録音をまとめて処理するときはプロセスに分散する。
+        """
+        loop = asyncio.get_running_loop()
+        for chunk in await loop.run_in_executor(executor, split_job, self.config, voice_path):
+            yield chunk
+
+    async def iter_chunks_async(self, chunk_iter):
+        """
+        チャンクのジェネレータを別スレッドで回し、書き出されたチャンクから順に受け取る。
+
+        デコードとエンコードがイベントループを止めないので、前のチャンクのアップロードと並行して進む。
+        """
+        loop = asyncio.get_running_loop()
+        queue = asyncio.Queue()
+
+        def produce():
+            try:
+                for chunk in chunk_iter:
+                    loop.call_soon_threadsafe(queue.put_nowait, chunk)
+            finally:
+                loop.call_soon_threadsafe(queue.put_nowait, None)
+
+        producer = loop.run_in_executor(None, produce)
+        while (chunk := await queue.get()) is not None:
+            yield chunk
+        # 分割中のエラーはここで送出される
+        await producer
+
+    async def atranscribe_audio_to_text(
+        self,
+        voice_path=None,
+        transcription_path=None,
+        on_text=None,
+        semaphore=None,
+        split_executor=None,
+        use_cache=True,
+        on_progress=None,
+    ) -> str:
         """
+        音声ファイルを非同期で文字起こしする。
+
+        チャンクは最大 MAX_CONCURRENCY 件まで同時にアップロードし、結果はチャンクの順番に並べ直す。
+        先頭から順番が揃った分はすぐに出力ファイルへ追記するので、最後のチャンクを待たずに読み始められる。
+        各チャンクの境界と結果は OUTPUT_PATH/jobs のジャーナルに記録し、
+        失敗したチャンクがあれば最後に例外を送出する。再実行すると未完了のチャンクだけを処理する。
+        録音ファイルと設定が前回と変わっていなければ、分割もAPIの呼び出しもせずに前回の結果を返す
+        (この場合 on_text は呼ばれない)。
+        時刻付きのセグメントは、順番が揃ったチャンクから segment_store(voice_path) のストアに追記する。
+
+        Args:
+            voice_path (str): 音声ファイルのパス。省略時は設定ファイルの VOICE_PATH。
+            transcription_path (str): 出力ファイルのパス。省略時は OUTPUT_PATH/output.txt。
+            on_text (Callable[[AudioChunk, str], None]): 順番が揃ったチャンクごとに呼ばれる関数。
+            semaphore (asyncio.Semaphore): APIリクエストの同時実行数を制限するセマフォ。
+                複数の録音で同じものを渡すと、全体で同時実行数を共有できる。省略時は MAX_CONCURRENCY。
+            split_executor (concurrent.futures.Executor): 指定すると、分割・エンコードをこのプールで行う。
+            use_cache (bool): False にすると前回の結果を使わずに文字起こしし直す。
+                チャンク単位のキャッシュは使うので、録音が同じならAPIは呼ばない。
+            on_progress (Callable[[ProgressEvent], None]): 指定するとチャンクが終わるたびに進捗を送る。
+                チャンクの総数と残り時間は、分割が終わるまで None になる。指定した場合は進捗バーを表示しない。
 
+        Returns:
+            str: 文字起こし結果。
+        """
+        voice_path = voice_path or self.voice_path
         # 音声ファイルが存在しない場合にエラーを返す
-        if not os.path.exists(self.voice_path):
-            raise FileNotFoundError(f"Audio file not found: {self.voice_path}")
+        if not os.path.exists(voice_path):
+            raise FileNotFoundError(f"Audio file not found: {voice_path}")
 
-        if os.path.getsize(self.voice_path) > self.MAX_SIZE:
-            chunk_paths = self.split_audio(self.voice_path)
+        if not os.path.isdir(self.output_path):
+            os.makedirs(self.output_path)
+        if transcription_path is None:
+            # 最新の文字起こしは output.txt に書き、実行ごとの記録として output_{now}.txt にも残す
+            now = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
+            history_path = os.path.join(self.output_path, f'output_{now}.txt')
+            transcription_path = os.path.join(self.output_path, 'output.txt')
         else:
-            chunk_paths = [self.voice_path]
+            history_path = None
+
+        transcript_key = self.transcript_key(voice_path)
+        store = await asyncio.to_thread(self.segment_store, voice_path)
+        if use_cache:
+            with span("transcript_lookup", path=voice_path, hit=False) as lookup_span:
+                # セグメントが揃っていない場合は、チャンクのキャッシュを使って作り直す
+                cached = await asyncio.to_thread(self.cache.get, transcript_key) if store.complete else None
+                if cached is not None:
+                    await asyncio.to_thread(write_text, transcription_path, cached)
+                    lookup_span.set(hit=True, chars=len(cached))
+            if cached is not None:
+                if not await asyncio.to_thread(self.archive.has_meeting, voice_path):
+                    segments = await asyncio.to_thread(store.rows)
+                    await asyncio.to_thread(self.archive.add_meeting, voice_path, segments, transcription_path)
+                return cached
+
+        self.remove_stale_chunks(voice_path)
+        journal = TranscriptionJournal(self.output_path, voice_path, self.settings())
+        store.clear()
 
-        text_list = []
         start = time.perf_counter()
+        if semaphore is None:
+            semaphore = asyncio.Semaphore(self.max_concurrency)
+        chunks = {}
+        results = {}
+        # 各チャンクの結果が揃った時刻(前のチャンクを待っていた時間の計測に使う)
+        ready_times = {}
+        text_list = []
+        from tqdm import tqdm
+
+        progress = tqdm(desc="Transcribing chunks", unit="chunk", disable=on_progress is not None)
+        tracker = ProgressTracker(os.path.basename(voice_path), "transcription", on_progress)
 
-        # 並列でAPIリクエスト
-        with ThreadPoolExecutor(max_workers=4) as executor:
-            futures = {
-                executor.submit(self.transcribe_chunk, chunk_path): chunk_path
-                for chunk_path in chunk_paths
-                if os.path.getsize(chunk_path) >= 1024  # 1KB未満はスキップ
-            }
-            for future in tqdm(as_completed(futures), total=len(futures), desc="Transcribing chunks"):
-                chunk_path = futures[future]
+        with open(transcription_path, "w", encoding="utf-8") as output:
+
+            def flush_in_order():
+                # 先頭から順番が揃った分だけ追記する
+                while len(text_list) in results:
+                    index = len(text_list)
+                    text, segments = results.pop(index)
+                    text_list.append(text)
+                    output.write(text if index == 0 else "\n" + text)
+                    output.flush()
+                    store.append(segments)
+                    # 前のチャンクを待っていた時間と、書き出し・コールバックにかかった時間
+                    waited = time.perf_counter() - ready_times.pop(index)
+                    record("reassembly", waited, chunk=index, chars=len(text))
+                    if on_text is not None:
+                        on_text(chunks[index], text)
+
+            async def worker(chunk, queued):
                 try:
-                    transcription = future.result()
-                    text_list.append(transcription)
+                    if chunk.path is None:
+                        # 前回までに完了しているチャンク
+                        ready_times[chunk.index] = time.perf_counter()
+                        results[chunk.index] = (journal.text(chunk.index), journal.segments(chunk.index))
+                        return
+                    # 1KB未満はスキップ
+                    if os.path.getsize(chunk.path) < 1024:
+                        transcription, segments = "", []
+                    else:
+                        async with semaphore:
+                            record("queue_wait", time.perf_counter() - queued, chunk=chunk.index)
+                            transcription, segments = await self.transcribe_chunk(chunk)
+                    journal.record(chunk, "done", text=transcription, segments=segments)
+                    ready_times[chunk.index] = time.perf_counter()
+                    results[chunk.index] = (transcription, segments)
                 except Exception as e:
-                    print(f"Error in chunk {chunk_path}: {e}")
+                    print(f"Error in chunk {chunk.path} ({chunk.start_ms}ms-): {e}")
+                    journal.record(chunk, "failed", error=str(e))
                 finally:
-                    if chunk_path != self.voice_path:
-                        os.remove(chunk_path)  # 一時ファイル削除
+                    if chunk.path is not None and chunk.path != voice_path:
+                        os.remove(chunk.path)  # 一時ファイル削除
+                    progress.update()
+                    tracker.advance()
+                flush_in_order()
 
-        texts = "\n".join(text_list)
+            tasks = []
+            try:
+                if split_executor is not None:
+                    chunk_source = self.iter_chunks_from_executor(voice_path, split_executor)
+                else:
+                    chunk_source = self.iter_chunks_async(self.iter_job_chunks(voice_path, journal))
+                async for chunk in chunk_source:
+                    chunks[chunk.index] = chunk
+                    journal.add(chunk)
+                    progress.total = len(chunks)
+                    tasks.append(asyncio.create_task(worker(chunk, time.perf_counter())))
+                journal.mark_split_completed()
+                tracker.set_total(len(chunks))
+                await asyncio.gather(*tasks)
+            finally:
+                # 途中でエラーになった場合は残りのリクエストを止める
+                for task in tasks:
+                    task.cancel()
+                await asyncio.gather(*tasks, return_exceptions=True)
+                progress.close()
 
-        end = time.perf_counter()
-        print(f'テキスト生成にかかった時間: {((end-start)/60):.2f}分')
+        self.cache.save_stats()
+        stats = self.cache.stats
+        failed = journal.failed()
+        record(
+            "transcription",
+            time.perf_counter() - start,
+            "error" if failed else "ok",
+            path=voice_path,
+            chunks=len(chunks),
+            failed_chunks=len(failed),
+            chars=sum(len(text) for text in text_list),
+            cache_hits=stats["hits"],
+            cache_misses=stats["misses"],
+            cache_saved_ms=self.cache_saved_ms,
+            cache_saved_bytes=self.cache_saved_bytes,
+        )
 
-        if os.path.isdir(self.output_path):
-            pass
-        else:
-            os.makedirs(self.output_path)
+        if failed:
+            raise RuntimeError(
+                f"{len(failed)}個のチャンクの文字起こしに失敗しました。"
+                f"再実行すると未完了のチャンクだけを処理します: {journal.path}"
+            )
+        journal.remove()
+        store.mark_complete(voice_path=os.path.abspath(voice_path), chunks=len(chunks))
 
-        now = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
-        transcription_path = os.path.join(self.output_path, f'output_{now}.txt')
-        transcription_path = os.path.join(self.output_path, 'output.txt')
-        with open(transcription_path, "w", encoding="utf-8") as f:
-            f.write(texts)
+        if history_path is not None:
+            await asyncio.to_thread(shutil.copyfile, transcription_path, history_path)
+        # 過去の会議を検索できるよう、時刻付きのセグメントをアーカイブに保存する
+        segments = await asyncio.to_thread(store.rows)
+        with span("archive", path=voice_path, segments=len(segments)):
+            await asyncio.to_thread(self.archive.add_meeting, voice_path, segments, history_path or transcription_path)
 
+        texts = "\n".join(text_list)
+        self.cache.set(transcript_key, texts)
         return texts
 
+    def transcribe_audio_to_text(self) -> str:
+        """
+        Transcribe audio file to text using Whisper model.
+
+        Returns:
+            str: Transcribed text from the audio file.
+        """
+        return self.runtime.run(self.atranscribe_audio_to_text())
+
+def split_job(config, voice_path):
+    """
+    プロセスプールでチャンクを分割・エンコードする。
+
+    別プロセスで実行できるよう、モジュールレベルの関数にしている。
+    ジャーナルは読むだけで、記録は呼び出し元のプロセスで行う。
+    """
+    speech_to_text = SpeechToText(config)
+    journal = TranscriptionJournal(speech_to_text.output_path, voice_path, speech_to_text.settings())
+    return list(speech_to_text.iter_job_chunks(voice_path, journal))
+
 if __name__ == "__main__":
 
     try:
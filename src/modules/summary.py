@@ -1,55 +1,375 @@
+import asyncio
+import contextlib
 import os
-import yaml
 import time
-from dotenv import load_dotenv
-load_dotenv()
-from openai import OpenAI
-from pydub import AudioSegment
-from tqdm import tqdm
+from dataclasses import asdict
+
+from modules.cache import ResultCache
+from modules.compaction import TranscriptCompactor
+from modules.progress import ProgressTracker
+from modules.runtime import get_runtime
+from modules.telemetry import span
+
+
+def estimate_tokens(text):
+    """
+    トークン数をおおまかに見積もる。
+
+    日本語は1文字がおよそ1トークン(UTF-8で3バイト)、英数字は3〜4文字で1トークンなので、
+    UTF-8のバイト数の1/3を見積もりとして使う。
+    """
+    return len(text.encode("utf-8")) // 3
+
+
+def split_sections(text, max_tokens):
+    """
+    文字起こしを max_tokens 以下のセクションに分ける。
+
+    なるべく行の区切りで分け、1行だけで上限を超える場合は文字数で分ける。
+    """
+    sections = []
+    lines = []
+    # estimate_tokens の切り捨てと改行で上限を超えないよう、バイト数で数える
+    max_bytes = max_tokens * 3
+    size = 0
+    for line in text.splitlines():
+        line_bytes = len(line.encode("utf-8")) + 1
+        if lines and size + line_bytes > max_bytes:
+            sections.append("\n".join(lines))
+            lines, size = [], 0
+        if line_bytes > max_bytes:
+            # 1トークン≒1文字(日本語)として、上限を超えない長さで切る
+            for i in range(0, len(line), max_tokens):
+                sections.append(line[i:i + max_tokens])
+            continue
+        lines.append(line)
+        size += line_bytes
+    if lines:
+        sections.append("\n".join(lines))
+    return sections
+
+
+def set_usage(generation_span, usage):
+    """APIが返したトークン数をスパンに記録する。"""
+    if usage is not None:
+        generation_span.set(input_tokens=usage.input_tokens, output_tokens=usage.output_tokens)
+
 
 class SummaryMinutes():
-    def __init__(self):
+    def __init__(self, config=None, runtime=None):
         """
         クラスの初期化を行う関数。
         """
-        with open("config/config.yaml", "r") as f:
-            config = yaml.safe_load(f)
+        # 設定ファイルとAPIクライアントはプロセス全体で共有する
+        runtime = runtime or get_runtime()
+        if config is None:
+            config = runtime.config
+        self.runtime = runtime
         self.model_name = config["SUMMARIZE_MODEL_NAME"]
         self.output_path = config["OUTPUT_PATH"]
         self.system_prompt = config["system"]["prompt"]
         self.user_prompt = config["user"]["prompt"]
-        self.summary_text_client = OpenAI()
+        # 長い文字起こしを分割して要約(map-reduce)するための設定
+        self.map_reduce_threshold_tokens = config.get("MAP_REDUCE_THRESHOLD_TOKENS", 20000)
+        self.section_tokens = config.get("SECTION_TOKENS", 6000)
+        self.summary_max_concurrency = config.get("SUMMARY_MAX_CONCURRENCY", 4)
+        self.section_system_prompt = config["section"]["system_prompt"]
+        self.section_user_prompt = config["section"]["user_prompt"]
+        self.reduce_user_prompt = config["reduce"]["user_prompt"]
+        # 要約の前に、フィラーや重複を取り除いてトークン数を減らす
+        self.compactor = (
+            TranscriptCompactor.from_config(config, self.model_name) if config.get("COMPACTION_ENABLED", True) else None
+        )
+        # 1回のプロンプトに送る文字起こしのトークン数の上限(PROMPT_TOKEN_BUDGET)。セクションもこれより短くする
+        self.token_budget = self.compactor.token_budget if self.compactor is not None else None
+        if self.token_budget is not None:
+            self.section_tokens = min(self.section_tokens, self.token_budget)
+        # 同じ文字起こし・プロンプト・モデルの議事録を作り直さないためのキャッシュ
+        ttl_hours = config.get("SUMMARY_CACHE_TTL_HOURS", 24 * 7)
+        self.cache = ResultCache(
+            config.get("SUMMARY_CACHE_PATH") or os.path.join(self.output_path, "cache", "summaries"),
+            config.get("SUMMARY_CACHE_MAX_MB", 64) * 1024 * 1024,
+            ttl_seconds=ttl_hours * 3600 if ttl_hours is not None else None,
+        )
 
-    def summary(self):
-        text_path = os.path.join(self.output_path, 'output.txt')
-        with open(text_path, 'r') as texts:
-            transcription_texts = texts.read()
+    @property
+    def async_summary_text_client(self):
+        """
+        実行中のイベントループの非同期APIクライアント。コネクションプールは文字起こしと共有する。
+
+        共有するクライアントはSDKのリトライを無効にしているので、要約ではSDKの既定の回数だけリトライする。
+        """
+        from openai import DEFAULT_MAX_RETRIES
 
-        message = [
+        return self.runtime.async_client.with_options(max_retries=DEFAULT_MAX_RETRIES)
+
+    @staticmethod
+    def messages(system_prompt, user_prompt):
+        return [
             {
                 "role": "system",
-                "content": self.system_prompt
+                "content": system_prompt
             },
             {
                 "role": "user",
-                "content": self.user_prompt.format(user_input=transcription_texts)
+                "content": user_prompt
             }
         ]
 
-        start = time.perf_counter()
-        summary = self.summary_text_client.responses.create(
+    def generation_span(self, system_prompt, user_prompt, on_delta, attributes):
+        """生成1回分の所要時間とトークン数を記録するスパン。"""
+        return span(
+            "summary_generation",
             model=self.model_name,
-            input=message
+            stream=on_delta is not None,
+            estimated_input_tokens=estimate_tokens(system_prompt) + estimate_tokens(user_prompt),
+            **attributes,
+        )
+
+    async def agenerate(self, system_prompt, user_prompt, on_delta=None, **attributes):
+        """
+        モデルにテキストを生成させる。
+
+        on_delta を渡すとストリーミングで生成し、届いた差分ごとに on_delta を呼ぶ。
+        所要時間とトークン数は summary_generation スパンに記録し、attributes もスパンの属性に加える。
+        """
+        client = self.async_summary_text_client
+        message = self.messages(system_prompt, user_prompt)
+        with self.generation_span(system_prompt, user_prompt, on_delta, attributes) as generation_span:
+            if on_delta is None:
+                summary = await client.responses.create(
+                    model=self.model_name,
+                    input=message
+                )
+                set_usage(generation_span, summary.usage)
+                return summary.output[0].content[0].text
+
+            start = time.perf_counter()
+            stream = await client.responses.create(
+                model=self.model_name,
+                input=message,
+                stream=True
+            )
+            deltas = []
+            async for event in stream:
+                if event.type == "response.output_text.delta":
+                    if not deltas:
+                        generation_span.set(ttft_ms=round((time.perf_counter() - start) * 1000, 3))
+                    deltas.append(event.delta)
+                    on_delta(event.delta)
+                elif event.type == "response.completed":
+                    set_usage(generation_span, event.response.usage)
+            return "".join(deltas)
+
+    def fits_single_prompt(self, text):
+        """1回のプロンプトで要約できる長さ(MAP_REDUCE_THRESHOLD_TOKENS 以下で PROMPT_TOKEN_BUDGET に収まる)かどうか。"""
+        if estimate_tokens(text) > self.map_reduce_threshold_tokens:
+            return False
+        return self.token_budget is None or self.compactor.count_tokens(text) <= self.token_budget
+
+    def split(self, text, max_tokens=None):
+        """文字起こしを SECTION_TOKENS 以下のセクションに分ける。"""
+        sections = split_sections(text, max_tokens or self.section_tokens)
+        return [part for section in sections for part in self.fit_section(section)]
+
+    def fit_section(self, section):
+        """
+        PROMPT_TOKEN_BUDGET を超えるセクションを、さらに細かく分ける。
+
+        SECTION_TOKENS は見積もりのトークン数なので、モデルのトークン数では上限を超える場合がある。
+        文を取り除かずに収めるため、見積もりとの比で上限を下げて分け直す。
+        """
+        if self.token_budget is None:
+            return [section]
+        tokens = self.compactor.count_tokens(section)
+        estimated = estimate_tokens(section)
+        if tokens <= self.token_budget or estimated <= 1:
+            return [section]
+        # 必ず前より小さくする
+        max_tokens = min(estimated * self.token_budget // tokens, estimated - 1)
+        return self.split(section, max(1, max_tokens))
+
+    async def fit_prompt(self, text):
+        """
+        プロンプトに入れる文字起こしを PROMPT_TOKEN_BUDGET に収める。
+
+        Returns:
+            tuple[str, dict]: 収めた文字起こしと、取り除いた文の数(summary_generation スパンの属性)。
+        """
+        if self.token_budget is None:
+            return text, {}
+        fitted, dropped = await asyncio.to_thread(self.compactor.fit_budget, text)
+        return fitted, {"over_budget": dropped} if dropped else {}
+
+    async def asummarize_section(self, index, section):
+        """セクションの要点メモを作成する。index は1から始まる通し番号。"""
+        section, attributes = await self.fit_prompt(section)
+        return await self.agenerate(
+            self.section_system_prompt,
+            self.section_user_prompt.format(index=index, user_input=section),
+            kind="section",
+            section=index,
+            **attributes,
+        )
+
+    async def asummarize_sections(self, sections, on_progress=None, label="", semaphore=None):
+        """
+        各セクションを最大 SUMMARY_MAX_CONCURRENCY 件ずつ並行して要約し、元の順番で要点メモを返す。
+
+        on_progress を指定すると、セクションが終わるたびに進捗(ProgressEvent)を送る。
+        semaphore を渡すと、SUMMARY_MAX_CONCURRENCY の代わりにそのセマフォをリクエストごとに取って同時実行数を制限する
+        (文字起こしなど、他のリクエストと同時実行数の枠を共有する場合)。
+        """
+        semaphore = semaphore or asyncio.Semaphore(self.summary_max_concurrency)
+        tracker = ProgressTracker(label, "summary", on_progress, total=len(sections))
+
+        async def summarize(index, section):
+            async with semaphore:
+                note = await self.asummarize_section(index, section)
+            tracker.advance()
+            return note
+
+        return await asyncio.gather(*(summarize(index, section) for index, section in enumerate(sections, 1)))
+
+    async def areduce(self, notes, on_delta=None, on_progress=None, label="", semaphore=None):
+        """
+        セクションごとの要点メモを議事録の形式にまとめる。
+
+        要点メモを合わせてもまだ長い場合は、要点メモをさらに要約してからまとめる。
+        semaphore は asummarize_sections と同じく、リクエストごとに取る同時実行数の枠。
+        """
+        notes = "\n\n".join(notes)
+        while not self.fits_single_prompt(notes):
+            previous_tokens = estimate_tokens(notes)
+            sections = await asyncio.to_thread(self.split, notes)
+            notes = "\n\n".join(await self.asummarize_sections(sections, on_progress, label, semaphore))
+            # それ以上短くならない場合は打ち切る
+            if estimate_tokens(notes) >= previous_tokens:
+                break
+        notes, attributes = await self.fit_prompt(notes)
+        async with semaphore or contextlib.nullcontext():
+            return await self.agenerate(
+                self.system_prompt,
+                self.reduce_user_prompt.format(user_input=notes),
+                on_delta,
+                kind="reduce",
+                **attributes,
+            )
+
+    def cache_key(self, transcription_texts):
+        """議事録の内容に影響するすべての入力から、キャッシュのキーを作る。"""
+        return ResultCache.make_key(
+            transcription_texts,
+            self.model_name,
+            self.system_prompt,
+            self.user_prompt,
+            self.section_system_prompt,
+            self.section_user_prompt,
+            self.reduce_user_prompt,
+            self.map_reduce_threshold_tokens,
+            self.section_tokens,
+            self.compactor.settings() if self.compactor is not None else None,
         )
-        end = time.perf_counter()
-        print(f'テキスト生成にかかった時間: {((end-start)/60):.2f}分')
-        return summary.output[0].content[0].text
+
+    def compact(self, transcription_texts):
+        """文字起こしを圧縮し、減らしたトークン数を compaction スパンに記録する。"""
+        if self.compactor is None:
+            return transcription_texts
+        with span("compaction", model=self.model_name) as compaction_span:
+            compacted, report = self.compactor.compact(transcription_texts)
+            compaction_span.set(**asdict(report), saved_tokens=report.saved_tokens)
+        return compacted
+
+    async def asummarize_text(
+        self,
+        transcription_texts,
+        on_delta=None,
+        use_cache=True,
+        on_progress=None,
+        label="",
+        semaphore=None,
+    ):
+        """
+        文字起こしの長さに応じて、1回で要約するか分割して要約するかを選ぶ。
+
+        同じ入力の議事録がキャッシュにあれば、APIは呼ばずにそれを返す。
+        要約する前に、COMPACTION_ENABLED であれば文字起こしを圧縮する(modules.compaction)。
+        use_cache=False の場合はキャッシュを使わずに作り直す(結果はキャッシュに保存する)。
+        on_progress を指定すると、分割して要約する場合にセクションごとの進捗を送る。
+        label は進捗に付ける名前(録音のファイル名など)。
+        semaphore を渡すと、APIリクエストごとにそのセマフォを取る(asummarize_sections を参照)。
+        """
+        with span("minutes", cached=False) as minutes_span:
+            key = self.cache_key(transcription_texts)
+            if use_cache:
+                cached = await asyncio.to_thread(self.cache.get, key)
+                if cached is not None:
+                    minutes_span.set(cached=True)
+                    if on_delta is not None:
+                        on_delta(cached)
+                    return cached
+
+            transcription_texts = await asyncio.to_thread(self.compact, transcription_texts)
+            tokens = estimate_tokens(transcription_texts)
+            minutes_span.set(estimated_input_tokens=tokens)
+            # 1回のプロンプトに収まらない文字起こしは分割して並列に要約する
+            if not await asyncio.to_thread(self.fits_single_prompt, transcription_texts):
+                minutes_span.set(mode="map_reduce")
+                sections = await asyncio.to_thread(self.split, transcription_texts)
+                notes = await self.asummarize_sections(sections, on_progress, label, semaphore)
+                summary = await self.areduce(notes, on_delta, on_progress, label, semaphore)
+            else:
+                minutes_span.set(mode="single")
+                async with semaphore or contextlib.nullcontext():
+                    summary = await self.agenerate(
+                        self.system_prompt,
+                        self.user_prompt.format(user_input=transcription_texts),
+                        on_delta,
+                        kind="minutes",
+                    )
+            await asyncio.to_thread(self.cache.set, key, summary)
+            return summary
+
+    async def asummary(self, on_delta=None, use_cache=True, on_progress=None):
+        """
+        文字起こしから議事録を作成する。
+
+        Args:
+            on_delta (Callable[[str], None]): 指定するとストリーミングで生成し、届いた差分ごとに呼ばれる。
+            use_cache (bool): False にするとキャッシュを使わずに作り直す。
+            on_progress (Callable[[ProgressEvent], None]): 指定すると分割して要約する場合の進捗を送る。
+
+        Returns:
+            str: 議事録。
+        """
+        text_path = os.path.join(self.output_path, 'output.txt')
+
+        def read():
+            with open(text_path, 'r') as texts:
+                return texts.read()
+
+        transcription_texts = await asyncio.to_thread(read)
+        summary = await self.asummarize_text(transcription_texts, on_delta, use_cache, on_progress, label="output.txt")
+        await asyncio.to_thread(self.cache.save_stats)
+        return summary
+
+    # 以下は同期版。イベントループの外から呼ぶためのもので、中身は非同期版を asyncio.run で実行する
+
+    def summarize_text(self, transcription_texts, on_delta=None, use_cache=True):
+        """asummarize_text の同期版。"""
+        return self.runtime.run(self.asummarize_text(transcription_texts, on_delta, use_cache))
+
+    def summary(self, on_delta=None, use_cache=True):
+        """asummary の同期版。"""
+        return self.runtime.run(self.asummary(on_delta, use_cache))
+
 
 if __name__ == "__main__":
 
     try:
         summary = SummaryMinutes()
-        text = summary.summary()
-        print("Summarised Text:", text)
+        print("Summarised Text:")
+        summary.summary(on_delta=lambda delta: print(delta, end="", flush=True))
+        print()
     except Exception as e:
         print("Error:", e)
@@ -0,0 +1,121 @@
+import contextlib
+import json
+import logging
+import os
+import threading
+import time
+
+# スパンはこのロガーにJSON Linesで出力する
+logger = logging.getLogger("minutes_agent.spans")
+
+
+class Span():
+    """計測中のスパン。処理の途中で分かった属性(トークン数など)は set で追加する。"""
+
+    def __init__(self, name, attributes):
+        self.name = name
+        self.attributes = attributes
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+
+
+class Telemetry():
+    """
+    処理の段階(スパン)ごとの所要時間を記録する。
+
+    スパンは1件ずつJSON Linesで出力し、段階ごとの回数・合計・最大の所要時間を
+    Prometheusのテキスト形式で書き出せるように集計しておく。
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stages = {}
+
+    @contextlib.contextmanager
+    def span(self, name, **attributes):
+        """with ブロックの所要時間を name のスパンとして記録する。"""
+        span = Span(name, attributes)
+        status = "ok"
+        start = time.perf_counter()
+        try:
+            yield span
+        except BaseException as e:
+            status = "error"
+            span.set(error=type(e).__name__)
+            raise
+        finally:
+            self.record(name, time.perf_counter() - start, status, **span.attributes)
+
+    def record(self, name, seconds, status="ok", **attributes):
+        """計測済みの所要時間をスパンとして記録する。"""
+        logger.info(json.dumps(
+            {
+                "ts": time.time(),
+                "span": name,
+                "duration_ms": round(seconds * 1000, 3),
+                "status": status,
+                "thread": threading.current_thread().name,
+                **attributes,
+            },
+            ensure_ascii=False,
+            default=str,
+        ))
+        with self._lock:
+            stage = self._stages.setdefault(name, {"count": 0, "errors": 0, "sum": 0.0, "max": 0.0})
+            stage["count"] += 1
+            stage["errors"] += status != "ok"
+            stage["sum"] += seconds
+            stage["max"] = max(stage["max"], seconds)
+
+    def prometheus(self):
+        """段階ごとの集計をPrometheusのテキスト形式で返す。"""
+        metrics = [
+            ("minutes_agent_stage_seconds_count", "counter", "Number of spans per stage.", "count"),
+            ("minutes_agent_stage_errors_total", "counter", "Number of failed spans per stage.", "errors"),
+            ("minutes_agent_stage_seconds_sum", "counter", "Total seconds spent per stage.", "sum"),
+            ("minutes_agent_stage_seconds_max", "gauge", "Longest single span per stage.", "max"),
+        ]
+        with self._lock:
+            stages = {name: dict(stage) for name, stage in self._stages.items()}
+        lines = []
+        for metric, kind, description, key in metrics:
+            lines.append(f"# HELP {metric} {description}")
+            lines.append(f"# TYPE {metric} {kind}")
+            for name in sorted(stages):
+                lines.append(f'{metric}{{stage="{name}"}} {stages[name][key]:.6g}')
+        return "\n".join(lines) + "\n"
+
+    def write_prometheus(self, path):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with open(path, "w") as f:
+            f.write(self.prometheus())
+
+
+telemetry = Telemetry()
+
+
+def span(name, **attributes):
+    """プロセス共通の Telemetry でスパンを記録する。"""
+    return telemetry.span(name, **attributes)
+
+
+def record(name, seconds, status="ok", **attributes):
+    """計測済みの所要時間を、プロセス共通の Telemetry にスパンとして記録する。"""
+    telemetry.record(name, seconds, status, **attributes)
+
+
+def write_prometheus(path):
+    """プロセス共通の Telemetry の集計をPrometheusのテキスト形式で書き出す。"""
+    telemetry.write_prometheus(path)
+
+
+def configure(path):
+    """スパンをJSON Linesで path に追記するよう設定する。"""
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    handler = logging.FileHandler(path, encoding="utf-8")
+    handler.setFormatter(logging.Formatter("%(message)s"))
+    logger.addHandler(handler)
+    logger.setLevel(logging.INFO)
+    # app.log にはスパンを出さない
+    logger.propagate = False
@@ -0,0 +1,179 @@
+import asyncio
+import ctypes
+import ctypes.util
+import os
+import struct
+import sys
+import time
+
+# inotify のイベント(linux/inotify.h)
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_Q_OVERFLOW = 0x00004000
+WATCH_MASK = IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE
+EVENT_HEADER = struct.Struct("iIII")
+
+
+class Inotify():
+    """
+    Linux の inotify でディレクトリの変更を受け取る(ctypes で libc を呼ぶので追加のライブラリは不要)。
+
+    inotify が使えない環境では OSError を送出する。
+    """
+
+    def __init__(self, directories):
+        if not sys.platform.startswith("linux"):
+            raise OSError("inotify is only available on Linux")
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        self.fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self.directories = {}
+        for directory in directories:
+            wd = libc.inotify_add_watch(self.fd, os.fsencode(directory), WATCH_MASK)
+            if wd < 0:
+                errno = ctypes.get_errno()
+                os.close(self.fd)
+                raise OSError(errno, f"inotify_add_watch failed: {directory}")
+            self.directories[wd] = directory
+
+    def read(self):
+        """
+        届いているイベントを読む。
+
+        Returns:
+            tuple[list[str], bool]: 変更されたファイルのパスと、イベントが溢れた(全体を調べ直す必要がある)かどうか。
+        """
+        paths, overflow = [], False
+        while True:
+            try:
+                data = os.read(self.fd, 64 * 1024)
+            except BlockingIOError:
+                return paths, overflow
+            offset = 0
+            while offset < len(data):
+                wd, mask, _, length = EVENT_HEADER.unpack_from(data, offset)
+                offset += EVENT_HEADER.size
+                name = data[offset:offset + length].rstrip(b"\0")
+                offset += length
+                if mask & IN_Q_OVERFLOW:
+                    overflow = True
+                elif name and wd in self.directories:
+                    paths.append(os.path.join(self.directories[wd], os.fsdecode(name)))
+
+    def close(self):
+        os.close(self.fd)
+
+
+class DirectoryWatcher():
+    """
+    ディレクトリに置かれたファイルを監視し、書き込みが終わったものを返す。
+
+    Linux では inotify で変更を受け取り、それ以外の環境(または inotify が使えない場合)は
+    poll_seconds ごとにディレクトリを調べる。どちらの場合も、サイズと更新時刻が settle_seconds の間
+    変わらなくなったファイルを書き込み完了とみなす(コピー・同期中のファイルを途中で読まないため)。
+    起動時にディレクトリにあるファイルも対象にする。サブディレクトリは監視しない。
+    """
+
+    def __init__(self, directories, include=None, settle_seconds=10.0, poll_seconds=5.0, use_inotify=True):
+        self.directories = [os.path.abspath(directory) for directory in directories]
+        self.include = include or (lambda path: True)
+        self.settle_seconds = settle_seconds
+        self.poll_seconds = poll_seconds
+        self.use_inotify = use_inotify
+        # 書き込み完了を待っているファイルの (サイズ, 更新時刻, 最後に変わった時刻)
+        self.pending = {}
+        # ポーリングで前回見たファイルの (サイズ, 更新時刻)
+        self.seen = {}
+        self.backend = None
+
+    def touch(self, path):
+        """変更があったファイルを、書き込み完了を待つ対象にする。"""
+        if not self.include(path):
+            return
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            self.pending.pop(path, None)
+            return
+        self.pending[path] = (stat.st_size, stat.st_mtime_ns, time.monotonic())
+
+    def scan(self):
+        """ディレクトリを調べ、前回から変わったファイルを書き込み完了を待つ対象にする。"""
+        seen = {}
+        for directory in self.directories:
+            with os.scandir(directory) as entries:
+                for entry in entries:
+                    if not entry.is_file():
+                        continue
+                    stat = entry.stat()
+                    seen[entry.path] = (stat.st_size, stat.st_mtime_ns)
+                    if self.seen.get(entry.path) != seen[entry.path]:
+                        self.touch(entry.path)
+        self.seen = seen
+
+    def settled(self):
+        """書き込みが終わったファイルを返し、待つ対象から外す。"""
+        now = time.monotonic()
+        settled = []
+        for path, (size, mtime_ns, since) in list(self.pending.items()):
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                del self.pending[path]
+                continue
+            if (stat.st_size, stat.st_mtime_ns) != (size, mtime_ns):
+                self.pending[path] = (stat.st_size, stat.st_mtime_ns, now)
+            elif now - since >= self.settle_seconds:
+                del self.pending[path]
+                settled.append(path)
+        return sorted(settled)
+
+    def start(self):
+        """監視を始める。使う方式("inotify" / "polling")を返す。"""
+        if self.use_inotify:
+            try:
+                self.backend = Inotify(self.directories)
+            except OSError:
+                self.backend = None
+        if self.backend is not None:
+            def on_readable():
+                paths, overflow = self.backend.read()
+                for path in paths:
+                    self.touch(path)
+                if overflow:
+                    self.scan()
+
+            asyncio.get_running_loop().add_reader(self.backend.fd, on_readable)
+        self.scan()
+        return "inotify" if self.backend is not None else "polling"
+
+    def stop(self):
+        if self.backend is not None:
+            asyncio.get_running_loop().remove_reader(self.backend.fd)
+            self.backend.close()
+            self.backend = None
+
+    async def watch(self):
+        """
+        書き込みが終わったファイルのパスを返し続ける非同期ジェネレータ。
+
+        Yields:
+            str: ファイルのパス。同じファイルも、書き換えられれば再び返す。
+        """
+        self.start()
+        # 書き込み完了の判定は、待ち時間より十分短い間隔で行う
+        tick = max(min(self.settle_seconds / 4, 1.0), 0.05)
+        last_scan = time.monotonic()
+        try:
+            while True:
+                await asyncio.sleep(tick)
+                if self.backend is None and time.monotonic() - last_scan >= self.poll_seconds:
+                    self.scan()
+                    last_scan = time.monotonic()
+                for path in self.settled():
+                    yield path
+        finally:
+            self.stop()
@@ -0,0 +1,29 @@
+import numpy as np
+
+from modules.analytics import lttb
+
+
+def test_lttb_returns_short_series_unchanged():
+    """Series no longer than the threshold are returned as they are."""
+    x, y = np.arange(5), np.arange(5)
+    assert lttb(x, y, 10) == (x, y)
+
+
+def test_lttb_keeps_endpoints_and_peaks():
+    """The first and last points and a lone peak survive downsampling."""
+    x = np.arange(1000)
+    y = np.zeros(1000)
+    y[437] = 100
+    sampled_x, sampled_y = lttb(x, y, 50)
+    assert len(sampled_x) == len(sampled_y) == 50
+    assert sampled_x[0] == 0 and sampled_x[-1] == 999
+    assert 437 in sampled_x
+    assert np.all(np.diff(sampled_x) > 0)
+
+
+def test_lttb_keeps_the_shape_of_a_smooth_series():
+    """A downsampled sine wave stays within 1% of the original."""
+    x = np.linspace(0, 2 * np.pi, 10_000)
+    y = np.sin(x)
+    sampled_x, sampled_y = lttb(x, y, 200)
+    assert np.max(np.abs(np.interp(x, sampled_x, sampled_y) - y)) < 0.01
@@ -0,0 +1,89 @@
+import pytest
+
+from modules.archive import MeetingArchive
+
+
+@pytest.fixture
+def archive(tmp_path):
+    """Return an archive holding one meeting with three segments and minutes."""
+    archive = MeetingArchive(str(tmp_path / "archive.sqlite"))
+    voice_path = tmp_path / "voice.wav"
+    voice_path.write_bytes(b"audio")
+    archive.add_meeting(
+        str(voice_path),
+        [(0, 1000, "来期の予算について議論した"), (1000, 2000, "次回は予算案を確認する"), (2000, 3000, "以上です")],
+        minutes="# 議事録\n予算は承認された",
+    )
+    return archive
+
+
+def test_trigram_search(archive):
+    """Terms of three or more characters are found through the trigram index."""
+    results = archive.search("予算案")
+    assert [(row["kind"], row["start_ms"]) for row in results] == [("transcript", 1000)]
+    assert "[予算案]" in results[0]["snippet"]
+
+
+def test_two_character_terms_use_the_bigram_index(archive):
+    """Two-character terms are found through the bigram index."""
+    results = archive.search("予算")
+    assert {(row["kind"], row["start_ms"]) for row in results} == {
+        ("transcript", 0),
+        ("transcript", 1000),
+        ("minutes", None),
+    }
+    assert all("[予算]" in row["snippet"] for row in results)
+    assert archive.search("予算 次回")[0]["start_ms"] == 1000
+
+
+def test_single_character_terms_fall_back_to_like(archive):
+    """Single characters are searched with LIKE."""
+    results = archive.search("以")
+    assert [(row["kind"], row["start_ms"]) for row in results] == [("transcript", 2000)]
+    assert results[0]["snippet"] == "[以]上です"
+    # LIKE の特殊文字は文字として探す
+    assert archive.search("%") == []
+
+
+def test_search_results_follow_minutes_updates(archive, tmp_path):
+    """Updating the minutes updates their search index."""
+    archive.set_minutes(str(tmp_path / "voice.wav"), "決算の報告")
+    assert [row["kind"] for row in archive.search("決算")] == ["minutes"]
+    assert [row["kind"] for row in archive.search("予算")] == ["transcript", "transcript"]
+
+
+def test_replacing_a_meeting_removes_old_segments(archive, tmp_path):
+    """Archiving a recording again replaces its segments."""
+    archive.add_meeting(str(tmp_path / "voice.wav"), [(0, 1000, "新しい文字起こし")])
+    assert archive.search("予算") == []
+    assert len(archive.meetings()) == 1
+
+
+def test_meeting_segments(archive):
+    """Segments of a meeting can be counted, paged, located and searched."""
+    meeting_id = archive.meetings()[0]["id"]
+    assert archive.segment_count(meeting_id) == 3
+    assert archive.segments(meeting_id, 1, 2) == [(1000, 2000, "次回は予算案を確認する")]
+    assert archive.segment_at(meeting_id, 1500) == 1
+    assert archive.search_segments(meeting_id, "予算") == [0, 1]
+
+
+def test_segments_at_returns_the_requested_positions(archive):
+    """Segments are looked up by position and returned in position order."""
+    meeting_id = archive.meetings()[0]["id"]
+    assert archive.segments_at(meeting_id, [2, 0]) == [
+        (0, 0, 1000, "来期の予算について議論した"),
+        (2, 2000, 3000, "以上です"),
+    ]
+    assert archive.segments_at(meeting_id, []) == []
+
+
+def test_archives_without_positions_are_numbered(archive):
+    """Opening an archive from before the position column numbers its segments in insertion order."""
+    with archive.connect() as connection:
+        connection.execute("DROP INDEX segments_position")
+        connection.execute("ALTER TABLE segments DROP COLUMN position")
+        connection.execute("PRAGMA user_version = 1")
+    migrated = MeetingArchive(archive.path)
+    meeting_id = migrated.meetings()[0]["id"]
+    assert migrated.segments(meeting_id, 1, 3) == [(1000, 2000, "次回は予算案を確認する"), (2000, 3000, "以上です")]
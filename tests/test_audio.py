@@ -0,0 +1,78 @@
+import itertools
+
+import numpy as np
+
+from modules.audio import FRAME_MS, WAV_HEADER_SIZE, EncodingProfile, detect_silences, plan_chunks
+
+
+def test_detect_silences_keeps_only_long_quiet_runs():
+    """Quiet runs shorter than min_silence_ms are not silences."""
+    energy_db = np.array([-10, -50, -50, -10, -50, -50, -50, -50, -10], dtype=np.float32)
+    silences = detect_silences(energy_db, -40, min_silence_ms=3 * FRAME_MS)
+    assert silences.tolist() == [[4 * FRAME_MS, 8 * FRAME_MS]]
+
+
+def test_detect_silences_at_edges():
+    """Silences at the start and end of the recording are found."""
+    energy_db = np.array([-50, -50, -10, -50, -50], dtype=np.float32)
+    silences = detect_silences(energy_db, -40, min_silence_ms=2 * FRAME_MS)
+    assert silences.tolist() == [[0, 2 * FRAME_MS], [3 * FRAME_MS, 5 * FRAME_MS]]
+
+
+def test_detect_silences_without_silence():
+    """A recording without quiet frames has no silences."""
+    silences = detect_silences(np.full(10, -10, dtype=np.float32), -40, min_silence_ms=FRAME_MS)
+    assert silences.shape == (0, 2)
+
+
+def test_plan_chunks_without_silence_splits_at_the_limit():
+    """Without silences the recording is cut every max_chunk_ms."""
+    assert plan_chunks(25_000, 10_000, [], 2_000, 200) == [(0, 10_000), (10_000, 20_000), (20_000, 25_000)]
+
+
+def test_plan_chunks_cuts_at_the_middle_of_short_silences():
+    """Short silences are cut at their middle."""
+    chunks = plan_chunks(20_000, 10_000, [(7_000, 7_400)], 2_000, 200)
+    assert chunks == [(0, 7_200), (7_200, 20_000 - 10_000 + 7_200), (17_200, 20_000)]
+
+
+def test_plan_chunks_drops_long_silences_but_keeps_margins():
+    """Long silences are dropped except for a margin on each side."""
+    chunks = plan_chunks(30_000, 60_000, [(10_000, 20_000)], 2_000, 300)
+    assert chunks == [(0, 10_300), (19_700, 30_000)]
+
+
+def test_plan_chunks_drops_leading_and_trailing_silence():
+    """Silence at either end of the recording is not uploaded."""
+    chunks = plan_chunks(30_000, 60_000, [(0, 5_000), (25_000, 30_000)], 2_000, 300)
+    assert chunks == [(4_700, 25_300)]
+
+
+def test_plan_chunks_respects_max_chunk_ms():
+    """Chunks never exceed max_chunk_ms and cover the recording without gaps."""
+    silences = [(start, start + 300) for start in range(1_000, 100_000, 3_700)]
+    chunks = plan_chunks(100_000, 10_000, silences, 2_000, 200)
+    assert all(end - start <= 10_000 for start, end in chunks)
+    # 区切りの間に隙間も重なりもない
+    assert all(prev_end == start for (_, prev_end), (start, _) in itertools.pairwise(chunks))
+    assert chunks[0][0] == 0 and chunks[-1][1] == 100_000
+
+
+def test_max_chunk_ms_wav_fits_exactly():
+    """A WAV chunk of max_chunk_ms fills the size limit to within one millisecond."""
+    profile = EncodingProfile(format="wav", channels=1, frame_rate=16000, bitrate=None)
+    max_size = 1_000_000
+    ms = profile.max_chunk_ms(max_size)
+    bytes_per_ms = 16000 * 2 // 1000
+    assert WAV_HEADER_SIZE + ms * bytes_per_ms <= max_size
+    assert WAV_HEADER_SIZE + (ms + 1) * bytes_per_ms + 2 > max_size
+
+
+def test_max_chunk_ms_compressed_leaves_margin():
+    """Compressed chunks keep a margin for bitrate overshoot."""
+    profile = EncodingProfile(format="mp3", bitrate="32k")
+    max_size = 25 * 1024 * 1024
+    ms = profile.max_chunk_ms(max_size)
+    assert ms * 32_000 / 8 / 1000 <= max_size * 0.95
+    # 32kbpsなら25MBで1時間半以上入る
+    assert ms > 90 * 60 * 1000
@@ -0,0 +1,53 @@
+import json
+import urllib.error
+import urllib.request
+import wave
+
+import openai
+
+from benchmarks.fake_openai import FakeOpenAIServer
+from benchmarks.synthetic import make_speech_like_wav
+
+
+def post(url, data):
+    """POST data to url and return the status code and JSON body."""
+    request = urllib.request.Request(url, data=data, headers={"Content-Type": "application/json"})
+    try:
+        with urllib.request.urlopen(request, timeout=5) as response:
+            return response.status, json.load(response)
+    except urllib.error.HTTPError as e:
+        return e.code, json.load(e)
+
+
+def test_fake_server_transcribes_and_counts_uploads():
+    """The stand-in transcribes with the OpenAI client and records requests and bytes."""
+    audio = b"\0" * 200_000
+    with FakeOpenAIServer(latency=0, latency_per_mb=0) as server:
+        client = openai.OpenAI(base_url=server.base_url, api_key="test", max_retries=0)
+        response = client.audio.transcriptions.create(
+            model="whisper-1", file=("chunk.mp3", audio), response_format="verbose_json"
+        )
+        assert response.text
+        assert response.segments[0].start == 0.0
+        assert server.stats["transcription_requests"] == 1
+        assert server.stats["uploaded_bytes"] > len(audio)
+
+
+def test_fake_server_rejects_large_payloads_and_rate_limits():
+    """Requests over payload_limit get 413 and rate limited requests get 429."""
+    with FakeOpenAIServer(latency=0, payload_limit=100) as server:
+        status, body = post(f"{server.base_url}/audio/transcriptions", b"x" * 101)
+        assert status == 413
+        assert "payload too large" in body["error"]["message"]
+    with FakeOpenAIServer(latency=0, rate_limit_prob=1.0) as server:
+        assert post(f"{server.base_url}/responses", b"{}")[0] == 429
+        assert server.stats["rate_limited"] == 1
+
+
+def test_synthetic_wav_has_the_requested_length(tmp_path):
+    """The synthetic recording is a 16-bit WAV of the requested length and channels."""
+    path = tmp_path / "speech.wav"
+    make_speech_like_wav(str(path), minutes=0.1, frame_rate=16000, channels=2)
+    with wave.open(str(path), "rb") as f:
+        assert (f.getnchannels(), f.getsampwidth(), f.getframerate()) == (2, 2, 16000)
+        assert f.getnframes() == 6 * 16000
@@ -0,0 +1,57 @@
+import os
+import time
+
+from modules.cache import ResultCache
+
+
+def test_get_and_set(tmp_path):
+    """A stored value is returned and hits and misses are counted."""
+    cache = ResultCache(str(tmp_path), max_bytes=1_000)
+    key = ResultCache.make_key("a", b"b")
+    assert cache.get(key) is None
+    cache.set(key, "値")
+    assert cache.get(key) == "値"
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+def test_make_key_is_not_ambiguous():
+    """Keys of different parts differ even when the parts concatenate to the same string."""
+    assert ResultCache.make_key("ab", "c") != ResultCache.make_key("a", "bc")
+
+
+def test_expired_entries_are_removed(tmp_path):
+    """Entries older than the TTL are missed and deleted."""
+    cache = ResultCache(str(tmp_path), max_bytes=1_000, ttl_seconds=60)
+    cache.set("k1", "old")
+    path = os.path.join(str(tmp_path), "k1"[:2], "k1")
+    created = time.time() - 120
+    os.utime(path, (created, created))
+    assert cache.get("k1") is None
+    assert not os.path.exists(path)
+    assert cache.stats["size_bytes"] == 0
+
+
+def test_evicts_least_recently_used(tmp_path):
+    """Going over max_bytes evicts the entry used least recently."""
+    cache = ResultCache(str(tmp_path), max_bytes=25)
+    for i, key in enumerate(("aa1", "bb2")):
+        cache.set(key, "x" * 10)
+        path = os.path.join(str(tmp_path), key[:2], key)
+        os.utime(path, (1_000 + i, 1_000 + i))
+    # aa1 を使うと、最後に使われたのが古いのは bb2 になる
+    assert cache.get("aa1") is not None
+    cache.set("cc3", "x" * 10)
+    assert cache.get("bb2") is None
+    assert cache.get("aa1") is not None
+    assert cache.get("cc3") is not None
+    assert cache.stats["size_bytes"] <= 25
+
+
+def test_stats_are_accumulated_across_instances(tmp_path):
+    """Saved hit and miss counts carry over to the next instance."""
+    cache = ResultCache(str(tmp_path), max_bytes=1_000)
+    cache.get("missing")
+    cache.save_stats()
+    other = ResultCache(str(tmp_path), max_bytes=1_000)
+    other.get("missing")
+    assert other.stats["total_misses"] == 2
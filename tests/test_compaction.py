@@ -0,0 +1,40 @@
+from modules.compaction import TranscriptCompactor
+
+TEXT = "はい。来期の予算は三百万円で承認されました。ええ。\n次回は十月に開催します。そうですね。"
+
+
+def compactor(token_budget=None):
+    """Return a compactor for gpt-4o-mini."""
+    return TranscriptCompactor("gpt-4o-mini", token_budget=token_budget)
+
+
+def test_fit_budget_keeps_text_within_budget():
+    """Text that already fits is returned unchanged."""
+    assert compactor().fit_budget(TEXT) == (TEXT, 0)
+    assert compactor(10_000).fit_budget(TEXT) == (TEXT, 0)
+
+
+def test_fit_budget_drops_short_sentences_first():
+    """The shortest sentences are dropped first until the text fits."""
+    c = compactor()
+    budget = c.count_tokens(TEXT) - c.count_tokens("はい。ええ。")
+    fitted, dropped = c.fit_budget(TEXT, budget)
+    assert dropped >= 2
+    assert c.count_tokens(fitted) <= budget
+    assert "来期の予算は三百万円で承認されました。" in fitted
+    assert "はい。" not in fitted
+
+
+def test_fit_budget_keeps_the_longest_sentence():
+    """The longest sentence is kept even when it alone exceeds the budget."""
+    fitted, dropped = compactor(1).fit_budget(TEXT)
+    assert fitted == "来期の予算は三百万円で承認されました。"
+    assert dropped == 4
+
+
+def test_fit_budget_splits_english_sentences():
+    """English sentences are split at periods."""
+    c = compactor()
+    text = "OK. The budget for next year was approved. Thanks."
+    fitted, _ = c.fit_budget(text, c.count_tokens("The budget for next year was approved."))
+    assert fitted.strip() == "The budget for next year was approved."
@@ -0,0 +1,54 @@
+from types import SimpleNamespace
+
+from modules.journal import TranscriptionJournal
+
+
+def chunk(index):
+    """Return a stand-in for the AudioChunk at index."""
+    return SimpleNamespace(index=index, start_ms=index * 1000, end_ms=(index + 1) * 1000)
+
+
+def test_resume_processes_only_unfinished_chunks(tmp_path):
+    """Reopening a job keeps finished chunks and lists the rest as failed."""
+    voice_path = tmp_path / "voice.wav"
+    voice_path.write_bytes(b"audio")
+    settings = {"max_chunk_ms": 1000}
+
+    journal = TranscriptionJournal(str(tmp_path), str(voice_path), settings)
+    for i in range(3):
+        journal.add(chunk(i))
+    journal.record(chunk(0), "done", text="一", segments=[(0, 1000, "一")])
+    journal.record(chunk(2), "failed", error="timeout")
+
+    resumed = TranscriptionJournal(str(tmp_path), str(voice_path), settings)
+    assert resumed.job_id == journal.job_id
+    assert not resumed.split_completed
+    assert resumed.done_indices() == {0}
+    assert resumed.text(0) == "一"
+    assert resumed.segments(0) == [(0, 1000, "一")]
+    assert resumed.text(2) is None
+    assert [entry["index"] for entry in resumed.failed()] == [1, 2]
+    # 記録済みのチャンクを追加し直しても状態は変わらない
+    resumed.add(chunk(0))
+    assert resumed.done_indices() == {0}
+
+
+def test_other_settings_start_a_new_job(tmp_path):
+    """Different split settings get a separate job."""
+    voice_path = tmp_path / "voice.wav"
+    voice_path.write_bytes(b"audio")
+    journal = TranscriptionJournal(str(tmp_path), str(voice_path), {"max_chunk_ms": 1000})
+    journal.add(chunk(0))
+    other = TranscriptionJournal(str(tmp_path), str(voice_path), {"max_chunk_ms": 2000})
+    assert other.job_id != journal.job_id
+    assert other.chunks() == []
+
+
+def test_remove(tmp_path):
+    """Removing a job forgets its progress."""
+    voice_path = tmp_path / "voice.wav"
+    voice_path.write_bytes(b"audio")
+    journal = TranscriptionJournal(str(tmp_path), str(voice_path), {})
+    journal.mark_split_completed()
+    journal.remove()
+    assert TranscriptionJournal(str(tmp_path), str(voice_path), {}).split_completed is False
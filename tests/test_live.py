@@ -0,0 +1,38 @@
+import numpy as np
+
+from modules.audio import FRAME_MS
+from modules.live import find_cut
+
+
+def energy(duration_ms, silences=()):
+    """Return frame energies of a loud recording with quiet runs between the given times."""
+    energy_db = np.full(duration_ms // FRAME_MS, -10, dtype=np.float32)
+    for start_ms, end_ms in silences:
+        energy_db[start_ms // FRAME_MS : end_ms // FRAME_MS] = -50
+    return energy_db
+
+
+def cut(energy_db):
+    """Find the cut with a 10 second minimum and 30 second maximum window."""
+    return find_cut(energy_db, -40, min_silence_ms=500, min_window_ms=10_000, max_window_ms=30_000)
+
+
+def test_waits_for_the_minimum_window():
+    """Nothing is cut before min_window_ms, even at a pause."""
+    assert cut(energy(8_000, [(5_000, 6_000)])) is None
+
+
+def test_cuts_at_the_first_pause_after_the_minimum_window():
+    """The window closes at the middle of the first pause past min_window_ms."""
+    assert cut(energy(25_000, [(5_000, 6_000), (12_000, 13_000), (20_000, 21_000)])) == 12_500
+
+
+def test_waits_for_a_pause_until_the_maximum_window():
+    """Without a pause the window stays open until max_window_ms."""
+    assert cut(energy(20_000)) is None
+    assert cut(energy(30_000)) == 30_000
+
+
+def test_never_exceeds_the_maximum_window():
+    """A pause past max_window_ms is not used; the window is cut at max_window_ms."""
+    assert cut(energy(31_000, [(30_200, 31_000)])) == 30_000
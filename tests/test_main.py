@@ -0,0 +1,55 @@
+import importlib
+import os
+import shutil
+
+import pytest
+
+# main.py はエージェントのSDKを読み込む
+pytest.importorskip("agents", exc_type=ImportError)
+
+CONFIG_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src", "config.yaml")
+
+
+@pytest.fixture(scope="module")
+def main(tmp_path_factory):
+    """Import main.py with the sample config and without its log files."""
+    directory = tmp_path_factory.mktemp("main")
+    (directory / "config").mkdir()
+    shutil.copy(CONFIG_PATH, directory / "config" / "config.yaml")
+    with pytest.MonkeyPatch.context() as monkeypatch:
+        # main.py は起動したディレクトリの config/config.yaml を読む
+        monkeypatch.chdir(directory)
+        monkeypatch.setattr("logging.basicConfig", lambda **kwargs: None)
+        monkeypatch.setattr("modules.telemetry.configure", lambda path: None)
+        yield importlib.import_module("main")
+
+
+def conversation(output):
+    """Return two turns that each called a tool returning output."""
+    return [
+        {"role": "user", "content": "議事録を作って"},
+        {"type": "function_call", "name": "summary", "arguments": "{}"},
+        {"type": "function_call_output", "output": output},
+        {"role": "assistant", "content": "作成しました"},
+        {"role": "user", "content": "次回の予定は?"},
+        {"type": "function_call_output", "output": output},
+    ]
+
+
+def test_trim_history_shortens_earlier_tool_outputs(main):
+    """Tool outputs before the last turn keep only their first characters and a note on where the rest is."""
+    items = conversation("議" * 100)
+    trimmed = main.trim_history(items, tool_output_chars=10, max_tokens=10_000)
+    assert len(trimmed) == len(items)
+    assert trimmed[2]["output"].startswith("議" * 10 + "\n")
+    assert "minutes.md" in trimmed[2]["output"]
+    assert trimmed[5] == items[5]
+    # 渡した履歴は書き換えない
+    assert items[2]["output"] == "議" * 100
+
+
+def test_trim_history_drops_the_oldest_turns(main):
+    """Turns are dropped from the oldest until the history fits max_tokens, keeping the last one."""
+    items = conversation("議" * 100)
+    assert main.trim_history(items, tool_output_chars=1_000, max_tokens=150) == items[4:]
+    assert main.trim_history(items, tool_output_chars=1_000, max_tokens=1) == items[4:]
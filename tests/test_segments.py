@@ -0,0 +1,47 @@
+import os
+
+from modules.segments import SegmentStore
+
+SEGMENTS = [(0, 900, "おはようございます"), (1000, None, "予算の話"), (2500, 4000, "次回")]
+
+
+def test_append_and_rows(tmp_path):
+    """Appended segments are read back in order, whole or by range."""
+    store = SegmentStore(str(tmp_path))
+    store.append(SEGMENTS[:2])
+    store.append(SEGMENTS[2:])
+    assert len(store) == 3
+    assert store.rows() == SEGMENTS
+    assert store.rows(1, 2) == SEGMENTS[1:2]
+    assert not store.complete
+
+
+def test_torn_write_is_truncated(tmp_path):
+    """A row whose append was interrupted is ignored and then overwritten."""
+    store = SegmentStore(str(tmp_path))
+    store.append(SEGMENTS[:2])
+    # text_end を書く前に終了した追記を再現する
+    with open(os.path.join(str(tmp_path), "text.bin"), "ab") as f:
+        f.write("次回".encode("utf-8"))
+    for name in ("start_ms", "end_ms"):
+        with open(os.path.join(str(tmp_path), f"{name}.i8"), "ab") as f:
+            f.write((2500).to_bytes(8, "little"))
+
+    # 読むだけの場合は揃っている行だけを見る
+    assert len(SegmentStore(str(tmp_path), readonly=True)) == 2
+    recovered = SegmentStore(str(tmp_path))
+    assert recovered.rows() == SEGMENTS[:2]
+    recovered.append(SEGMENTS[2:])
+    assert recovered.rows() == SEGMENTS
+
+
+def test_replace_marks_complete(tmp_path):
+    """Replacing the segments marks the store complete until the next append."""
+    store = SegmentStore(str(tmp_path))
+    store.append(SEGMENTS)
+    store.replace(SEGMENTS[:1], voice_path="voice.wav")
+    assert store.rows() == SEGMENTS[:1]
+    assert store.complete
+    assert store.meta()["voice_path"] == "voice.wav"
+    store.append(SEGMENTS[1:2])
+    assert not store.complete
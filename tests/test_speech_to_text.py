@@ -0,0 +1,47 @@
+import os
+from types import SimpleNamespace
+
+from modules.speech_to_text import parse_transcription, recording_output_dir
+
+
+def chunk(start_ms, end_ms):
+    """Return a stand-in for an AudioChunk covering start_ms to end_ms."""
+    return SimpleNamespace(start_ms=start_ms, end_ms=end_ms)
+
+
+def segment(start, end, text):
+    """Return a verbose_json segment with times in seconds from the start of the chunk."""
+    return SimpleNamespace(start=start, end=end, text=text)
+
+
+def test_segments_are_shifted_to_the_recording():
+    """Segment times are offset by the start of the chunk and stripped of whitespace."""
+    response = SimpleNamespace(text="予算 次回", segments=[segment(0.0, 1.2, " 予算"), segment(1.2, 2.5, "次回 ")])
+    text, segments = parse_transcription(response, chunk(60_000, 63_000))
+    assert text == "予算 次回"
+    assert segments == [(60_000, 61_200, "予算"), (61_200, 62_500, "次回")]
+
+
+def test_segment_times_are_clamped_to_the_chunk():
+    """End times past the end of the chunk are cut back and empty segments are dropped."""
+    response = SimpleNamespace(text="以上", segments=[segment(0.5, 3.4, "以上"), segment(3.1, 3.4, " ")])
+    _, segments = parse_transcription(response, chunk(0, 3_000))
+    assert segments == [(500, 3_000, "以上")]
+
+
+def test_responses_without_segments_cover_the_whole_chunk():
+    """Plain text and json responses become one segment spanning the chunk."""
+    assert parse_transcription("おはようございます", chunk(1_000, 2_000)) == (
+        "おはようございます",
+        [(1_000, 2_000, "おはようございます")],
+    )
+    assert parse_transcription(SimpleNamespace(text=""), chunk(1_000, None)) == ("", [])
+
+
+def test_same_named_recordings_get_separate_output_directories(tmp_path):
+    """Recordings with the same name in different folders are written to different directories."""
+    first = recording_output_dir(str(tmp_path), "2025/04/seminar.m4a")
+    second = recording_output_dir(str(tmp_path), "2025/05/seminar.m4a")
+    assert first != second
+    assert os.path.basename(first).startswith("seminar_")
+    assert recording_output_dir(str(tmp_path), "2025/04/seminar.m4a") == first
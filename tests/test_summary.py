@@ -0,0 +1,56 @@
+from modules.summary import SummaryMinutes, estimate_tokens, split_sections
+
+LINES = ["来期の予算について議論した", "次回は予算案を確認する", "以上です"]
+
+
+def test_split_sections_keeps_lines_together():
+    """Whole lines are packed into sections that stay within max_tokens."""
+    text = "\n".join(LINES * 10)
+    sections = split_sections(text, 30)
+    assert len(sections) > 1
+    assert all(estimate_tokens(section) <= 30 for section in sections)
+    assert "\n".join(sections) == text
+
+
+def test_split_sections_cuts_long_lines_by_characters():
+    """A line longer than max_tokens on its own is cut every max_tokens characters."""
+    assert split_sections("あ" * 25 + "\n" + LINES[2], 10) == ["あ" * 10, "あ" * 10, "あ" * 5, LINES[2]]
+
+
+def test_split_sections_of_short_text():
+    """Text within max_tokens is a single section, and empty text has none."""
+    assert split_sections("\n".join(LINES), 1_000) == ["\n".join(LINES)]
+    assert split_sections("", 1_000) == []
+
+
+def summary_minutes(tmp_path, token_budget):
+    """Return a SummaryMinutes with placeholder prompts and the given PROMPT_TOKEN_BUDGET."""
+    config = {
+        "SUMMARIZE_MODEL_NAME": "gpt-4o-mini",
+        "OUTPUT_PATH": str(tmp_path),
+        "PROMPT_TOKEN_BUDGET": token_budget,
+        "system": {"prompt": ""},
+        "user": {"prompt": ""},
+        "section": {"system_prompt": "", "user_prompt": ""},
+        "reduce": {"user_prompt": ""},
+    }
+    return SummaryMinutes(config, runtime=object())
+
+
+def test_fit_section_without_a_budget(tmp_path):
+    """Sections are left as they are when no PROMPT_TOKEN_BUDGET is set."""
+    section = "\n".join(LINES * 10)
+    assert summary_minutes(tmp_path, None).fit_section(section) == [section]
+
+
+def test_fit_section_splits_sections_over_the_budget(tmp_path, monkeypatch):
+    """A section whose model token count exceeds the budget is split until every part fits."""
+    summary = summary_minutes(tmp_path, 40)
+    # モデルのトークン数が見積もりの2倍になる場合を再現する
+    monkeypatch.setattr(summary.compactor, "count_tokens", lambda text: estimate_tokens(text) * 2)
+    section = "\n".join(LINES)
+    assert estimate_tokens(section) <= summary.section_tokens
+    parts = summary.fit_section(section)
+    assert len(parts) > 1
+    assert all(summary.compactor.count_tokens(part) <= 40 for part in parts)
+    assert "\n".join(parts) == section
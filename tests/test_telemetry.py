@@ -0,0 +1,55 @@
+import json
+
+import pytest
+
+from modules import telemetry
+from modules.telemetry import Telemetry
+
+
+@pytest.fixture
+def spans_path(tmp_path, monkeypatch):
+    """Send spans to a JSON Lines file for the duration of the test."""
+    path = tmp_path / "log" / "spans.jsonl"
+    monkeypatch.setattr(telemetry.logger, "handlers", [])
+    monkeypatch.setattr(telemetry.logger, "propagate", True)
+    telemetry.configure(str(path))
+    yield path
+    for handler in telemetry.logger.handlers:
+        handler.close()
+
+
+def read_spans(path):
+    """Return the spans written to path."""
+    return [json.loads(line) for line in path.read_text(encoding="utf-8").splitlines()]
+
+
+def test_spans_are_written_as_json_lines(spans_path):
+    """Each span is one JSON line with its duration, status and attributes."""
+    with Telemetry().span("upload", chunk=1) as span:
+        span.set(bytes=1024, label="議事録")
+    spans = read_spans(spans_path)
+    assert len(spans) == 1
+    assert spans[0]["span"] == "upload"
+    assert spans[0]["status"] == "ok"
+    assert spans[0]["duration_ms"] >= 0
+    assert (spans[0]["chunk"], spans[0]["bytes"], spans[0]["label"]) == (1, 1024, "議事録")
+
+
+def test_failed_spans_record_the_error(spans_path):
+    """A span left by an exception is written with status error and the exception type."""
+    with pytest.raises(TimeoutError), Telemetry().span("api_latency"):
+        raise TimeoutError
+    spans = read_spans(spans_path)
+    assert (spans[0]["status"], spans[0]["error"]) == ("error", "TimeoutError")
+
+
+def test_prometheus_summary(spans_path):
+    """Spans are counted per stage in the Prometheus text format."""
+    stages = Telemetry()
+    stages.record("decode", 0.5)
+    stages.record("decode", 1.5, status="error")
+    text = stages.prometheus()
+    assert 'minutes_agent_stage_seconds_count{stage="decode"} 2' in text
+    assert 'minutes_agent_stage_errors_total{stage="decode"} 1' in text
+    assert 'minutes_agent_stage_seconds_sum{stage="decode"} 2' in text
+    assert 'minutes_agent_stage_seconds_max{stage="decode"} 1.5' in text
@@ -0,0 +1,73 @@
+import asyncio
+
+import pytest
+
+from modules.watcher import DirectoryWatcher
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """Replace time.monotonic with a clock the test advances by hand."""
+    now = [1_000.0]
+    monkeypatch.setattr("modules.watcher.time.monotonic", lambda: now[0])
+    return now
+
+
+def test_files_settle_after_settle_seconds(tmp_path, clock):
+    """A file is returned once its size and mtime stay unchanged for settle_seconds."""
+    path = tmp_path / "voice.wav"
+    path.write_bytes(b"a")
+    watcher = DirectoryWatcher([str(tmp_path)], settle_seconds=10)
+    watcher.scan()
+    assert watcher.settled() == []
+    clock[0] += 10
+    assert watcher.settled() == [str(path)]
+    # 返したファイルは、書き換えられるまで返さない
+    watcher.scan()
+    clock[0] += 10
+    assert watcher.settled() == []
+
+
+def test_growing_files_restart_the_wait(tmp_path, clock):
+    """A file still being copied is not returned until it stops changing."""
+    path = tmp_path / "voice.wav"
+    path.write_bytes(b"a")
+    watcher = DirectoryWatcher([str(tmp_path)], settle_seconds=10)
+    watcher.scan()
+    clock[0] += 9
+    path.write_bytes(b"ab")
+    assert watcher.settled() == []
+    clock[0] += 9
+    assert watcher.settled() == []
+    clock[0] += 1
+    assert watcher.settled() == [str(path)]
+
+
+def test_excluded_and_removed_files_are_skipped(tmp_path, clock):
+    """Files rejected by include and files deleted while waiting are never returned."""
+    (tmp_path / "notes.txt").write_text("メモ")
+    removed = tmp_path / "removed.wav"
+    removed.write_bytes(b"a")
+    watcher = DirectoryWatcher([str(tmp_path)], include=lambda path: path.endswith(".wav"), settle_seconds=10)
+    watcher.scan()
+    removed.unlink()
+    clock[0] += 10
+    assert watcher.settled() == []
+    assert watcher.pending == {}
+
+
+def test_watch_yields_new_files(tmp_path):
+    """Files written after the watcher starts are yielded once they settle."""
+    path = tmp_path / "voice.wav"
+
+    async def first_file():
+        files = DirectoryWatcher([str(tmp_path)], settle_seconds=0.1, poll_seconds=0.05).watch()
+        task = asyncio.ensure_future(anext(files))
+        await asyncio.sleep(0.1)
+        path.write_bytes(b"a")
+        try:
+            return await asyncio.wait_for(task, 5)
+        finally:
+            await files.aclose()
+
+    assert asyncio.run(first_file()) == str(path)